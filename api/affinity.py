@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at info level; forwarded frames would flood the log
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# A worker is considered alive while its heartbeat key is younger than WORKER_TTL
+WORKER_TTL = 10.0
+HEARTBEAT_INTERVAL = 3.0
+# A worker re-asserts its claim on a session at most this often
+CLAIM_REFRESH_INTERVAL = 5.0
+FORWARD_TIMEOUT = 10.0
+# Set on forwarded requests, so the owner handles them instead of forwarding again
+FORWARDED_HEADER = b"x-forwarded-worker"
+SESSION_HEADER = b"x-session-id"
+
+# Endpoints that read or update a session's tracker; everything else is served where it lands
+SESSION_PATHS = frozenset(
+    "/api/py/" + name for name in (
+        "analyze-frame", "detect-eye-direction", "detect-blink", "detect-ambient-light",
+        "check-distance", "calibrate-distance", "session-data",
+    )
+)
+
+# Headers of one connection, not passed on to the owner or back to the client
+HOP_HEADERS = frozenset((
+    b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"te", b"trailer",
+    b"proxy-authorization", b"proxy-authenticate", b"host", b"content-length", b"content-encoding",
+))
+
+
+class SessionOwnership:
+    """
+    Which worker holds each session's trackers (and their warm FaceMesh).
+    A worker claims a session in the shared state store when it first sees
+    it; other workers forward that session's requests to the owner's
+    address until the owner stops sending heartbeats or the session idles
+    out, after which the next worker to see the session takes it over.
+    """
+
+    def __init__(self, store, address, session_ttl):
+        self.store = store
+        self.address = address  # host:port other workers reach this one at
+        self.session_ttl = session_ttl
+        self._claimed = {}  # session id -> monotonic time of the last claim
+        self._client = None
+
+    @staticmethod
+    def _key(session_id):
+        return f"session-owner:{session_id}"
+
+    def heartbeat(self):
+        self.store.set(f"worker:{self.address}", str(time.time()), WORKER_TTL)
+
+    def is_alive(self, address):
+        return self.store.get(f"worker:{address}") is not None
+
+    def owner(self, session_id):
+        """Claim the session unless a live worker holds it; returns the owner's address."""
+        now = time.monotonic()
+        if now - self._claimed.get(session_id, -CLAIM_REFRESH_INTERVAL) < CLAIM_REFRESH_INTERVAL:
+            return self.address
+        owner = self.store.claim(self._key(session_id), self.address, self.session_ttl)
+        if owner != self.address and not self.is_alive(owner):
+            logger.info("Taking over session %s from unresponsive worker %s", session_id, owner)
+            owner = self.take(session_id)
+        if owner == self.address:
+            self._claimed[session_id] = now
+        return owner
+
+    def take(self, session_id):
+        """Claim the session regardless of its current owner (its frames now arrive here)."""
+        self.store.set(self._key(session_id), self.address, self.session_ttl)
+        self._claimed[session_id] = time.monotonic()
+        return self.address
+
+    def release(self, session_id):
+        """Give up an evicted session, unless another worker has taken it since."""
+        self._claimed.pop(session_id, None)
+        key = self._key(session_id)
+        if self.store.get(key) == self.address:
+            self.store.delete(key)
+
+    async def run_heartbeat(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.heartbeat)
+            except Exception as e:
+                logger.exception("Error sending worker heartbeat: %s", e)
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=FORWARD_TIMEOUT)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return body, message
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body, None
+
+
+def request_session_id(scope, body, default):
+    """Session id of a request: X-Session-Id header, userId query parameter or userId in a JSON body."""
+    for name, value in scope["headers"]:
+        if name == SESSION_HEADER:
+            return value.decode("latin-1")
+    user_id = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("userId")
+    if user_id and user_id[0]:
+        return user_id[0]
+    if body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and data.get("userId"):
+            return str(data["userId"])
+    return default
+
+
+class SessionAffinityMiddleware:
+    """
+    ASGI middleware that serves a session's requests on the worker owning
+    the session and forwards them there from any other worker, so a load
+    balancer (or the kernel spreading accepts over worker processes) can
+    send frames anywhere without splitting a session's state.
+    """
+
+    def __init__(self, app, ownership, default_session):
+        self.app = app
+        self.ownership = ownership
+        self.default_session = default_session
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] not in SESSION_PATHS
+            or scope["method"] == "OPTIONS"
+            or any(name == FORWARDED_HEADER for name, _ in scope["headers"])
+        ):
+            return await self.app(scope, receive, send)
+
+        body, early = await read_body(receive)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return early or {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        session_id = request_session_id(scope, body, self.default_session)
+        owner = await asyncio.to_thread(self.ownership.owner, session_id)
+        if owner != self.ownership.address and early is None:
+            try:
+                return await self.forward(owner, scope, body, send)
+            except httpx.TransportError as e:
+                logger.warning("Forwarding session %s to %s failed (%s); taking it over", session_id, owner, e)
+                await asyncio.to_thread(self.ownership.take, session_id)
+        await self.app(scope, replay, send)
+
+    async def forward(self, owner, scope, body, send):
+        headers = [(name, value) for name, value in scope["headers"] if name not in HOP_HEADERS]
+        headers.append((FORWARDED_HEADER, self.ownership.address.encode()))
+        url = f"http://{owner}{scope['path']}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        response = await self.ownership.client.request(scope["method"], url, headers=headers, content=body)
+        response_headers = [
+            (name, value) for name, value in response.headers.raw if name.lower() not in HOP_HEADERS
+        ]
+        response_headers.append((b"content-length", str(len(response.content)).encode()))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+        await send({"type": "http.response.body", "body": response.content})
@@ -0,0 +1,174 @@
+"""
+Reprocess recorded webcam video with the live analyzers.
+
+    python -m api.batch video.mp4 [more.mp4 ...] [--workers N] [--output results.jsonl]
+
+Each video is cut into chunks of --chunk-seconds that worker processes
+decode and measure (landmarks with one FaceMesh per process, and light),
+exactly as the live endpoints measure frames. The parent feeds the
+measurements to a session's analyzers in capture order, so filters,
+debouncing and blink detection see one continuous stream, and writes one
+JSON line per video with the session data (directionChanges,
+blinkTimestamps, lightStateChanges, distanceChanges and stats).
+Timestamps are seconds from --start-time (default 0, the start of each video).
+
+Thresholds are read from the environment as in the server (e.g.
+EAR_CLOSE_RATIO, MOTION_GATING, KEYFRAME_INTERVAL). Event logs and
+notifications are off unless EVENT_LOG_DIR or NOTIFICATION_BACKEND are set.
+"""
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+# Reprocessing must not write to the live event logs or notify anyone
+os.environ.setdefault("EVENT_LOG_DIR", "")
+os.environ.setdefault("NOTIFICATION_BACKEND", "none")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FPS = 30.0  # Assumed when a video does not report its frame rate
+CHUNKS_PER_WORKER = 4  # Chunks submitted ahead per worker, bounding buffered results
+
+
+def video_info(path):
+    """(frame count, frames per second) of a video file."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    if not fps or fps <= 0 or fps > 1000:
+        logger.warning("%s does not report its frame rate; assuming %s fps", path, DEFAULT_FPS)
+        fps = DEFAULT_FPS
+    return count, fps
+
+
+def chunks(path, count, fps, chunk_frames):
+    """(path, first frame, end frame or None for the rest, fps) work items of a video."""
+    starts = list(range(0, max(count, 1), chunk_frames))
+    return [(path, start, start + chunk_frames if i < len(starts) - 1 else None, fps) for i, start in enumerate(starts)]
+
+
+def measure_chunk(task):
+    """
+    Decode and measure the frames of one chunk in a worker process. Returns
+    (frame index, img_w, LightReading, landmarks or None) per frame; the
+    index is the decoder's position, so a short read or an inexact seek does
+    not shift later timestamps. The chunk is its own session, so FaceMesh
+    tracking, motion gating and keyframes start over.
+    """
+    import api.index as index
+
+    path, start, end, fps = task
+    capture = cv2.VideoCapture(path)
+    if start:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        # Seeks can land near, not on, the frame asked for
+        position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+        if position >= 0:
+            start = position
+    tracker = index.SessionTracker(f"batch:{os.getpid()}")
+    measurements = []
+    try:
+        i = start
+        while end is None or i < end:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            analysis = index.FrameAnalysis(
+                frame, face_mesh=tracker.face_mesh, roi=tracker.roi, face_detection=tracker.face_detection,
+                timestamp=i / fps, keyframes=tracker.landmark_tracker,
+            )
+            reading, landmarks = index.measure_frame(tracker, analysis)
+            measurements.append((i, analysis.img_w, reading, landmarks))
+            i += 1
+    finally:
+        # The FaceMesh goes back to the process's pool for the next chunk
+        tracker.close()
+        capture.release()
+    return measurements
+
+
+def ordered_map(executor, fn, tasks, ahead):
+    """executor.map with at most `ahead` tasks submitted beyond the result being waited for."""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, task))
+        if len(pending) > ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def analyze_chunks(tracker, chunk_measurements, fps, start_time):
+    """
+    Feed a video's measure_chunk results, in order, to a session's analyzers.
+    Each frame is timestamped by its index, so frames a chunk failed to read
+    leave a gap instead of shifting the frames after them. Returns (frames
+    analyzed, one past the last frame index).
+    """
+    import api.index as index
+
+    frames = end = 0
+    for measurements in chunk_measurements:
+        for i, img_w, reading, landmarks in measurements:
+            if i < end:
+                continue  # A seek landed before the chunk start; the previous chunk measured this frame
+            index.analyze_measurements(tracker, start_time + i / fps, img_w, reading, landmarks)
+            frames += 1
+            end = i + 1
+    return frames, end
+
+
+def reprocess(paths, workers, chunk_seconds, start_time):
+    """Yield (path, frame count, fps, session data) per video, in order."""
+    import api.index as index
+
+    videos = []
+    for path in paths:
+        count, fps = video_info(path)
+        videos.append((path, fps, chunks(path, count, fps, max(1, round(chunk_seconds * fps)))))
+    tasks = (task for _, _, video_chunks in videos for task in video_chunks)
+
+    # Spawned like uvicorn's workers: MediaPipe is not fork-safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        results = ordered_map(executor, measure_chunk, tasks, workers * CHUNKS_PER_WORKER)
+        for path, fps, video_chunks in videos:
+            tracker = index.SessionTracker(f"batch:{path}")
+            frames, end = analyze_chunks(tracker, (next(results) for _ in video_chunks), fps, start_time)
+            yield path, frames, fps, index.format_session_data(tracker, start_time + end / fps)
+            tracker.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+", help="Video files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-seconds", type=float, default=10.0, help="Video length measured per task")
+    parser.add_argument("--start-time", type=float, default=0.0, help="Timestamp of the first frame of each video")
+    parser.add_argument("--output", help="JSON lines file (default: stdout)")
+    args = parser.parse_args()
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for path, frames, fps, session_data in reprocess(args.videos, args.workers, args.chunk_seconds, args.start_time):
+            output.write(json.dumps({"video": path, "frames": frames, "fps": fps, **session_data}) + "\n")
+            output.flush()
+            logger.info("Processed %s: %d frames", path, frames)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from api.eventlog import EVENT_LOG_DIR, session_log_dir
+
+logger = logging.getLogger(__name__)
+
+# Human iris diameter; it varies little between adults (about 11-12.5 mm)
+IRIS_DIAMETER_MM = 11.7
+# Focal length / image width of an uncalibrated webcam (about 60 degrees horizontal field of view)
+DEFAULT_FOCAL_RATIO = float(os.environ.get("DISTANCE_FOCAL_RATIO", 0.87))
+CALIBRATION_SAMPLES = 30  # Frames with a face averaged by a calibration
+CALIBRATION_DISTANCE_CM = 50.0  # Default distance the user sits at while calibrating
+CALIBRATION_RANGE_CM = (20.0, 200.0)  # Accepted calibration distances
+# Calibration profiles kept in memory; the rest are reloaded from disk on use
+PROFILE_CACHE_SIZE = int(os.environ.get("DISTANCE_PROFILE_CACHE_SIZE", 1024))
+
+
+def iris_distance_cm(iris_ratio, focal_ratio=DEFAULT_FOCAL_RATIO):
+    """
+    Camera distance from the iris diameter as a fraction of the image width:
+    pinhole model, distance = focal length * real size / image size.
+    """
+    return focal_ratio * IRIS_DIAMETER_MM / iris_ratio / 10
+
+
+class Calibration:
+    """
+    Focal length estimate from frames taken while the user sits at a known
+    distance: each frame's iris ratio gives focal_ratio = ratio * distance /
+    iris diameter, and the median over the frames is kept.
+    """
+
+    __slots__ = ("distance_cm", "samples", "ratios")
+
+    def __init__(self, distance_cm=CALIBRATION_DISTANCE_CM, samples=CALIBRATION_SAMPLES):
+        self.distance_cm = distance_cm
+        self.samples = samples
+        self.ratios = []
+
+    def add(self, iris_ratio):
+        """Add a frame's iris ratio. Returns the focal ratio once enough frames are in, else None."""
+        self.ratios.append(iris_ratio)
+        if len(self.ratios) < self.samples:
+            return None
+        return float(np.median(self.ratios)) * self.distance_cm * 10 / IRIS_DIAMETER_MM
+
+    def status(self):
+        return {"status": "calibrating", "distance_cm": self.distance_cm, "samples": len(self.ratios), "needed": self.samples}
+
+
+class ProfileCache:
+    """
+    Per-user distance calibration (focal ratio) with LRU eviction, backed
+    by one small JSON file per user next to the user's event logs.
+    """
+
+    def __init__(self, capacity=PROFILE_CACHE_SIZE, root=None):
+        self.capacity = capacity
+        self.root = EVENT_LOG_DIR if root is None else root
+        self._profiles = OrderedDict()  # user id -> profile dict, least recently used first
+        self._lock = threading.Lock()
+
+    def _path(self, user_id):
+        return os.path.join(session_log_dir(user_id, self.root), "distance-profile.json")
+
+    def _remember(self, user_id, profile):
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.capacity:
+            self._profiles.popitem(last=False)
+
+    def get(self, user_id):
+        """Profile of a user ({"focal_ratio", "distance_cm", "calibrated_at"}), or None if uncalibrated."""
+        with self._lock:
+            if user_id in self._profiles:
+                self._profiles.move_to_end(user_id)
+                return self._profiles[user_id]
+        if not self.root:
+            return None
+        try:
+            with open(self._path(user_id)) as f:
+                profile = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable distance profile of %s: %s", user_id, e)
+            return None
+        with self._lock:
+            self._remember(user_id, profile)
+        return profile
+
+    def put(self, user_id, focal_ratio, distance_cm):
+        profile = {"focal_ratio": focal_ratio, "distance_cm": distance_cm, "calibrated_at": time.time()}
+        with self._lock:
+            self._remember(user_id, profile)
+        if self.root:
+            path = self._path(user_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a crash never leaves a half-written profile
+            with open(path + ".tmp", "w") as f:
+                json.dump(profile, f)
+            os.replace(path + ".tmp", path)
+        return profile
@@ -0,0 +1,67 @@
+import json
+
+from fastapi.responses import Response
+
+# Fast serializers are optional; without them responses fall back to the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Media types clients use to ask for MessagePack
+MSGPACK_MEDIA_TYPES = frozenset((MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"))
+
+
+def dumps_json(data):
+    """Compact JSON bytes of plain response data (dicts, lists, str, int, float, bool, None)."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def accepts_msgpack(accept):
+    """Whether an Accept header value prefers MessagePack to JSON (by q-value, then order)."""
+    if not accept or msgpack is None or "msgpack" not in accept:
+        return False
+    best_msgpack = best_json = 0.0
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        # Earlier entries win ties
+        score = quality - position * 1e-6
+        if media_type in MSGPACK_MEDIA_TYPES:
+            best_msgpack = max(best_msgpack, score)
+        elif media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            best_json = max(best_json, score)
+    return best_msgpack > 0 and best_msgpack > best_json
+
+
+class FastJSONResponse(Response):
+    """JSON response serialized with dumps_json, skipping FastAPI's jsonable_encoder pass."""
+
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content):
+        return dumps_json(content)
+
+
+def encode_response(request, data):
+    """
+    Response for plain response data in the encoding the request's Accept
+    header prefers: MessagePack (if installed) or JSON.
+    """
+    if accepts_msgpack(request.headers.get("accept")):
+        return Response(msgpack.packb(data), media_type=MSGPACK_MEDIA_TYPE)
+    return FastJSONResponse(data)
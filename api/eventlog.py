@@ -0,0 +1,169 @@
+import base64
+import bisect
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from api.events import EVENT_STREAMS, DISTANCE_VALUES
+
+# Directory of the per-session event logs; an empty value keeps events in memory only
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", os.path.join(tempfile.gettempdir(), "eyecare-events"))
+
+# File header: magic and the number of float64 fields per record
+LOG_MAGIC = b"EYEVLOG1"
+LOG_HEADER = struct.Struct("<8sQ")
+
+
+class EventLog:
+    """
+    Append-only file of fixed-width event records: a header, then one
+    little-endian float64 per field for each record, in the layout of an
+    EventRing row. Categorical fields are stored as label indexes.
+
+    Records are appended in time order (the analyzers drop late frames),
+    with the event time as the last field, so a time range is found by
+    binary search. Reads go through a memory map of the records present
+    when the read starts, so only the pages of the range are touched and a
+    record being appended concurrently is never seen half-written.
+    """
+
+    __slots__ = ("path", "fields", "labels", "_fd")
+
+    def __init__(self, path, fields, labels=None):
+        self.path = path
+        self.fields = tuple(fields)
+        self.labels = labels or {}
+        self._fd = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size == 0:
+            os.write(fd, LOG_HEADER.pack(LOG_MAGIC, len(self.fields)))
+        return fd
+
+    def append(self, row):
+        """Append one record (a float64 array with a value per field)."""
+        if self._fd is None:
+            self._fd = self._open()
+        # One write per record; O_APPEND keeps records whole and in order
+        os.write(self._fd, np.asarray(row, dtype="<f8").tobytes())
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _map(self):
+        """Memory map of the complete records, or None if the log is empty."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return None
+        count = (size - LOG_HEADER.size) // (8 * len(self.fields))
+        if count <= 0:
+            return None
+        with open(self.path, "rb") as f:
+            magic, fields = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+        if magic != LOG_MAGIC or fields != len(self.fields):
+            raise ValueError(f"{self.path} is not an event log with {len(self.fields)} fields")
+        return np.memmap(self.path, dtype="<f8", mode="r", offset=LOG_HEADER.size, shape=(count, len(self.fields)))
+
+    def array(self, start=None, end=None, before=0):
+        """
+        Records whose time (last field) is within [start, end], oldest first,
+        as a (n, fields) array copy. `before` adds up to that many records
+        preceding the range, e.g. to know the state at its start.
+        """
+        data = self._map()
+        if data is None:
+            return np.empty((0, len(self.fields)))
+        times = data[:, -1]
+        lo = 0 if start is None else bisect.bisect_left(times, start)
+        hi = len(times) if end is None else bisect.bisect_right(times, end)
+        return np.array(data[max(0, lo - before):max(lo, hi)])
+
+    def __len__(self):
+        data = self._map()
+        return 0 if data is None else len(data)
+
+    def records(self, start=None, end=None):
+        """Records within [start, end], oldest first, as dicts keyed by field name."""
+        records = []
+        for row in self.array(start, end).tolist():
+            record = dict(zip(self.fields, row))
+            for name, labels in self.labels.items():
+                record[name] = labels[int(record[name])]
+            records.append(record)
+        return records
+
+
+def session_log_dir(session_id, root=None):
+    """Directory of a session's logs; the id is encoded so any user id is a safe file name."""
+    root = EVENT_LOG_DIR if root is None else root
+    name = base64.urlsafe_b64encode(session_id.encode()).decode().rstrip("=")
+    return os.path.join(root, name)
+
+
+def open_session_logs(session_id, root=None):
+    """EventLog of each stream in EVENT_STREAMS for a session, or None if logging is disabled."""
+    root = EVENT_LOG_DIR if root is None else root
+    if not root:
+        return None
+    directory = session_log_dir(session_id, root)
+    return {
+        stream: EventLog(os.path.join(directory, f"{stream}.log"), fields, labels)
+        for stream, (fields, labels) in EVENT_STREAMS.items()
+    }
+
+
+def state_time(events, state, start=None, end=None):
+    """
+    Time spent in a state over [start, end], from (state, time) change
+    events that include the last change before start. The state after the
+    last change only counts up to an explicit end.
+    """
+    if not len(events):
+        return 0.0
+    times = events[:, -1]
+    if end is not None:
+        times = np.append(times, end)
+    if start is not None:
+        times = np.maximum(times, start)
+    durations = np.diff(times)
+    return float(durations[events[:len(durations), 0] == state].sum())
+
+
+def summarize(logs, start=None, end=None):
+    """Session statistics over [start, end] (capture times in seconds) from a session's logs."""
+    blinks = logs["blink"].array(start, end)[:, 0]
+    direction = logs["direction"].array(start, end, before=1)
+    light = logs["light"].array(start, end, before=1)
+
+    # Distance intervals are logged when they close; keep those overlapping the range, clipped to it
+    distance = logs["distance"].array(start)
+    if end is not None:
+        distance = distance[distance[:, 1] <= end]
+    interval_start, interval_end = distance[:, 1], distance[:, 2]
+    if start is not None:
+        interval_start = np.maximum(interval_start, start)
+    if end is not None:
+        interval_end = np.minimum(interval_end, end)
+    durations = interval_end - interval_start
+    values = np.array([DISTANCE_VALUES[state] for state in EVENT_STREAMS["distance"][1]["distance"]])
+    weighted_total = float((values[distance[:, 0].astype(int)] * durations).sum()) if len(distance) else 0.0
+    total_time = float(durations.sum())
+
+    minutes = (blinks[-1] - blinks[0]) / 60 if len(blinks) else 0
+    return {
+        "start": start,
+        "end": end,
+        "totalBlinks": len(blinks),
+        "avgBlinkRate": len(blinks) / minutes if minutes > 0 else 0,
+        "totalLookAwayTime": state_time(direction, 1, start, end),
+        "totalDarkTime": state_time(light, EVENT_STREAMS["light"][1]["ambient_light"].index("dark"), start, end),
+        "avgDistance": weighted_total / total_time if total_time > 0 else 0,
+        "events": {stream: len(log) for stream, log in logs.items()},
+    }
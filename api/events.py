@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+
+# Events kept per stream and session; older events are overwritten
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", 8192))
+
+# Labels of the categorical event fields, stored as their index
+LIGHT_STATES = ("light", "dark")
+DISTANCE_STATES = ("close", "med", "far")
+
+# Representative distance (cm) of each distance state, used for the time-weighted average
+DISTANCE_VALUES = {"close": 40, "med": 75, "far": 110}
+
+# Fields and categorical labels of each event stream; the last field is the event time
+EVENT_STREAMS = {
+    "blink": (("timestamp",), {}),
+    "light": (("ambient_light", "timestamp"), {"ambient_light": LIGHT_STATES}),
+    "direction": (("looking_away", "timestamp"), {"looking_away": (0, 1)}),
+    "distance": (("distance", "start_time", "end_time"), {"distance": DISTANCE_STATES}),
+}
+
+
+class EventRing:
+    """
+    Fixed-capacity ring buffer of event records backed by one float64 array.
+    Categorical fields are stored as indexes into their label tuple and
+    converted back when records are read.
+
+    Every appended event gets a sequence number (1, 2, ...); `total` is the
+    sequence number of the newest event and serves as a cursor for reading
+    only the events appended after it.
+
+    With a `log` (an api.eventlog.EventLog) every event is also appended to
+    it, so the full history outlives the ring and the process.
+    """
+
+    __slots__ = ("fields", "labels", "capacity", "total", "cleared", "log", "_data", "_columns")
+
+    def __init__(self, fields, labels=None, capacity=EVENT_BUFFER_SIZE, log=None):
+        self.fields = tuple(fields)
+        self.labels = labels or {}
+        self.capacity = capacity
+        self.total = 0  # Events appended so far
+        self.cleared = 0  # Value of total at the last clear()
+        self.log = log
+        self._data = np.zeros((capacity, len(self.fields)), dtype=np.float64)
+        self._columns = {name: i for i, name in enumerate(self.fields)}
+
+    def append(self, **values):
+        row = self._data[self.total % self.capacity]
+        for name, value in values.items():
+            if name in self.labels:
+                value = self.labels[name].index(value)
+            row[self._columns[name]] = value
+        self.total += 1
+        if self.log is not None:
+            self.log.append(row)
+
+    def __len__(self):
+        return min(self.total - self.cleared, self.capacity)
+
+    def array(self, since=0):
+        """Stored events after sequence number `since`, oldest first, as a (n, fields) array copy."""
+        count = max(0, min(len(self), self.total - since))
+        indexes = np.arange(self.total - count, self.total) % self.capacity
+        return self._data[indexes]
+
+    def column(self, name, since=0):
+        """Stored values of one numeric field after `since`, oldest first, as a list."""
+        return self.array(since)[:, self._columns[name]].tolist()
+
+    def records(self, since=0):
+        """Stored events after `since`, oldest first, as dicts keyed by field name."""
+        records = []
+        for row in self.array(since).tolist():
+            record = dict(zip(self.fields, row))
+            for name, labels in self.labels.items():
+                record[name] = labels[int(record[name])]
+            records.append(record)
+        return records
+
+    def clear(self):
+        """Forget stored events; sequence numbers keep counting up."""
+        self.cleared = self.total
+
+
+class BlinkStats:
+    """Running blink count and first/last blink time."""
+
+    __slots__ = ("count", "first", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def add(self, timestamp):
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.count += 1
+
+    def rate(self):
+        """Blinks per minute between the first and last blink."""
+        if not self.count:
+            return 0
+        minutes = (self.last - self.first) / 60
+        return self.count / minutes if minutes > 0 else 0
+
+
+class LookAwayStats:
+    """Running total of time spent looking away, closed at each direction change."""
+
+    __slots__ = ("total_time", "looking_away", "since")
+
+    def __init__(self):
+        self.total_time = 0
+        self.looking_away = None
+        self.since = None
+
+    def add(self, looking_away, timestamp):
+        if self.looking_away == 1:
+            self.total_time += timestamp - self.since
+        self.looking_away = looking_away
+        self.since = timestamp
+
+
+class DistanceStats:
+    """Running time-weighted sum of distance over closed distance intervals."""
+
+    __slots__ = ("weighted_total", "total_time")
+
+    def __init__(self):
+        self.weighted_total = 0
+        self.total_time = 0
+
+    def add(self, distance_state, start_time, end_time):
+        duration = end_time - start_time
+        self.weighted_total += DISTANCE_VALUES[distance_state] * duration
+        self.total_time += duration
+
+    def average(self, open_state=None, open_start=None, now=None):
+        """Time-weighted average distance, optionally including a still-open interval."""
+        weighted_total, total_time = self.weighted_total, self.total_time
+        if open_state is not None:
+            duration = now - open_start
+            weighted_total += DISTANCE_VALUES[open_state] * duration
+            total_time += duration
+        return weighted_total / total_time if total_time > 0 else 0
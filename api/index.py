@@ -1,27 +1,65 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request, BackgroundTasks, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import cv2
 import numpy as np
-import mediapipe as mp
 import base64
 import json
+import math
 import time
 from fastapi import HTTPException
-import firebase_admin
-from firebase_admin import credentials, messaging
 import asyncio
 import os
-from typing import Dict
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional
 from contextlib import asynccontextmanager
+from api.inference import InferenceExecutor, FrameDropped
+from api.notifications import NotificationDispatcher, create_messaging_backend
+from api.models import ModelPool, mediapipe_solutions, warm_up
+from api.light import LIGHT_DECODE_FLAGS, LIGHT_SAMPLE_PIXELS, measure_light, classify_light, sample_step
+from api.motion import MotionGate, MotionStats
+from api.keyframe import LandmarkTracker, KeyframeStats
+from api.metrics import timed, stage_seconds, render_values, SampledLogger
+from api.temporal import OneEuroFilter, BlinkDetector
+from api.landmarks import landmark_array, eye_aspect_ratios, pupil_ratios, iris_diameters
+from api.distance import (
+    ProfileCache, Calibration, iris_distance_cm, DEFAULT_FOCAL_RATIO, CALIBRATION_SAMPLES,
+    CALIBRATION_DISTANCE_CM, CALIBRATION_RANGE_CM
+)
+from api.events import EventRing, BlinkStats, LookAwayStats, DistanceStats, EVENT_STREAMS
+from api.eventlog import open_session_logs, summarize
+from api.rollup import (
+    MinuteRollup, ROLLUP_INTERVAL, rollup_log, all_rollup_logs, rollup_rows, summarize_rollups
+)
+from api.state import create_state_store
+from api.affinity import SessionOwnership, SessionAffinityMiddleware
+from api.encoding import MSGPACK_MEDIA_TYPE, encode_response
+from api.sampling import (
+    DIRECTION_MARGIN, DISTANCE_MARGIN_CM, interval_ms, boundary_margin, blink_margin, light_margin
+)
+from api.schemas import (
+    FrameAnalysisResponse, DirectionResponse, BlinkResponse, AmbientLightResponse, DistanceResponse
+)
 
 ### Create FastAPI instance with custom docs and openapi url
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    notifier.start()
     asyncio.create_task(send_notifications())
+    asyncio.create_task(evict_idle_sessions())
+    if ownership:
+        asyncio.create_task(ownership.run_heartbeat())
+    # Build the first models in the background; requests are served meanwhile
+    asyncio.create_task(asyncio.to_thread(warm_up, model_pools))
     yield
     # Shutdown
-    pass
+    inference.shutdown()
+    for pool in model_pools:
+        pool.close()
+    if ownership:
+        await ownership.close()
 
 app = FastAPI(
     docs_url="/api/py/docs", 
@@ -29,184 +67,294 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-print("Starting FastAPI server...")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+# Per-frame results are logged at debug level, for one in LOG_SAMPLE_RATE frames
+frame_logger = SampledLogger(logger)
 
-blink_timestamps = []
-blink_counter = 0
-is_currently_blinking = False  # Track if the user is currently in a blinking state
+logger.info("Starting FastAPI server...")
 
-# Correct the dictionary by providing a value for "timestamp"
-amb_light_data = {"ambient_light": "light", "timestamp": None}
-last_known_state = None  # Initialize the last known state
-state_changes = []  # List to store state changes
+# State shared by all workers (FCM tokens, session ownership); see api/state.py
+state_store = create_state_store()
+FCM_TOKENS_KEY = "fcm_tokens"  # Hash of user id -> FCM token
 
-direction_changes = []  # List to store direction changes
-last_known_direction = None  # Initialize the last known direction
+# One-euro filter settings (cutoff in Hz, beta per unit/s) of the smoothed measurements
+EAR_FILTER = {"min_cutoff": 10.0, "beta": 4.0}
+PUPIL_FILTER = {"min_cutoff": 1.5, "beta": 5.0}
+DISTANCE_FILTER = {"min_cutoff": 0.5, "beta": 0.05}  # On the distance in centimeters
 
+# Session used when a client does not identify itself
+DEFAULT_SESSION_ID = "default"
+# Sessions that have not sent a frame for this long are evicted
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", 600))
+SESSION_EVICTION_INTERVAL = 60
 
-# Initialize global variables for distance tracking
-distance_changes = []  # List to store distance changes
-last_known_distance_state = None  # Initialize the last known distance state
-state_start_time = time.time()  # Track the start time of the current state
+# Address (host:port) other workers reach this worker at, set by api/serve.py when
+# running several workers; a session's requests are then served by the worker that owns it
+WORKER_ADDRESS = os.environ.get("WORKER_ADDRESS")
+ownership = SessionOwnership(state_store, WORKER_ADDRESS, SESSION_IDLE_TIMEOUT) if WORKER_ADDRESS else None
 
+# Frame and skip counts of the per-session motion gates
+motion_stats = MotionStats()
+# Keyframe counts of the per-session landmark trackers
+keyframe_stats = KeyframeStats()
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("firebase-credentials.json")
-firebase_admin.initialize_app(cred)
 
-# Store FCM tokens
-fcm_tokens: Dict[str, str] = {}
-
-# Variables for look away notification debouncing
-LOOKAWAY_NOTIFICATION_COOLDOWN = 10  # Seconds between notifications
-last_lookaway_notification_time = 0
-
-# Variables for notification debouncing
-DISTANCE_NOTIFICATION_COOLDOWN = 30  # Seconds between notifications
-last_distance_notification_time = 0
-BLINK_NOTIFICATION_COOLDOWN = 10  # Seconds between blink notifications
-last_blink_notification_time = 0
-last_blink_time = time.time()  # Track the last time user blinked
-AMBIENT_NOTIFICATION_COOLDOWN = 30  # Seconds between ambient light notifications
-last_ambient_notification_time = 0
-dark_environment_start_time = None  # Track when dark environment started
+class SessionTracker:
+    """
+    Tracking state for one session (keyed by the same user id used for FCM tokens).
+    Each session owns its FaceMesh so its tracking context follows a single face.
+    Notification cooldowns are kept per user by the NotificationDispatcher.
+    """
 
-# Function to send look away notification
-def send_lookaway_notification():
-    global last_lookaway_notification_time
-    current_time = time.time()
-    
-    # Check if enough time has passed since the last notification
-    if current_time - last_lookaway_notification_time < LOOKAWAY_NOTIFICATION_COOLDOWN:
-        return
-    
+    __slots__ = (
+        "session_id",
+        "lock",
+        "last_seen",
+        "_face_mesh",
+        "_face_detection",
+        "roi",
+        "motion_gate",
+        "landmark_tracker",
+        # Signal filters
+        "ear_filter",
+        "pupil_filter",
+        "distance_filter",
+        # Blink tracking
+        "blink_detector",
+        "blink_events",
+        "blink_stats",
+        "blink_counter",
+        "is_currently_blinking",
+        "last_blink_time",
+        # Ambient light tracking
+        "amb_light_data",
+        "last_known_state",
+        "light_events",
+        "dark_environment_start_time",
+        # Gaze tracking
+        "direction_events",
+        "look_away_stats",
+        "last_known_direction",
+        "last_change_time",
+        # Distance tracking
+        "distance_events",
+        "distance_stats",
+        "last_known_distance_state",
+        "state_start_time",
+        "distance_profile",
+        "calibration",
+        "event_logs",
+        "rollup",
+    )
+
+    def __init__(self, session_id):
+        now = time.time()
+        self.session_id = session_id
+        self.lock = threading.Lock()  # Serializes frames of this session
+        self.last_seen = now
+        self._face_mesh = None
+        self._face_detection = None
+        self.roi = None  # FaceMesh crop carried over from the previous frame
+        self.motion_gate = MotionGate(motion_stats)
+        self.landmark_tracker = LandmarkTracker(keyframe_stats)  # FaceMesh keyframes and optical flow in between
+
+        # Smoothing of the per-frame measurements, driven by frame capture times
+        self.ear_filter = OneEuroFilter(**EAR_FILTER)
+        self.pupil_filter = OneEuroFilter(**PUPIL_FILTER)
+        self.distance_filter = OneEuroFilter(**DISTANCE_FILTER)
+
+        # Bounded event history plus running statistics over the whole session;
+        # with EVENT_LOG_DIR set, every event is also appended to the session's log files
+        self.event_logs = open_session_logs(session_id)
+        self.rollup = MinuteRollup(rollup_log(session_id))  # Per-minute totals for /api/py/metrics/summary
+        self.blink_detector = BlinkDetector()
+        self.blink_events = self._event_ring("blink")
+        self.blink_stats = BlinkStats()
+        self.blink_counter = 0
+        self.is_currently_blinking = False  # Track if the user is currently in a blinking state
+        self.last_blink_time = None  # Capture time of the last blink (or of the first frame)
+
+        self.amb_light_data = {"ambient_light": "light", "timestamp": None}
+        self.last_known_state = None
+        self.light_events = self._event_ring("light")
+        self.dark_environment_start_time = None  # Track when dark environment started
+
+        self.direction_events = self._event_ring("direction")
+        self.look_away_stats = LookAwayStats()
+        self.last_known_direction = None
+        self.last_change_time = now
+
+        self.distance_events = self._event_ring("distance")
+        self.distance_stats = DistanceStats()
+        self.last_known_distance_state = None
+        self.state_start_time = now  # Track the start time of the current state
+        self.distance_profile = distance_profiles.get(session_id)  # Focal length calibration, if any
+        self.calibration = None  # Calibration in progress
+
+    def _event_ring(self, stream):
+        fields, labels = EVENT_STREAMS[stream]
+        log = self.event_logs[stream] if self.event_logs is not None else None
+        return EventRing(fields, labels, log=log)
+
+    @property
+    def face_mesh(self):
+        if self._face_mesh is None:
+            self._face_mesh = face_mesh_pool.acquire()
+        return self._face_mesh
+
+    @property
+    def face_detection(self):
+        if self._face_detection is None:
+            self._face_detection = face_detection_pool.acquire()
+        return self._face_detection
+
+    def close(self):
+        # Models go back to the pools for the next session
+        if self._face_mesh is not None:
+            face_mesh_pool.release(self._face_mesh)
+            self._face_mesh = None
+        if self._face_detection is not None:
+            face_detection_pool.release(self._face_detection)
+            self._face_detection = None
+        if self.event_logs is not None:
+            for log in self.event_logs.values():
+                log.close()
+        self.rollup.close()
+
+
+class SessionRegistry:
+    """Registry of live SessionTrackers with idle eviction."""
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, SessionTracker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id=DEFAULT_SESSION_ID):
+        """Return the tracker for a session, creating it on first use."""
+        with self._lock:
+            tracker = self._sessions.get(session_id)
+            if tracker is None:
+                tracker = SessionTracker(session_id)
+                self._sessions[session_id] = tracker
+            tracker.last_seen = time.time()
+            return tracker
+
+    def evict_idle(self):
+        """
+        Remove sessions idle for longer than idle_timeout. Returns the removed
+        trackers, which the caller closes (see close_trackers) outside the lock.
+        """
+        cutoff = time.time() - self.idle_timeout
+        evicted = []
+        with self._lock:
+            for session_id, tracker in list(self._sessions.items()):
+                # Skip sessions that are processing a frame right now
+                if tracker.last_seen < cutoff and not tracker.lock.locked():
+                    del self._sessions[session_id]
+                    evicted.append(tracker)
+        return evicted
+
+    def trackers(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionRegistry()
+
+
+def close_trackers(trackers):
+    """Release evicted sessions' models and close their logs. Blocking; runs off the event loop."""
+    for tracker in trackers:
+        with tracker.lock:  # Wait for a frame that picked the tracker up before it was removed
+            tracker.close()
+
+# Per-user distance calibrations
+distance_profiles = ProfileCache()
+
+# Blocking frame processing runs here instead of on the event loop
+inference = InferenceExecutor()
+
+
+def session_id_from(data):
+    """Session id of a request body (the same userId register_fcm_token accepts)."""
+    return data.get("userId") or DEFAULT_SESSION_ID
+
+
+# Client capture times further than this (seconds) from the server clock are not trusted
+MAX_CLOCK_SKEW = float(os.environ.get("MAX_CLOCK_SKEW", 5))
+
+
+def frame_timestamp(data):
+    """
+    Client capture time of a frame request (`timestamp`, in seconds since
+    the epoch, e.g. Date.now() / 1000), or None to use the arrival time.
+    Times more than MAX_CLOCK_SKEW from the server clock also use the
+    arrival time, so one bad clock reading cannot stall a session's filters.
+    Raises HTTPException (400) for a non-numeric or non-finite timestamp.
+    """
+    timestamp = data.get("timestamp")
+    if timestamp in (None, ""):
+        return None
     try:
-        for token in fcm_tokens.values():
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Look Away Reminder",
-                    body="Please take a break and look away from the screen for 20 seconds!"
-                ),
-                token=token
-            )
-            try:
-                messaging.send(message)
-                print(f"Look away notification sent successfully to token: {token[:10]}...")
-                last_lookaway_notification_time = current_time  # Update last notification time
-            except Exception as e:
-                print(f"Failed to send look away notification to token {token[:10]}...: {str(e)}")
-    except Exception as e:
-        print(f"Error sending look away notification: {str(e)}")
+        timestamp = float(timestamp)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="timestamp must be a number")
+    if not math.isfinite(timestamp):
+        raise HTTPException(status_code=400, detail="timestamp must be finite")
+    if abs(timestamp - time.time()) > MAX_CLOCK_SKEW:
+        return None
+    return timestamp
 
-# Function to send distance warning notification
-def send_distance_warning_notification():
-    global last_distance_notification_time
-    current_time = time.time()
-    
-    # Check if enough time has passed since the last notification
-    if current_time - last_distance_notification_time < DISTANCE_NOTIFICATION_COOLDOWN:
-        return
-    
-    try:
-        for token in fcm_tokens.values():
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Distance Warning",
-                    body="You're too close to the screen! Please lean back for better posture."
-                ),
-                token=token
-            )
-            try:
-                messaging.send(message)
-                print(f"Distance warning notification sent successfully to token: {token[:10]}...")
-                last_distance_notification_time = current_time  # Update last notification time
-            except Exception as e:
-                print(f"Failed to send distance warning notification to token {token[:10]}...: {str(e)}")
-    except Exception as e:
-        print(f"Error sending distance warning notification: {str(e)}")
 
-# Function to send blink reminder notification
-def send_blink_reminder_notification():
-    global last_blink_notification_time
-    current_time = time.time()
-    
-    # Check if enough time has passed since the last notification
-    if current_time - last_blink_notification_time < BLINK_NOTIFICATION_COOLDOWN:
-        return
-    
-    try:
-        for token in fcm_tokens.values():
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Blink Reminder",
-                    body="Remember to blink! Your eyes need moisture to stay healthy."
-                ),
-                token=token
-            )
-            try:
-                messaging.send(message)
-                print(f"Blink reminder notification sent successfully to token: {token[:10]}...")
-                last_blink_notification_time = current_time  # Update last notification time
-            except Exception as e:
-                print(f"Failed to send blink reminder notification to token {token[:10]}...: {str(e)}")
-    except Exception as e:
-        print(f"Error sending blink reminder notification: {str(e)}")
+def notification_tokens(session_id):
+    """
+    FCM tokens to notify for a session: the session's own token, or every
+    registered token for the anonymous default session.
+    """
+    token = state_store.hget(FCM_TOKENS_KEY, session_id)
+    if token:
+        return [token]
+    if session_id == DEFAULT_SESSION_ID:
+        return list(state_store.hgetall(FCM_TOKENS_KEY).values())
+    return []
 
-# Function to send ambient light warning notification
-def send_ambient_light_warning_notification():
-    global last_ambient_notification_time
-    current_time = time.time()
-    
-    # Check if enough time has passed since the last notification
-    if current_time - last_ambient_notification_time < AMBIENT_NOTIFICATION_COOLDOWN:
-        return
-    
-    try:
-        for token in fcm_tokens.values():
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Lighting Warning",
-                    body="The environment is too dark! Please move to a brighter area or adjust your screen brightness."
-                ),
-                token=token
-            )
-            try:
-                messaging.send(message)
-                print(f"Ambient light warning notification sent successfully to token: {token[:10]}...")
-                last_ambient_notification_time = current_time  # Update last notification time
-            except Exception as e:
-                print(f"Failed to send ambient light warning notification to token {token[:10]}...: {str(e)}")
-    except Exception as e:
-        print(f"Error sending ambient light warning notification: {str(e)}")
+
+# Initialize Firebase Admin SDK (or the fake backend) and the notification queue
+notifier = NotificationDispatcher(create_messaging_backend(), notification_tokens)
 
 # Background notification task
 async def send_notifications():
-    print("Starting notification service...")
+    logger.info("Starting notification service...")
     while True:
         try:
-            # Create a list to store coroutines
-            # tasks = []
-            # for token in fcm_tokens.values():
-            #     message = messaging.Message(
-            #         notification=messaging.Notification(
-            #             title="Posture Check",
-            #             body="Remember to lean back and maintain good posture!"
-            #         ),
-            #         token=token
-            #     )
-            #     try:
-            #         # Send message synchronously since firebase-admin doesn't support async
-            #         messaging.send(message)
-            #         print(f"Notification sent successfully to token: {token[:10]}...")
-            #     except Exception as e:
-            #         print(f"Failed to send notification to token {token[:10]}...: {str(e)}")
-            
-            # Wait for 10 seconds before sending next batch
-            await asyncio.sleep(10)
+            # Wait for queued alerts and send them as one coalesced batch
+            await notifier.dispatch()
         except Exception as e:
-            print(f"Error in notification service: {str(e)}")
+            logger.exception("Error in notification service: %s", e)
             await asyncio.sleep(1)  # Wait briefly before retrying
 
+# Background session eviction task
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(SESSION_EVICTION_INTERVAL)
+        try:
+            evicted = sessions.evict_idle()
+            if evicted:
+                await asyncio.to_thread(close_trackers, evicted)
+            for tracker in evicted:
+                notifier.forget(tracker.session_id)
+                if ownership:
+                    await asyncio.to_thread(ownership.release, tracker.session_id)
+            if evicted:
+                logger.info("Evicted idle sessions: %s", ", ".join(tracker.session_id for tracker in evicted))
+        except Exception as e:
+            logger.exception("Error evicting idle sessions: %s", e)
+
 @app.post("/api/py/register-fcm-token")
 async def register_fcm_token(request: Request):
     try:
@@ -217,7 +365,7 @@ async def register_fcm_token(request: Request):
         if not token:
             raise HTTPException(status_code=400, detail="FCM token is required")
         
-        fcm_tokens[user_id] = token
+        state_store.hset(FCM_TOKENS_KEY, user_id, token)
         return {"message": "FCM token registered successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -232,451 +380,1182 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize MediaPipe Face Mesh
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
+# Added last so it runs first: a forwarded request is answered by the owner's own stack
+if ownership:
+    app.add_middleware(SessionAffinityMiddleware, ownership=ownership, default_session=DEFAULT_SESSION_ID)
+
+# MediaPipe is imported when the first model is built, not at startup
+def create_face_mesh():
+    """Create a FaceMesh instance in video (tracking) mode."""
+    return mediapipe_solutions().face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+def create_face_detection():
+    """Create a short-range face detector, used to place the FaceMesh crop."""
+    return mediapipe_solutions().face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+
+# Idle models handed to new sessions (see api.models.ModelPool)
+face_mesh_pool = ModelPool(create_face_mesh)
+face_detection_pool = ModelPool(create_face_detection)
+model_pools = (face_mesh_pool, face_detection_pool)
+
+# Analyzers that can be requested from /api/py/analyze-frame
+ANALYZERS = ("direction", "blink", "distance", "light")
+
+
+def decode_frame(frame_data, flags=cv2.IMREAD_COLOR):
+    """Decode a base64 JPEG data URL into a BGR frame (or what the cv2.imdecode flags ask for)."""
+    image_data = frame_data.split(',')[1]  # Remove the data URL prefix
+    nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
+    return cv2.imdecode(nparr, flags)
+
+
+# Channels of the raw (uncompressed) frame layouts
+RAW_FRAME_CHANNELS = {"gray": 1, "rgb": 3, "rgba": 4}
+FRAME_FORMATS = ("jpeg", *RAW_FRAME_CHANNELS)
+
+
+class RawFrame(NamedTuple):
+    """Frame bytes from a binary request body: an encoded image ("jpeg") or a raw layout with its size."""
+    payload: bytes
+    format: str = "jpeg"
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def decode_frame_bytes(payload, frame_format="jpeg", width=None, height=None, light_only=False):
+    """
+    Decode frame bytes without intermediate copies.
+    "jpeg" is any image cv2.imdecode reads; "gray", "rgb" and "rgba" are raw
+    pixels that are viewed in place with np.frombuffer. With light_only,
+    images are decoded straight to reduced-size grayscale.
+    Returns FrameAnalysis keyword arguments (frame, rgb or gray).
+    """
+    data = np.frombuffer(payload, np.uint8)
+    if frame_format == "jpeg":
+        frame = cv2.imdecode(data, LIGHT_DECODE_FLAGS if light_only else cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode image")
+        return {"gray": frame} if light_only else {"frame": frame}
+    channels = RAW_FRAME_CHANNELS.get(frame_format)
+    if channels is None:
+        raise ValueError(f"Unsupported frame format: {frame_format}")
+    if not width or not height or data.size != width * height * channels:
+        raise ValueError(f"Raw {frame_format} frame needs width and height matching its {data.size} bytes")
+    if frame_format == "gray":
+        return {"gray": data.reshape(height, width)}
+    if frame_format == "rgba":
+        return {"rgb": cv2.cvtColor(data.reshape(height, width, 4), cv2.COLOR_RGBA2RGB)}
+    return {"rgb": data.reshape(height, width, 3)}
+
+
+def decode_input(frame, light_only=False):
+    """FrameAnalysis keyword arguments for a data URL string or a RawFrame."""
+    if isinstance(frame, RawFrame):
+        return decode_frame_bytes(*frame, light_only=light_only)
+    if light_only:
+        return {"gray": decode_frame(frame, LIGHT_DECODE_FLAGS)}
+    return {"frame": decode_frame(frame)}
+
+
+async def read_frame_request(request):
+    """
+    Read a per-frame request. Returns (parameters, frame), where frame is
+    a data URL or a RawFrame for run_analysis.
+
+    Accepted bodies:
+    - application/json: {"frame": data URL, "userId": ..., ...}
+    - image/jpeg (or another image type): the encoded image; parameters
+      come from the query string
+    - multipart/form-data: a "frame" file plus the other parameters as fields
+    - application/octet-stream: raw pixels in the layout named by the
+      X-Frame-Format header ("gray", "rgb" or "rgba"), sized by the
+      X-Frame-Width and X-Frame-Height headers; parameters come from the
+      query string
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    if content_type == "application/json":
+        data = await request.json()
+        return data, data["frame"]
+    if content_type.startswith("image/"):
+        return dict(request.query_params), RawFrame(await request.body())
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        data = {key: value for key, value in form.items() if key != "frame"}
+        upload = form["frame"]
+        frame_format = data.get("format", "jpeg")
+        return data, RawFrame(await upload.read(), frame_format, int(data.get("width", 0)), int(data.get("height", 0)))
+    if content_type == "application/octet-stream":
+        headers = request.headers
+        frame = RawFrame(
+            await request.body(),
+            headers.get("x-frame-format", "gray"),
+            int(headers.get("x-frame-width", 0)),
+            int(headers.get("x-frame-height", 0)),
+        )
+        return dict(request.query_params), frame
+    raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+
+# Region-of-interest preprocessing before FaceMesh
+ROI_ENABLED = os.environ.get("ROI_ENABLED", "1") != "0"
+ROI_TARGET_SIZE = int(os.environ.get("ROI_TARGET_SIZE", 256))  # Side of the square crop FaceMesh sees
+ROI_MARGIN = 0.3  # Crop padding on each side, as a fraction of the face size
+ROI_SEED_WIDTH = 320  # Frame width used to find the face when there is no ROI
+ROI_DETECTION_SCALE = 1.3  # Face detector boxes are tighter than the landmark extent
+
+
+def roi_around(landmarks):
+    """Square crop (center x, center y, side) in frame pixels around a landmark array, padded by ROI_MARGIN."""
+    low = landmarks[:, :2].min(axis=0)
+    high = landmarks[:, :2].max(axis=0)
+    center = (low + high) / 2
+    size = float((high - low).max()) * (1 + 2 * ROI_MARGIN)
+    return (float(center[0]), float(center[1]), size)
+
+
+class FrameAnalysis:
+    """
+    Shared per-frame state for the analyzers.
+    The color conversions and the FaceMesh pass are computed lazily and cached,
+    so every analyzer run on the same frame reuses a single (478, 3) landmark
+    array in frame pixels.
+    A BGR frame, an RGB frame or a grayscale frame can be supplied; face_mesh
+    is the session's FaceMesh instance.
+
+    With ROI_ENABLED, FaceMesh runs on a square crop around the face found in
+    the session's previous frame (roi), resampled to ROI_TARGET_SIZE, and the
+    landmarks are mapped back to full-frame pixels, so analyzers see the
+    same landmarks as without cropping. The crop is re-centered on
+    the face every frame, which keeps the face at the same place in FaceMesh's
+    input and its tracking valid. Without a previous crop, face_detection
+    locates the face on a downscaled frame first. The crop for the next frame
+    is left in self.roi.
+
+    With the session's LandmarkTracker as keyframes, FaceMesh only runs on
+    its keyframes and the landmarks of the other frames are tracked.
+    """
+
+    def __init__(
+        self, frame=None, rgb=None, face_mesh=None, roi=None, face_detection=None, gray=None, timestamp=None,
+        keyframes=None,
+    ):
+        self.frame = frame
+        # Capture time of the frame, which the analyzers' filters and debouncing run on
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._rgb = rgb
+        self._gray = gray
+        self.img_h, self.img_w = self._source().shape[:2]
+        self._face_mesh = face_mesh
+        self._face_detection = face_detection
+        self._keyframes = keyframes
+        self._landmarks = None
+        self._processed = False
+        self.roi = roi
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            with timed("color"):
+                if self.frame is not None:
+                    self._rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
+                else:
+                    self._rgb = cv2.cvtColor(self._gray, cv2.COLOR_GRAY2RGB)
+        return self._rgb
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            with timed("color"):
+                if self.frame is not None:
+                    self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+                else:
+                    self._gray = cv2.cvtColor(self._rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    def luma_sample(self, max_pixels=LIGHT_SAMPLE_PIXELS):
+        """
+        Strided sample of the frame's luma with at most max_pixels pixels.
+        Reuses the grayscale frame if it exists; otherwise only the sampled
+        pixels are converted.
+        """
+        step = sample_step(self.img_h, self.img_w, max_pixels)
+        if self._gray is not None:
+            return self._gray[::step, ::step]
+        sample = np.ascontiguousarray(self._source()[::step, ::step])
+        with timed("color"):
+            return cv2.cvtColor(sample, cv2.COLOR_RGB2GRAY if self.frame is None else cv2.COLOR_BGR2GRAY)
+
+    def gray_crop(self, box):
+        """Grayscale (x0, y0, x1, y1) crop of the frame; only the crop is converted unless the gray frame exists."""
+        x0, y0, x1, y1 = box
+        if self._gray is not None:
+            return self._gray[y0:y1, x0:x1]
+        crop = self._source()[y0:y1, x0:x1]
+        with timed("color"):
+            return cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY if self._rgb is not None else cv2.COLOR_BGR2GRAY)
+
+    def _to_rgb(self, image):
+        """Convert a resampled image of the source frame to RGB (a no-op for RGB sources)."""
+        if image.ndim == 2:
+            with timed("color"):
+                return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        if self._rgb is None:
+            with timed("color"):
+                return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return image
+
+    def _source(self):
+        # Resample before the color conversion so only the small image is converted
+        for image in (self._rgb, self.frame, self._gray):
+            if image is not None:
+                return image
+
+    def _seed_roi(self):
+        """Find the face on a downscaled frame; returns a crop or None."""
+        scale = min(1.0, ROI_SEED_WIDTH / self.img_w)
+        with timed("crop"):
+            small = cv2.resize(self._source(), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        small = self._to_rgb(small)
+        with timed("face_detection"):
+            results = self._face_detection.process(small)
+        if not results.detections:
+            return None
+        box = results.detections[0].location_data.relative_bounding_box
+        cx = (box.xmin + box.width / 2) * self.img_w
+        cy = (box.ymin + box.height / 2) * self.img_h
+        size = max(box.width * self.img_w, box.height * self.img_h)
+        return (cx, cy, size * ROI_DETECTION_SCALE * (1 + 2 * ROI_MARGIN))
+
+    def _detect_in_roi(self, roi):
+        cx, cy, size = roi
+        scale = ROI_TARGET_SIZE / size
+        # Crop, resize and pad (for faces near the frame edge) in one warp
+        transform = np.float32([
+            [scale, 0, ROI_TARGET_SIZE / 2 - scale * cx],
+            [0, scale, ROI_TARGET_SIZE / 2 - scale * cy],
+        ])
+        with timed("crop"):
+            crop = cv2.warpAffine(
+                self._source(), transform, (ROI_TARGET_SIZE, ROI_TARGET_SIZE),
+                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT
+            )
+        crop = self._to_rgb(crop)
+        with timed("face_mesh"):
+            results = self._face_mesh.process(crop)
+        if not results.multi_face_landmarks:
+            return None
+        # Crop pixels map to frame pixels by one scale and offset
+        return landmark_array(results.multi_face_landmarks[0], size, size, offset=(cx - size / 2, cy - size / 2))
+
+    def _detect_landmarks(self):
+        """Landmarks from a FaceMesh pass over the frame (or the crop around the face)."""
+        if ROI_ENABLED:
+            roi = self.roi if self.roi is not None else self._seed_roi()
+            landmarks = self._detect_in_roi(roi) if roi is not None else None
+            self.roi = roi_around(landmarks) if landmarks is not None else None
+            return landmarks
+        rgb = self.rgb
+        with timed("face_mesh"):
+            results = self._face_mesh.process(rgb)
+        if results.multi_face_landmarks:
+            return landmark_array(results.multi_face_landmarks[0], self.img_w, self.img_h)
+        return None
+
+    @property
+    def landmarks(self):
+        """(478, 3) float32 landmark array of the first detected face in frame pixels, or None if no face was found."""
+        if not self._processed:
+            if self._keyframes is not None:
+                landmarks = self._keyframes.process(self, FrameAnalysis._detect_landmarks)
+                if ROI_ENABLED:
+                    # Tracked landmarks move the crop for the next keyframe along with the face
+                    self.roi = roi_around(landmarks) if landmarks is not None else None
+            else:
+                landmarks = self._detect_landmarks()
+            self._landmarks = landmarks
+            self._processed = True
+        return self._landmarks
 
 # Add a debounce time (in seconds)
 DEBOUNCE_TIME = 0.5
-last_change_time = time.time()
+# Average horizontal pupil ratio below which the user looks right, and above which left
+DIRECTION_RIGHT_RATIO = 0.45
+DIRECTION_LEFT_RATIO = 0.55
+
+def record_direction_change(tracker, direction, timestamp):
+    looking_away = 0 if direction == "center" else 1
+    tracker.direction_events.append(looking_away=looking_away, timestamp=timestamp)
+    tracker.look_away_stats.add(looking_away, timestamp)
+    tracker.rollup.looking_away = bool(looking_away)
 
-def detect_eye_direction(frame):
+
+def detect_eye_direction(tracker, landmarks, timestamp):
     """
     Detect eye gaze direction by tracking pupil positions relative to eye corners.
+    timestamp is the frame's capture time; the pupil ratio is smoothed over
+    capture times and direction changes are debounced on them.
     Returns: "left", "right", "center", or "unknown".
     """
-    global last_known_direction, direction_changes, last_change_time
+    # Relative position of the pupils within the eye sockets, (left, right) x (x, y)
+    ratios = pupil_ratios(landmarks)
 
-    print("Running improved detect_eye_direction")
-    
-    # Convert the BGR image to RGB
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    
-    # Get image dimensions
-    img_h, img_w = frame.shape[:2]
-    
-    # Process the frame and detect facial landmarks
-    results = face_mesh.process(rgb_frame)
-    
-    if not results.multi_face_landmarks:
-        return "unknown"
-    
-    face_landmarks = results.multi_face_landmarks[0]
-    
-    # MediaPipe indices for eye landmarks
-    left_eye_landmarks = [33, 133, 159, 145, 468]
-    right_eye_landmarks = [362, 263, 386, 374, 473]
-    
-    # Extract normalized landmarks and convert to pixel coordinates
-    def get_landmark_coords(landmark_index):
-        landmark = face_landmarks.landmark[landmark_index]
-        x, y = int(landmark.x * img_w), int(landmark.y * img_h)
-        return (x, y)
-    
-    # Get eye corner and pupil coordinates
-    left_eye_left = get_landmark_coords(33)
-    left_eye_right = get_landmark_coords(133)
-    left_eye_pupil = get_landmark_coords(468)
-    
-    right_eye_left = get_landmark_coords(362)
-    right_eye_right = get_landmark_coords(263)
-    right_eye_pupil = get_landmark_coords(473)
-    
-    # Calculate relative position of pupils within the eye sockets
-    left_eye_width = left_eye_right[0] - left_eye_left[0]
-    left_eye_height = left_eye_right[1] - left_eye_left[1]
-    if left_eye_width == 0:  # Prevent division by zero
-        left_eye_width = 1
-    if left_eye_height == 0:
-        left_eye_height = 1
-    
-    left_pupil_ratio_x = (left_eye_pupil[0] - left_eye_left[0]) / left_eye_width
-    left_pupil_ratio_y = (left_eye_pupil[1] - left_eye_left[1]) / left_eye_height
-    
-    right_eye_width = right_eye_right[0] - right_eye_left[0]
-    right_eye_height = right_eye_right[1] - right_eye_left[1]
-    if right_eye_width == 0:  # Prevent division by zero
-        right_eye_width = 1
-    if right_eye_height == 0:  # Prevent division by zero
-        right_eye_height = 1
-    
-    right_pupil_ratio_x = (right_eye_pupil[0] - right_eye_left[0]) / right_eye_width
-    right_pupil_ratio_y = (right_eye_pupil[1] - right_eye_left[1]) / right_eye_height
-    
     # Calculate the horizontal (x) average pupil ratio
-    avg_pupil_ratio_x = (left_pupil_ratio_x + right_pupil_ratio_x) / 2
-    avg_pupil_ratio_y = (left_pupil_ratio_y + right_pupil_ratio_y) / 2
-    
+    avg_pupil_ratio_x = tracker.pupil_filter(float(ratios[:, 0].mean()), timestamp)
+
     # For debugging: Print the horizontal and vertical ratios
-    #print(f"Left pupil ratio X: {left_pupil_ratio_x:.3f}, Right pupil ratio X: {right_pupil_ratio_x:.3f}, Avg X: {avg_pupil_ratio_x:.3f}")
-    #print(f"Left pupil ratio Y: {left_pupil_ratio_y:.3f}, Right pupil ratio Y: {right_pupil_ratio_y:.3f}, Avg Y: {avg_pupil_ratio_y:.3f}")
-    
-    # Define direction based on the horizontal and vertical average pupil ratio
-    if avg_pupil_ratio_x < 0.45:
+    #print(f"Pupil ratios X: {ratios[:, 0]}, Y: {ratios[:, 1]}, Avg X: {avg_pupil_ratio_x:.3f}")
+
+    # Define direction based on the horizontal average pupil ratio
+    if avg_pupil_ratio_x < DIRECTION_RIGHT_RATIO:
         current_direction = "right"
-    elif avg_pupil_ratio_x > 0.55:
+    elif avg_pupil_ratio_x > DIRECTION_LEFT_RATIO:
         current_direction = "left"
     else:
         current_direction = "center"
 
     # Check if the direction has changed
-    current_time = time.time()
-    if last_known_direction is None:
+    current_time = timestamp
+    if tracker.last_known_direction is None:
         # Initialize the last known direction
-        last_known_direction = current_direction
-        direction_changes.append({
-            "looking_away": 0 if current_direction == "center" else 1,
-            "timestamp": current_time
-        })
-    elif current_direction != last_known_direction and (current_time - last_change_time) > DEBOUNCE_TIME:
+        tracker.last_known_direction = current_direction
+        tracker.last_change_time = current_time
+        record_direction_change(tracker, current_direction, current_time)
+    elif current_direction != tracker.last_known_direction and (current_time - tracker.last_change_time) > DEBOUNCE_TIME:
         # Direction has changed and debounce time has passed
-        direction_changes.append({
-            "looking_away": 0 if current_direction == "center" else 1,
-            "timestamp": current_time
-        })
-        last_known_direction = current_direction  # Update the last known direction
-        last_change_time = current_time  # Update the last change time
+        record_direction_change(tracker, current_direction, current_time)
+        tracker.last_known_direction = current_direction  # Update the last known direction
+        tracker.last_change_time = current_time  # Update the last change time
 
         # Send notification when user looks away from the screen
         if current_direction == "center":
-            send_lookaway_notification()
+            notifier.notify(tracker.session_id, "lookaway")
     return current_direction
 
 
-def process_ambient_light(frame):
-    try:
-        #print("Processing ambient light")
-        
-        # Convert the BGR image to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Calculate average brightness
-        brightness = np.mean(gray)
-
-        return float(brightness)
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}") 
-    
-
-
-
-def detect_blink(face_landmarks, img_w, img_h):
-    global blink_timestamps, blink_counter, is_currently_blinking, last_blink_time
+def update_ambient_light(tracker, reading, timestamp):
+    """
+    Update the ambient light state from a LightReading of a frame captured at timestamp.
+    Returns: "light" or "dark".
+    """
+    # A frame captured before the last state change is too late to change it
+    last_change = tracker.amb_light_data["timestamp"]
+    if last_change is not None and timestamp < last_change:
+        return tracker.last_known_state
+
+    # Determine the current state from the luma histogram
+    current_state = classify_light(reading, tracker.last_known_state)
+    current_time = timestamp
+
+    # Track time spent in dark environment
+    if current_state == "dark":
+        if tracker.dark_environment_start_time is None:
+            tracker.dark_environment_start_time = current_time
+        elif current_time - tracker.dark_environment_start_time > 5:  # If in dark for more than 5 seconds
+            notifier.notify(tracker.session_id, "ambient")
+    else:  # Reset dark environment timer when it's bright
+        tracker.dark_environment_start_time = None
+
+    # Check if the state has changed
+    if tracker.last_known_state is None:
+        # Initialize the last known state
+        tracker.last_known_state = current_state
+        tracker.amb_light_data["timestamp"] = current_time  # Store initial timestamp
+        tracker.light_events.append(**tracker.amb_light_data)  # Store initial state
+        tracker.rollup.dark = current_state == "dark"
+    elif current_state != tracker.last_known_state:
+        # State has changed, update the timestamp and state
+        tracker.amb_light_data["ambient_light"] = current_state
+        tracker.amb_light_data["timestamp"] = current_time
+        tracker.last_known_state = current_state  # Update the last known state
+        tracker.light_events.append(**tracker.amb_light_data)  # Store state change
+        tracker.rollup.dark = current_state == "dark"
+
+    return current_state
+
+
+
+def detect_blink(tracker, landmarks, timestamp):
     """
     Detect if the person is blinking by calculating the eye aspect ratio (EAR)
-    Returns: Object with blinks and blink_timestamps
+    timestamp is the frame's capture time. EAR is smoothed over capture
+    times and compared with thresholds relative to the session's open-eye
+    baseline, with hysteresis (see BlinkDetector).
+    Returns: Object with is_blinking, the average EAR and the running blink count
     """
-
-    # Indices for the eye landmarks (vertical and horizontal points)
-    LEFT_EYE = [362, 385, 387, 373, 380, 374]
-    RIGHT_EYE = [33, 160, 158, 133, 153, 144]
-    
-    def calculate_ear(eye_points):
-        # Convert normalized coordinates to pixel coordinates
-        points = []
-        for idx in eye_points:
-            landmark = face_landmarks.landmark[idx]
-            x = int(landmark.x * img_w)
-            y = int(landmark.y * img_h)
-            points.append((x, y))
-        
-        # Calculate the eye aspect ratio
-        # EAR = (||p2-p6|| + ||p3-p5||) / (2||p1-p4||)
-        vertical_dist1 = np.linalg.norm(np.array(points[1]) - np.array(points[5]))
-        vertical_dist2 = np.linalg.norm(np.array(points[2]) - np.array(points[4]))
-        horizontal_dist = np.linalg.norm(np.array(points[0]) - np.array(points[3]))
-        
-        # EAR should not be 0 (if points are too close)
-        ear = (vertical_dist1 + vertical_dist2) / (2.0 * horizontal_dist) if horizontal_dist > 0 else 0
-        return ear
-    
-    # Calculate EAR for both eyes
-    left_ear = calculate_ear(LEFT_EYE)
-    right_ear = calculate_ear(RIGHT_EYE)
-    
     # Average EAR of both eyes
-    avg_ear = (left_ear + right_ear) / 2.0
-    
-    # Dynamic threshold adjustment based on current average EAR (could be optimized with training)
-    EAR_THRESHOLD = 0.25  # Threshold decreases when the person is blinking more
-    
-    # Convert numpy.bool_ to Python bool before returning
-    is_blinking = bool(avg_ear < EAR_THRESHOLD)
+    avg_ear = tracker.ear_filter(float(eye_aspect_ratios(landmarks).mean()), timestamp)
 
-    current_time = time.time()
+    blink_started = tracker.blink_detector.update(avg_ear, timestamp)
+    is_blinking = tracker.blink_detector.closed
+
+    current_time = timestamp
+    if tracker.last_blink_time is None:
+        tracker.last_blink_time = current_time
 
     # Check if this is the start of a new blink
-    if is_blinking and not is_currently_blinking:
-        # Only count this as a new blink if enough time has passed since the last blink
-        if not blink_timestamps or current_time - blink_timestamps[-1] >= 0.25:
-            blink_counter += 1
-            blink_timestamps.append(current_time)
-            last_blink_time = current_time
-            print(f"Blink detected! EAR: {avg_ear:.3f}, Count: {blink_counter}")
-        
-        # Update the blinking state
-        is_currently_blinking = True
-    
+    if blink_started:
+        tracker.blink_counter += 1
+        tracker.blink_events.append(timestamp=current_time)
+        tracker.blink_stats.add(current_time)
+        tracker.rollup.blink()
+        tracker.last_blink_time = current_time
+        logger.debug("Blink detected! EAR: %.3f, Count: %d", avg_ear, tracker.blink_counter)
+
     # If the person is not blinking anymore, update the state
-    elif not is_blinking and is_currently_blinking:
-        is_currently_blinking = False
-        print("Blink ended")
-    
-    else:
-        # Check if it's been more than 5 seconds since the last blink
-        if current_time - last_blink_time > 5:
-            send_blink_reminder_notification()
-        
+    elif not is_blinking and tracker.is_currently_blinking:
+        logger.debug("Blink ended")
+
+    # Check if it's been more than 5 seconds since the last blink
+    elif not is_blinking and current_time - tracker.last_blink_time > 5:
+        notifier.notify(tracker.session_id, "blink")
+
+    tracker.is_currently_blinking = is_blinking
     return {
         "is_blinking": is_blinking,
-        "blink_timestamps": blink_timestamps
+        "ear": avg_ear,
+        "blink_count": tracker.blink_counter
     }
 
-@app.post("/api/py/detect-eye-direction")
-async def detect_direction(request: Request):
-    global direction_changes, last_known_direction, last_change_time
+# Distances (cm) below which the user is "close" and above which "far"
+DISTANCE_CLOSE_CM = 50
+DISTANCE_FAR_CM = 100
+
+
+def classify_distance(distance):
+    """Map a distance in centimeters to "close", "med" or "far"."""
+    if distance < DISTANCE_CLOSE_CM:
+        return "close"
+    elif distance <= DISTANCE_FAR_CM:
+        return "med"
+    return "far"
 
+
+def check_distance(tracker, landmarks, timestamp, img_w):
+    """
+    Estimate the distance between user and screen from the iris size, which
+    barely varies between people and, unlike face height, does not shrink
+    when the head tilts. The focal length comes from the user's calibration
+    (see /api/py/calibrate-distance) or a typical webcam's. While a
+    calibration runs, the frame is also added to it.
+    timestamp is the frame's capture time; the distance is smoothed over
+    capture times.
+    Returns distance in centimeters
+    """
+    # Mean iris diameter of both eyes, as a fraction of the image width
+    iris_ratio = float(iris_diameters(landmarks).mean()) / img_w
+    if iris_ratio <= 0:
+        return None
+
+    if tracker.calibration is not None:
+        focal_ratio = tracker.calibration.add(iris_ratio)
+        if focal_ratio is not None:
+            tracker.distance_profile = distance_profiles.put(
+                tracker.session_id, focal_ratio, tracker.calibration.distance_cm
+            )
+            tracker.calibration = None
+            tracker.distance_filter.reset()  # Earlier estimates used the old focal length
+            logger.info("Distance calibrated for %s: focal ratio %.3f", tracker.session_id, focal_ratio)
+
+    focal_ratio = tracker.distance_profile["focal_ratio"] if tracker.distance_profile else DEFAULT_FOCAL_RATIO
+    distance = tracker.distance_filter(iris_distance_cm(iris_ratio, focal_ratio), timestamp)
+
+    # Determine the current distance state
+    current_distance_state = classify_distance(distance)
+    if current_distance_state == "close":
+        # Send notification when user is too close
+        notifier.notify(tracker.session_id, "distance")
+
+    # Check if the distance state has changed
+    current_time = timestamp
+    if tracker.last_known_distance_state is None:
+        # Initialize the last known distance state
+        tracker.last_known_distance_state = current_distance_state
+        tracker.state_start_time = current_time  # Initialize the start time
+        tracker.rollup.distance = current_distance_state
+    elif current_distance_state != tracker.last_known_distance_state and current_time > tracker.state_start_time:
+        # State has changed, log the time spent in the previous state
+
+        tracker.distance_events.append(
+            distance=tracker.last_known_distance_state,
+            start_time=tracker.state_start_time,
+            end_time=current_time,
+        )
+        tracker.distance_stats.add(tracker.last_known_distance_state, tracker.state_start_time, current_time)
+        # Update the last known state and start time
+        tracker.last_known_distance_state = current_distance_state
+        tracker.state_start_time = current_time
+        tracker.rollup.distance = current_distance_state
+
+    return distance
+
+
+LANDMARK_ANALYZERS = ("direction", "blink", "distance")
+
+
+def measure_frame(tracker, analysis, analyzers=ANALYZERS):
+    """
+    The per-frame measurements the requested analyzers need: a LightReading
+    (or None) and the landmark array (None without a face or when no
+    analyzer needs it). FaceMesh only runs if a landmark analyzer was requested.
+    """
+    reading = landmarks = None
+    if "light" in analyzers:
+        with timed("light"):
+            reading = measure_light(analysis.luma_sample())
+    if any(name in analyzers for name in LANDMARK_ANALYZERS):
+        # Motion gating, cropping and the models; their parts are timed as their own stages too
+        with timed("landmarks"):
+            landmarks = tracker.motion_gate.process(analysis)
+        tracker.roi = analysis.roi
+    return reading, landmarks
+
+
+def analyze_frame(tracker, analysis, analyzers=ANALYZERS):
+    """
+    Run the requested analyzers over one FrameAnalysis for a session. The
+    result's next_sample_ms has the sampling interval hint of each analyzer.
+    """
+    reading, landmarks = measure_frame(tracker, analysis, analyzers)
+    result = analyze_measurements(tracker, analysis.timestamp, analysis.img_w, reading, landmarks, analyzers)
+    result["next_sample_ms"] = sample_hints(tracker, analyzers, analysis.timestamp, reading)
+    return result
+
+
+def sample_hints(tracker, analyzers, timestamp, reading=None):
+    """
+    When each analyzer needs its next frame (ms), from how close the
+    session's latest measurements are to changing its state, how long the
+    state has held and the inference load (see api/sampling.py). Analyzers
+    without a measurement yet get their default interval.
+    """
+    load = inference.load()
+    hints = {}
+    if "blink" in analyzers:
+        margin = 1.0
+        if tracker.ear_filter.value is not None:
+            close_threshold, open_threshold = tracker.blink_detector.thresholds()
+            margin = blink_margin(
+                tracker.ear_filter.value, tracker.ear_filter.derivative, close_threshold, open_threshold,
+                tracker.blink_detector.closed,
+            )
+        hints["blink"] = interval_ms("blink", margin, load=load)
+    if "direction" in analyzers:
+        margin, stable = 1.0, 0.0
+        if tracker.pupil_filter.value is not None:
+            margin = boundary_margin(
+                tracker.pupil_filter.value, (DIRECTION_RIGHT_RATIO, DIRECTION_LEFT_RATIO), DIRECTION_MARGIN
+            )
+            stable = timestamp - tracker.last_change_time
+        hints["direction"] = interval_ms("direction", margin, stable, load)
+    if "light" in analyzers:
+        margin, stable = 1.0, 0.0
+        if reading is not None and tracker.last_known_state is not None:
+            margin = light_margin(reading, tracker.last_known_state)
+            stable = timestamp - tracker.amb_light_data["timestamp"]
+        hints["light"] = interval_ms("light", margin, stable, load)
+    if "distance" in analyzers:
+        margin, stable = 1.0, 0.0
+        distance = tracker.distance_filter.value
+        if distance is not None and tracker.last_known_distance_state is not None:
+            margin = boundary_margin(distance, (DISTANCE_CLOSE_CM, DISTANCE_FAR_CM), DISTANCE_MARGIN_CM)
+            # Too close keeps the default pace; the distance notification depends on it
+            if tracker.last_known_distance_state != "close":
+                stable = timestamp - tracker.state_start_time
+        hints["distance"] = interval_ms("distance", margin, stable, load)
+    return hints
+
+
+def analyze_measurements(tracker, timestamp, img_w, reading, landmarks, analyzers=ANALYZERS):
+    """
+    Update a session's analyzers with the measurements of a frame captured
+    at timestamp (see measure_frame), in capture order. Returns the frame's result.
+    """
+    result = {}
+    # Credit the time since the previous frame to the session's per-minute totals
+    tracker.rollup.advance(timestamp)
+
+    if "light" in analyzers:
+        result["brightness"] = reading.brightness
+        result["exposure"] = reading.exposure
+        result["amb_light"] = update_ambient_light(tracker, reading, timestamp)
+
+    if not any(name in analyzers for name in LANDMARK_ANALYZERS):
+        return result
+
+    result["face_detected"] = landmarks is not None
+
+    if "direction" in analyzers:
+        result["direction"] = "unknown"
+    if "blink" in analyzers:
+        result["is_blinking"] = False
+        result["ear"] = None
+    if "distance" in analyzers:
+        result["distance_cm"] = None
+
+    if landmarks is None:
+        return result
+
+    if "direction" in analyzers:
+        with timed("direction"):
+            result["direction"] = detect_eye_direction(tracker, landmarks, timestamp)
+    if "blink" in analyzers:
+        with timed("blink"):
+            blink_result = detect_blink(tracker, landmarks, timestamp)
+        result["is_blinking"] = bool(blink_result["is_blinking"])
+        result["ear"] = blink_result["ear"]
+    if "distance" in analyzers:
+        with timed("distance"):
+            result["distance_cm"] = check_distance(tracker, landmarks, timestamp, img_w)
+
+    return result
+
+
+def run_analysis(tracker, frame, analyzers, timestamp=None):
+    """
+    Decode a frame (data URL or RawFrame) captured at timestamp (default: now)
+    and analyze it for a session. Runs on an inference worker.
+    """
+    with tracker.lock, timed("frame"):
+        with timed("decode"):
+            # Frames only checked for light are decoded small and gray
+            decoded = decode_input(frame, light_only=tuple(analyzers) == ("light",))
+        analysis = FrameAnalysis(
+            **decoded, face_mesh=tracker.face_mesh, roi=tracker.roi,
+            face_detection=tracker.face_detection, timestamp=timestamp, keyframes=tracker.landmark_tracker
+        )
+        return analyze_frame(tracker, analysis, analyzers)
+
+
+def since_cursor(data, events):
+    """
+    Event cursor for a frame request: the client's `since` sequence number,
+    or the newest event before this frame so only events it produces are returned.
+    The full history is only served by /api/py/session-data.
+    """
+    since = data.get("since")
+    return events.total if since is None else int(since)
+
+
+def last_known_result(tracker, analyzers):
+    """A session's latest state for the analyzers, in analyze_frame's fields, without a new frame."""
+    result = {}
+    if "light" in analyzers:
+        result["amb_light"] = tracker.amb_light_data["ambient_light"]
+    if "direction" in analyzers:
+        result["direction"] = tracker.last_known_direction or "unknown"
+    if "blink" in analyzers:
+        result["is_blinking"] = tracker.is_currently_blinking
+    if "distance" in analyzers:
+        result["distance_cm"] = tracker.distance_filter.value
+    result["next_sample_ms"] = sample_hints(tracker, analyzers, time.time())
+    return result
+
+
+def dropped_response(tracker, analyzers, hint=None, **fields):
+    """
+    Response for a frame that was replaced by a newer one before it was
+    processed. It carries the session's last known state, so clients keep
+    showing it; with hint, next_sample_ms is that analyzer's hint alone.
+    """
+    state = last_known_result(tracker, analyzers)
+    if hint is not None:
+        state["next_sample_ms"] = state["next_sample_ms"][hint]
+    return {"status": "dropped", **state, **fields}
+
+
+# Frame endpoints answer in JSON, or in MessagePack for `Accept: application/msgpack`;
+# their response_model only documents the schema (see api/schemas.py)
+FRAME_RESPONSES = {200: {"content": {MSGPACK_MEDIA_TYPE: {}}}}
+
+
+@app.post("/api/py/analyze-frame", response_model=FrameAnalysisResponse, responses=FRAME_RESPONSES)
+async def analyze_frame_endpoint(request: Request):
+    try:
+        data, frame = await read_frame_request(request)
+        analyzers = data.get("analyzers") or list(ANALYZERS)
+        if isinstance(analyzers, str):  # Query string or form field: comma-separated
+            analyzers = analyzers.split(",")
+        unknown = [name for name in analyzers if name not in ANALYZERS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown analyzers: {', '.join(unknown)}")
+
+        tracker = sessions.get(session_id_from(data))
+        response_data = await inference.submit(
+            tracker.session_id, run_analysis, tracker, frame, analyzers, frame_timestamp(data),
+            kind=tuple(analyzers),
+        )
+
+        frame_logger.debug("analyze-frame: %s", response_data)
+        return encode_response(request, response_data)
+
+    except FrameDropped:
+        return encode_response(request, dropped_response(tracker, analyzers))
+    except HTTPException:
+        raise  # Unsupported body or unknown analyzers
+    except Exception as e:
+        logger.error("Error analyzing frame: %s", e)
+        return encode_response(request, {"error": str(e), "status": "error"})
+
+@app.post("/api/py/detect-eye-direction", response_model=DirectionResponse, responses=FRAME_RESPONSES)
+async def detect_direction(request: Request):
     try:
         # Get the frame data from the request
-        data = await request.json()
-        image_data = data['frame'].split(',')[1]  # Remove the data URL prefix
+        data, frame = await read_frame_request(request)
+        tracker = sessions.get(session_id_from(data))
+        since = since_cursor(data, tracker.direction_events)
         
-        # Decode base64 image
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Get image dimensions
-        img_h, img_w = frame.shape[:2]
-        
-        # Convert the BGR image to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Process the frame and detect facial landmarks
-        results = face_mesh.process(rgb_frame)
+        # Gaze and blink share the same FaceMesh pass
+        result = await inference.submit(
+            tracker.session_id, run_analysis, tracker, frame, ("direction", "blink"), frame_timestamp(data),
+            kind=("direction", "blink"),
+        )
         
         response_data = {
-            "direction": "unknown",
-            "is_blinking": False,
-            "direction_changes": direction_changes 
+            "direction": result["direction"],
+            "is_blinking": result["is_blinking"],
+            "direction_changes": tracker.direction_events.records(since),
+            "cursor": tracker.direction_events.total,
+            "next_sample_ms": result["next_sample_ms"]["direction"],
         }
         
-        if results.multi_face_landmarks:
-            face_landmarks = results.multi_face_landmarks[0]
-            
-            # Detect eye direction
-            response_data["direction"] = detect_eye_direction(frame)
-            
-            # Detect blink and extract is_blinking from the returned dictionary
-            blink_result = detect_blink(face_landmarks, img_w, img_h)
-            response_data["is_blinking"] = bool(blink_result["is_blinking"])
-        
-        print(response_data)
-        return response_data
+        frame_logger.debug("detect-eye-direction: %s", response_data)
+        return encode_response(request, response_data)
         
+    except FrameDropped:
+        return encode_response(request, dropped_response(
+            tracker, ("direction", "blink"), "direction", direction_changes=[], cursor=since
+        ))
+    except HTTPException:
+        raise  # Unsupported body
     except Exception as e:
-        print(f"Error processing frame: {str(e)}")
-        return {"error": str(e), "status": "error", "direction_changes": direction_changes}
+        logger.error("Error processing frame: %s", e)
+        return encode_response(request, {"error": str(e), "status": "error", "direction_changes": []})
 
-@app.post("/api/py/detect-blink")
+@app.post("/api/py/detect-blink", response_model=BlinkResponse, responses=FRAME_RESPONSES)
 async def detect_blink_endpoint(request: Request):
-    global blink_timestamps, blink_counter, is_currently_blinking
     try:
         # Get the frame data from the request
-        data = await request.json()
-        image_data = data['frame'].split(',')[1]  # Remove the data URL prefix
-        
-        # Decode base64 image
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Get image dimensions
-        img_h, img_w = frame.shape[:2]
+        data, frame = await read_frame_request(request)
+        tracker = sessions.get(session_id_from(data))
+        since = since_cursor(data, tracker.blink_events)
         
-        # Convert the BGR image to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        result = await inference.submit(
+            tracker.session_id, run_analysis, tracker, frame, ("blink",), frame_timestamp(data),
+            kind=("blink",),
+        )
         
-        # Process the frame and detect facial landmarks
-        results = face_mesh.process(rgb_frame)
-        
-        # Default response
         response = {
-            "is_blinking": False,
-            "blink_timestamps": []
+            "is_blinking": result["is_blinking"],
+            "blink_timestamps": tracker.blink_events.column("timestamp", since),
+            "cursor": tracker.blink_events.total,
+            "next_sample_ms": result["next_sample_ms"]["blink"],
         }
+        frame_logger.debug("detect-blink: %s", response)
+        return encode_response(request, response)
         
-        if results.multi_face_landmarks:
-            face_landmarks = results.multi_face_landmarks[0]
-            # Get the result dictionary from detect_blink
-            blink_result = detect_blink(face_landmarks, img_w, img_h)
-            response = blink_result  # Use the complete result dictionary
-        print(response)
-        return response
-        
+    except FrameDropped:
+        return encode_response(request, dropped_response(tracker, ("blink",), "blink", blink_timestamps=[], cursor=since))
+    except HTTPException:
+        raise  # Unsupported body
     except Exception as e:
-        print(f"Error processing frame for blink: {str(e)}")
-        return {"error": str(e), "status": "error", "is_blinking": False, "blink_timestamps": []}
+        logger.error("Error processing frame for blink: %s", e)
+        return encode_response(request, {"error": str(e), "status": "error", "is_blinking": False, "blink_timestamps": []})
 
 
-@app.post("/api/py/detect-ambient-light")
+@app.post("/api/py/detect-ambient-light", response_model=AmbientLightResponse, responses=FRAME_RESPONSES)
 async def detect_ambient_light_endpoint(request: Request):
-    global last_known_state, state_changes, last_change_time, dark_environment_start_time
-
     try:
         # Get the frame data from the request
-        data = await request.json()
-        image_data = data['frame'].split(',')[1]  # Remove the data URL prefix
-        
-        # Decode base64 image
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        data, frame = await read_frame_request(request)
+        tracker = sessions.get(session_id_from(data))
+        since = since_cursor(data, tracker.light_events)
         
         # Calculate ambient light regardless of face detection
-        brightness = process_ambient_light(frame)
-        
-        # Determine the current state based on brightness
-        current_state = "light" if brightness >= 70 else "dark"
-        current_time = time.time()
-        
-        # Track time spent in dark environment
-        if current_state == "dark":
-            if dark_environment_start_time is None:
-                dark_environment_start_time = current_time
-            elif current_time - dark_environment_start_time > 5:  # If in dark for more than 5 seconds
-                send_ambient_light_warning_notification()
-        else:  # Reset dark environment timer when it's bright
-            dark_environment_start_time = None
-        
-        # Check if the state has changed
-        if last_known_state is None:
-            # Initialize the last known state
-            last_known_state = current_state
-            amb_light_data["timestamp"] = current_time  # Store initial timestamp
-            state_changes.append(amb_light_data.copy())  # Store initial state
-        elif current_state != last_known_state:
-            # State has changed, update the timestamp and state
-            amb_light_data["ambient_light"] = current_state
-            amb_light_data["timestamp"] = current_time
-            last_known_state = current_state  # Update the last known state
-            state_changes.append(amb_light_data.copy())  # Store state change
+        result = await inference.submit(
+            tracker.session_id, run_analysis, tracker, frame, ("light",), frame_timestamp(data),
+            kind=("light",),
+        )
         
         response_data = {
-            "amb_light": amb_light_data["ambient_light"],
-            "timestamp": amb_light_data["timestamp"],
-            "state_changes": state_changes  # Include state changes in the response
+            "amb_light": tracker.amb_light_data["ambient_light"],
+            "timestamp": tracker.amb_light_data["timestamp"],
+            "state_changes": tracker.light_events.records(since),  # Include new state changes in the response
+            "cursor": tracker.light_events.total,
+            "next_sample_ms": result["next_sample_ms"]["light"],
         }
-        print(response_data)
-        return response_data
+        frame_logger.debug("detect-ambient-light: %s", response_data)
+        return encode_response(request, response_data)
         
+    except FrameDropped:
+        return encode_response(request, dropped_response(
+            tracker, ("light",), "light", timestamp=tracker.amb_light_data["timestamp"], state_changes=[], cursor=since
+        ))
+    except HTTPException:
+        raise  # Unsupported body
     except Exception as e:
-        print(f"Error processing frame for ambient light: {str(e)}")
-        return {"error": str(e), "status": "error"}
-
-def check_distance(frame):
-    global last_known_distance_state, distance_changes, state_start_time
-
-    """
-    Calculate the distance between user and screen using facial landmarks.
-    Returns distance in centimeters
-    """
-    # Define key point indices (MediaPipe face mesh indices)
-    FOREHEAD_TOP = 10    # Forehead top key point
-    NOSE_TIP = 4         # Nose tip key point
-    REAL_VERTICAL_DISTANCE = 8.0  # Actual vertical distance from forehead to nose tip (in centimeters, needs user measurement)
-    FOCAL_LENGTH = 700            # Example value, needs recalibration!
-
-    print("Running check_distance")
-    # Convert image format and detect facial key points
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = face_mesh.process(rgb_frame)
-
-    distance = None
-
-    if results.multi_face_landmarks:
-        face_landmarks = results.multi_face_landmarks[0]
-
-        # Get key point coordinates
-        forehead = face_landmarks.landmark[FOREHEAD_TOP]
-        nose_tip = face_landmarks.landmark[NOSE_TIP]
-
-        # Calculate vertical pixel distance (forehead to nose tip)
-        ih, iw, _ = frame.shape
-        y1 = int(forehead.y * ih)  # Forehead Y coordinate
-        y2 = int(nose_tip.y * ih)   # Nose tip Y coordinate
-        pixel_distance = abs(y2 - y1)
-
-        # Calculate actual distance
-        if pixel_distance > 0:
-            distance = (REAL_VERTICAL_DISTANCE * FOCAL_LENGTH) / pixel_distance
-
-        # Determine the current distance state
-        if distance < 50:
-            current_distance_state = "close"
-            # Send notification when user is too close
-            send_distance_warning_notification()
-        elif 50 <= distance <= 100:
-            current_distance_state = "med"
-        else:
-            current_distance_state = "far"
-
-        # Check if the distance state has changed
-        current_time = time.time()
-        if last_known_distance_state is None:
-            # Initialize the last known distance state
-            last_known_distance_state = current_distance_state
-            state_start_time = current_time  # Initialize the start time
-        elif current_distance_state != last_known_distance_state:
-            # State has changed, log the time spent in the previous state
-
-            distance_changes.append({
-                "distance": last_known_distance_state,
-                "start_time": state_start_time,
-                "end_time": current_time,
-            })
-            # Update the last known state and start time
-            last_known_distance_state = current_distance_state
-            state_start_time = current_time
-
-        # Visualize key points (optional)
-        cv2.line(frame, (0, y1), (iw, y1), (0, 255, 0), 1)
-        cv2.line(frame, (0, y2), (iw, y2), (0, 0, 255), 1)
-        cv2.putText(frame, f"{distance:.2f} cm", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-
-    return distance
+        logger.error("Error processing frame for ambient light: %s", e)
+        return encode_response(request, {"error": str(e), "status": "error"})
 
 
-@app.post("/api/py/check-distance")
+@app.post("/api/py/check-distance", response_model=DistanceResponse, responses=FRAME_RESPONSES)
 async def check_distance_endpoint(request: Request):
-    global distance_changes
-
     try:
         # Get the frame data from the request
-        data = await request.json()
-        image_data = data['frame'].split(',')[1]  # Remove the data URL prefix
-        
-        # Decode base64 image
-        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        data, frame = await read_frame_request(request)
+        tracker = sessions.get(session_id_from(data))
+        since = since_cursor(data, tracker.distance_events)
         
         # Check distance
-        distance_cm = check_distance(frame)
+        result = await inference.submit(
+            tracker.session_id, run_analysis, tracker, frame, ("distance",), frame_timestamp(data),
+            kind=("distance",),
+        )
+        distance_cm = result["distance_cm"]
         
         response_data = {
             "distance_cm": distance_cm,
-            "distance_changes": distance_changes  # Include distance changes in the response
-
+            "distance_changes": tracker.distance_events.records(since),  # Include new distance changes in the response
+            "cursor": tracker.distance_events.total,
+            "next_sample_ms": result["next_sample_ms"]["distance"],
         }
         
-        print(f"Distance: {distance_cm:.2f} cm")
-        return response_data
+        frame_logger.debug("check-distance: %s cm", distance_cm)
+        return encode_response(request, response_data)
         
+    except FrameDropped:
+        return encode_response(request, dropped_response(tracker, ("distance",), "distance", distance_changes=[], cursor=since))
+    except HTTPException:
+        raise  # Unsupported body
+    except Exception as e:
+        logger.error("Error processing frame for distance check: %s", e)
+        return encode_response(request, {"error": str(e), "status": "error"})
+
+def start_calibration(session_id, distance_cm, samples):
+    """Start a session's calibration once its frame in progress is done. Blocking; runs off the event loop."""
+    tracker = sessions.get(session_id)
+    with tracker.lock:
+        tracker.calibration = Calibration(distance_cm, samples)
+        return tracker.calibration.status()
+
+
+def calibration_status(session_id):
+    """Progress of a session's calibration, or its profile. Loading the profile reads a file."""
+    tracker = sessions.get(session_id)
+    calibration = tracker.calibration
+    if calibration is not None:
+        return calibration.status()
+    if tracker.distance_profile is None:
+        return {"status": "uncalibrated", "focal_ratio": DEFAULT_FOCAL_RATIO}
+    return {"status": "calibrated", **tracker.distance_profile}
+
+
+@app.post("/api/py/calibrate-distance")
+async def calibrate_distance(request: Request):
+    """
+    Start a distance calibration: the user sits `distance_cm` from the camera
+    (default CALIBRATION_DISTANCE_CM) while the next `samples` frames with a
+    face are sent to any endpoint that checks distance. The resulting focal
+    length is kept as the user's profile.
+    """
+    try:
+        data = await request.json()
+        distance_cm = float(data.get("distance_cm", CALIBRATION_DISTANCE_CM))
+        samples = int(data.get("samples", CALIBRATION_SAMPLES))
+    except (ValueError, TypeError, OverflowError, AttributeError):  # Malformed JSON, a non-object body or non-numeric values
+        raise HTTPException(status_code=400, detail="Expected a JSON object with numeric distance_cm and samples")
+    if not CALIBRATION_RANGE_CM[0] <= distance_cm <= CALIBRATION_RANGE_CM[1]:
+        raise HTTPException(status_code=400, detail=f"distance_cm must be within {CALIBRATION_RANGE_CM}")
+    if samples < 1:
+        raise HTTPException(status_code=400, detail="samples must be positive")
+    return await asyncio.to_thread(start_calibration, session_id_from(data), distance_cm, samples)
+
+
+@app.get("/api/py/calibrate-distance")
+async def get_distance_calibration(userId: str = DEFAULT_SESSION_ID):
+    """Progress of a running calibration, or the user's profile."""
+    return await asyncio.to_thread(calibration_status, userId)
+
+
+def stream_state(result):
+    """Reduce an analyze_frame result to the compact state sent over the stream."""
+    state = {}
+    for name in ("direction", "is_blinking", "amb_light"):
+        if name in result:
+            state[name] = result[name]
+    if "distance_cm" in result:
+        distance_cm = result["distance_cm"]
+        state["distance"] = classify_distance(distance_cm) if distance_cm is not None else None
+    # Every frame feeds all the stream's analyzers, so the one needing frames soonest sets the pace
+    if result.get("next_sample_ms"):
+        state["next_sample_ms"] = min(result["next_sample_ms"].values())
+    return state
+
+
+def parse_stream_config(text):
+    """
+    Validated settings of a stream config message (JSON text).
+    Raises ValueError for malformed JSON or invalid values.
+    """
+    update = json.loads(text)
+    if not isinstance(update, dict):
+        raise ValueError("Config must be a JSON object")
+    settings = {}
+    if "analyzers" in update:
+        analyzers = update["analyzers"]
+        if not isinstance(analyzers, list):
+            raise ValueError("analyzers must be a list")
+        unknown = [str(name) for name in analyzers if name not in ANALYZERS]
+        if unknown:
+            raise ValueError(f"Unknown analyzers: {', '.join(unknown)}")
+        settings["analyzers"] = analyzers
+    if "format" in update:
+        if update["format"] not in FRAME_FORMATS:
+            raise ValueError(f"Unsupported frame format: {update['format']}")
+        settings["format"] = update["format"]
+    for key in ("width", "height"):
+        if key in update:
+            value = update[key]
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                raise ValueError(f"{key} must be a positive integer")
+            settings[key] = value
+    return settings
+
+
+@app.websocket("/api/py/stream")
+async def stream_frames(websocket: WebSocket):
+    """
+    Streaming frame ingest.
+    Binary messages are frames (JPEG by default, or raw gray, RGB or RGBA
+    after a config message). Text messages are JSON config updates:
+        {"analyzers": [...], "format": "jpeg" | "gray" | "rgb" | "rgba", "width": w, "height": h}
+    Only the newest unprocessed frame is kept; older ones are dropped. The
+    server replies with the fields of the compact state that changed.
+    Frames are tracked under the session given by the userId query parameter.
+    """
+    await websocket.accept()
+
+    analyzers = websocket.query_params.get("analyzers")
+    config = {
+        "analyzers": analyzers.split(",") if analyzers else list(ANALYZERS),
+        "format": websocket.query_params.get("format", "jpeg"),
+        "width": None,
+        "height": None,
+    }
+
+    # The session's FaceMesh keeps its tracking state warm between frames
+    session_id = websocket.query_params.get("userId") or DEFAULT_SESSION_ID
+    if ownership:
+        # The stream cannot be forwarded, so the session moves to the worker it connected to
+        await asyncio.to_thread(ownership.take, session_id)
+
+    latest_frame = None
+    frame_ready = asyncio.Event()
+    frames_received = 0
+    frames_dropped = 0
+    connected = True
+
+    async def receive_frames():
+        nonlocal latest_frame, frames_received, frames_dropped, connected
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    frames_received += 1
+                    if latest_frame is not None:
+                        frames_dropped += 1  # Replace the stale frame
+                    latest_frame = (message["bytes"], time.time())  # Timestamped on arrival
+                    frame_ready.set()
+                elif message.get("text") is not None:
+                    try:
+                        config.update(parse_stream_config(message["text"]))
+                    except ValueError as e:  # Includes malformed JSON
+                        await websocket.send_json({"error": str(e)})
+        finally:
+            connected = False
+            frame_ready.set()
+
+    def process(tracker, payload, received_at, frame_config):
+        with timed("frame"):
+            with timed("decode"):
+                decoded = decode_frame_bytes(
+                    payload, frame_config["format"], frame_config["width"], frame_config["height"],
+                    light_only=tuple(frame_config["analyzers"]) == ("light",),
+                )
+            with tracker.lock:
+                analysis = FrameAnalysis(
+                    **decoded, face_mesh=tracker.face_mesh, roi=tracker.roi,
+                    face_detection=tracker.face_detection, timestamp=received_at,
+                    keyframes=tracker.landmark_tracker,
+                )
+                return stream_state(analyze_frame(tracker, analysis, frame_config["analyzers"]))
+
+    receiver = asyncio.create_task(receive_frames())
+    last_sent = {}
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if not connected:
+                break
+            frame, latest_frame = latest_frame, None
+            if frame is None:
+                continue
+            payload, received_at = frame
+
+            try:
+                tracker = sessions.get(session_id)
+                state = await inference.submit(session_id, process, tracker, payload, received_at, dict(config))
+            except FrameDropped:
+                frames_dropped += 1
+                continue
+            except Exception as e:
+                logger.error("Error processing stream frame: %s", e)
+                await websocket.send_json({"error": str(e), "status": "error"})
+                continue
+
+            changes = {key: value for key, value in state.items() if last_sent.get(key, object()) != value}
+            if changes:
+                last_sent.update(changes)
+                changes["frame"] = frames_received
+                changes["dropped"] = frames_dropped
+                await websocket.send_json(changes)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        # Retrieve the receiver's outcome so its failures are logged, not lost
+        outcome, = await asyncio.gather(receiver, return_exceptions=True)
+        if isinstance(outcome, Exception):
+            logger.error("Stream receiver failed: %s", outcome)
+
+@app.get("/api/py/inference-stats")
+async def get_inference_stats():
+    """Inference pool size, queue depth, drop counts, motion-gating skip ratio and keyframe ratio, for sizing workers under load."""
+    return {
+        **inference.stats(),
+        "sessions": len(sessions),
+        "notifications": notifier.stats(),
+        "motion": motion_stats.stats(),
+        "keyframes": keyframe_stats.stats(),
+        "models": {"face_mesh": face_mesh_pool.stats(), "face_detection": face_detection_pool.stats()},
+    }
+
+
+@app.post("/api/py/warmup")
+async def warmup(count: int = 1):
+    """
+    Build and run `count` models of each kind ahead of the first frames,
+    e.g. from a deploy hook or a scheduled ping on scale-to-zero platforms.
+    """
+    seconds = await asyncio.to_thread(warm_up, model_pools, count)
+    return {"seconds": seconds, "face_mesh": face_mesh_pool.stats(), "face_detection": face_detection_pool.stats()}
+
+@app.get("/api/py/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage latency histograms and pipeline counters in the Prometheus text format."""
+    pool = inference.stats()
+    notifications = notifier.stats()
+    motion = motion_stats.stats()
+    keyframes = keyframe_stats.stats()
+    lines = [
+        *stage_seconds.render(),
+        *render_values("eyecare_sessions", "Live sessions", "gauge", len(sessions)),
+        *render_values("eyecare_inference_workers", "Inference worker threads", "gauge", pool["workers"]),
+        *render_values("eyecare_inference_queue_depth", "Frames waiting for a worker", "gauge", pool["queue_depth"]),
+        *render_values("eyecare_inference_in_flight", "Frames on a worker", "gauge", pool["in_flight"]),
+        *render_values(
+            "eyecare_inference_frames_total", "Frames by outcome", "counter",
+            {
+                outcome: pool[outcome]
+                for outcome in ("completed", "failed", "dropped_stale", "dropped_overflow", "dropped_expired")
+            },
+            label="outcome",
+        ),
+        *render_values("eyecare_notifications_queued", "Alerts waiting to be sent", "gauge", notifications["queued"]),
+        *render_values(
+            "eyecare_notifications_total", "Notifications by outcome", "counter",
+            {outcome: notifications[outcome] for outcome in ("sent", "failed", "coalesced")},
+            label="outcome",
+        ),
+        *render_values(
+            "eyecare_motion_frames_total", "Frames seen by the motion gate by decision", "counter",
+            {"processed": motion["frames"] - motion["skipped"], "skipped": motion["skipped"]},
+            label="decision",
+        ),
+        *render_values(
+            "eyecare_motion_eye_forced_total", "Frames processed only because the eye region changed", "counter",
+            motion["eye_motion"],
+        ),
+        *render_values(
+            "eyecare_landmark_frames_total", "Frames whose landmarks came from FaceMesh or from tracking", "counter",
+            {"keyframe": keyframes["keyframes"], "tracked": keyframes["frames"] - keyframes["keyframes"]},
+            label="source",
+        ),
+        *render_values(
+            "eyecare_landmark_lost_total", "Keyframes forced by a tracking error", "counter", keyframes["lost"],
+        ),
+    ]
+    return "\n".join(lines) + "\n"
+
+# Most intervals /api/py/metrics/summary returns in one response
+MAX_SUMMARY_INTERVALS = 10000
+
+
+@app.get("/api/py/metrics/summary")
+async def get_metrics_summary(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    userId: Optional[str] = None,
+    interval: Optional[float] = None,
+):
+    """
+    Blink, look-away, light and distance totals between two times (seconds
+    since the epoch, rounded out to whole minutes) from the per-minute
+    rollups, for one session (userId) or all of them. With `interval`
+    (seconds), the range is also summarized per interval, e.g. per hour or
+    day for the dashboard charts.
+    """
+    try:
+        logs = [rollup_log(userId)] if userId else all_rollup_logs()
+        if logs == [None]:
+            raise HTTPException(status_code=404, detail="Event log is disabled (EVENT_LOG_DIR is empty)")
+        rows = [rollup_rows(logs, start, end)]
+        # Minutes still being filled by live sessions
+        first = None if start is None else start // ROLLUP_INTERVAL * ROLLUP_INTERVAL
+        for tracker in sessions.trackers():
+            bucket = tracker.rollup.bucket
+            if userId not in (None, tracker.session_id) or bucket is None:
+                continue
+            if (first is None or bucket[-1] >= first) and (end is None or bucket[-1] <= end):
+                rows.append(bucket[None].copy())
+        rows = np.concatenate(rows)
+
+        summary = summarize_rollups(rows, start, end)
+        if interval is not None:
+            if start is None or interval <= 0:
+                raise HTTPException(status_code=400, detail="interval needs a start time and a positive length")
+            stop = end if end is not None else time.time()
+            count = math.ceil((stop - start) / interval)
+            if count > MAX_SUMMARY_INTERVALS:
+                raise HTTPException(status_code=400, detail=f"More than {MAX_SUMMARY_INTERVALS} intervals")
+            # Rollup minutes go to the interval their start falls in; a minute started before start goes to the first
+            index = np.maximum(np.floor((rows[:, -1] - start) / interval), 0).astype(int)
+            summary["intervals"] = [
+                summarize_rollups(rows[index == i], start + i * interval, start + (i + 1) * interval)
+                for i in range(count)
+            ]
+        return summary
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing frame for distance check: {str(e)}")
+        logger.error("Error summarizing metrics: %s", e)
         return {"error": str(e), "status": "error"}
 
 @app.get("/api/py/helloFastApi")
@@ -684,85 +1563,102 @@ def hello_fast_api():
     return {"message": "Hello from FastAPI"}
 
 # Add this function to format session data
-def format_session_data():
-    global blink_timestamps, direction_changes, state_changes, distance_changes
-    
-    # Add final distance change if exists
-    if last_known_distance_state is not None:
+def format_session_data(tracker, current_time=None):
+    """Event history and stats of a session; the current distance state is closed at current_time (default: now)."""
+    if current_time is None:
         current_time = time.time()
+    distance_changes = tracker.distance_events.records()
+
+    # Add final distance change if exists
+    if tracker.last_known_distance_state is not None:
         distance_changes.append({
-            "distance": last_known_distance_state,
-            "start_time": state_start_time,
+            "distance": tracker.last_known_distance_state,
+            "start_time": tracker.state_start_time,
             "end_time": current_time
         })
 
     session_data = {
-        "directionChanges": direction_changes,
-        "blinkTimestamps": blink_timestamps,
-        "lightStateChanges": state_changes,
+        "directionChanges": tracker.direction_events.records(),
+        "blinkTimestamps": tracker.blink_events.column("timestamp"),
+        "lightStateChanges": tracker.light_events.records(),
         "distanceChanges": distance_changes,
+        # Stats are maintained incrementally and cover the whole session,
+        # including events that have rotated out of the event buffers
         "stats": {
-            "totalBlinks": len(blink_timestamps),
-            "avgBlinkRate": calculate_blink_rate(blink_timestamps),
-            "totalLookAwayTime": calculate_look_away_time(direction_changes),
-            "avgDistance": calculate_avg_distance(distance_changes)
+            "totalBlinks": tracker.blink_stats.count,
+            "avgBlinkRate": tracker.blink_stats.rate(),
+            "totalLookAwayTime": tracker.look_away_stats.total_time,
+            "avgDistance": tracker.distance_stats.average(
+                tracker.last_known_distance_state, tracker.state_start_time, current_time
+            )
         }
     }
     
     return session_data
 
-def calculate_blink_rate(blink_timestamps):
-    if not blink_timestamps:
-        return 0
-    duration = blink_timestamps[-1] - blink_timestamps[0]
-    minutes = duration / 60
-    return len(blink_timestamps) / minutes if minutes > 0 else 0
-
-def calculate_look_away_time(direction_changes):
-    total_time = 0
-    for i in range(len(direction_changes)-1):
-        if direction_changes[i]["looking_away"] == 1:
-            total_time += direction_changes[i+1]["timestamp"] - direction_changes[i]["timestamp"]
-    return total_time
-
-def calculate_avg_distance(distance_changes):
-    if not distance_changes:
-        return 0
-    total_distance = 0
-    total_time = 0
-    for change in distance_changes:
-        duration = change["end_time"] - change["start_time"]
-        # Convert distance string to numeric value
-        if change["distance"] == "close":
-            dist_value = 40
-        elif change["distance"] == "med":
-            dist_value = 75
-        else:  # far
-            dist_value = 110
-        total_distance += dist_value * duration
-        total_time += duration
-    return total_distance / total_time if total_time > 0 else 0
+def take_session_data(session_id):
+    """
+    Event history of a session, resetting its blinks for the next session.
+    Waits for the session's frame in progress, so it runs off the event loop.
+    """
+    tracker = sessions.get(session_id)
+    with tracker.lock:
+        response_data = {
+            "direction_changes": tracker.direction_events.records(),
+            "blink_timestamps": tracker.blink_events.column("timestamp"),
+            "state_changes": tracker.light_events.records(),
+            "distance_changes": tracker.distance_events.records()
+        }
+
+        # Reset data for next session
+        tracker.blink_events.clear()
+        tracker.blink_stats = BlinkStats()
+    return response_data
+
 
 # Add a new endpoint to get session data
 @app.get("/api/py/session-data")
-async def get_session_data():
-    global direction_changes, blink_timestamps, state_changes, distance_changes
+async def get_session_data(userId: str = DEFAULT_SESSION_ID):
     try:
-        # Store current blink timestamps to return
-        current_blink_timestamps = blink_timestamps.copy()
-        
-        response_data = {
-            "direction_changes": direction_changes,
-            "blink_timestamps": current_blink_timestamps,
-            "state_changes": state_changes,
-            "distance_changes": distance_changes
-        }
-        
-        # Reset data for next session
-        blink_timestamps = []
-        
-        return response_data
+        return await asyncio.to_thread(take_session_data, userId)
     except Exception as e:
-        print(f"Error getting session data: {str(e)}")
+        logger.error("Error getting session data: %s", e)
         return {"error": str(e), "status": "error"}
 
+
+def session_logs(session_id):
+    """Event logs of a session, live or from a previous run of the server."""
+    logs = open_session_logs(session_id)
+    if logs is None:
+        raise HTTPException(status_code=404, detail="Event log is disabled (EVENT_LOG_DIR is empty)")
+    return logs
+
+
+@app.get("/api/py/session-summary")
+async def get_session_summary(userId: str = DEFAULT_SESSION_ID, start: Optional[float] = None, end: Optional[float] = None):
+    """Session statistics between two capture times (seconds, default: the whole log), from the event log."""
+    try:
+        return summarize(session_logs(userId), start, end)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error summarizing session: %s", e)
+        return {"error": str(e), "status": "error"}
+
+
+@app.get("/api/py/session-events")
+async def get_session_events(userId: str = DEFAULT_SESSION_ID, start: Optional[float] = None, end: Optional[float] = None):
+    """Events logged between two capture times, in the layout of /api/py/session-data."""
+    try:
+        logs = session_logs(userId)
+        return {
+            "direction_changes": logs["direction"].records(start, end),
+            "blink_timestamps": logs["blink"].array(start, end)[:, 0].tolist(),
+            "state_changes": logs["light"].records(start, end),
+            "distance_changes": logs["distance"].records(start, end),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error reading session events: %s", e)
+        return {"error": str(e), "status": "error"}
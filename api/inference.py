@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from api.metrics import stage_seconds
+
+
+class FrameDropped(Exception):
+    """Raised for a queued frame that was dropped before it reached a worker."""
+
+
+class InferenceExecutor:
+    """
+    Runs blocking frame processing (decode, color conversion, FaceMesh) on a
+    bounded thread pool so the event loop stays responsive.
+
+    Each session has at most one queued frame per kind of work (e.g. the
+    analyzers it asks for): a newer frame replaces the queued one of its
+    kind (drop-oldest), so frequent blink frames do not starve a session's
+    distance or light frames. Frames of one session never run concurrently,
+    so a session's FaceMesh is only used by one thread at a time. When more
+    than max_queue frames are waiting, the oldest queued frame overall is
+    dropped, and frames that waited longer than max_wait are dropped instead
+    of run, so a saturated server sheds stale work and keeps serving fresh
+    frames.
+
+    Every frame is its own pool task, started as soon as a worker is free.
+    FaceMesh has no batched inference, so grouping frames would only make
+    them wait for each other.
+    """
+
+    def __init__(self, workers=None, max_queue=None, max_wait=None):
+        self.workers = workers or int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1))
+        self.max_queue = max_queue or int(os.environ.get("INFERENCE_QUEUE_SIZE", self.workers * 4))
+        if max_wait is None:
+            max_wait = float(os.environ.get("INFERENCE_MAX_WAIT_MS", 500)) / 1000
+        self.max_wait = max_wait  # Seconds
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._pending = OrderedDict()  # (session_id, kind) -> (fn, args, future, queued at), oldest first
+        self._running = set()  # session ids with a frame on a worker
+        self.completed = 0
+        self.failed = 0
+        self.dropped_stale = 0  # Replaced by a newer frame of the same session
+        self.dropped_overflow = 0  # Evicted because the queue was full
+        self.dropped_expired = 0  # Waited longer than max_wait
+
+    async def submit(self, session_id, fn, *args, kind=None):
+        """
+        Queue fn(*args) for a session and wait for its result. A queued frame
+        of the same session and kind is replaced.
+        Raises FrameDropped if the frame is dropped before it runs.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        key = (session_id, kind)
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            self._drop(previous)
+            self.dropped_stale += 1
+        elif len(self._pending) >= self.max_queue:
+            _, oldest = self._pending.popitem(last=False)
+            self._drop(oldest)
+            self.dropped_overflow += 1
+
+        self._pending[key] = (fn, args, future, time.perf_counter())
+        self._dispatch(loop)
+        return await future
+
+    def _drop(self, job):
+        future = job[2]
+        if not future.done():
+            future.set_exception(FrameDropped())
+
+    def _dispatch(self, loop):
+        """Start the oldest queued frames of idle sessions on the free workers."""
+        now = time.perf_counter()
+        for key in list(self._pending):
+            if len(self._running) >= self.workers:
+                break
+            session_id = key[0]
+            if session_id in self._running:
+                continue
+            fn, args, future, queued_at = self._pending.pop(key)
+            if future.done():  # The caller went away
+                continue
+            if now - queued_at > self.max_wait:
+                self._drop((fn, args, future))
+                self.dropped_expired += 1
+                continue
+            stage_seconds.observe("queue_wait", now - queued_at)
+            self._running.add(session_id)
+            task = loop.run_in_executor(self._pool, fn, *args)
+            task.add_done_callback(
+                lambda done, session_id=session_id, future=future: self._finished(loop, session_id, future, done)
+            )
+
+    def _finished(self, loop, session_id, future, task):
+        self._running.discard(session_id)
+        if task.cancelled():  # Pool shutdown: the frame never ran
+            self._drop((None, None, future))
+        elif task.exception() is not None:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(task.exception())
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(task.result())
+        self._dispatch(loop)
+
+    def load(self):
+        """Frames queued or on a worker per worker; above 1, frames wait."""
+        return (len(self._pending) + len(self._running)) / self.workers
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": len(self._pending),
+            "in_flight": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped_stale + self.dropped_overflow + self.dropped_expired,
+            "dropped_stale": self.dropped_stale,
+            "dropped_overflow": self.dropped_overflow,
+            "dropped_expired": self.dropped_expired,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,145 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from api.landmarks import EYE_INDICES, PUPIL_INDICES, IRIS_INDICES
+
+# Run FaceMesh on every KEYFRAME_INTERVAL-th frame and track the landmarks the
+# analyzers read with optical flow in between; 1 runs FaceMesh on every frame
+KEYFRAME_INTERVAL = int(os.environ.get("KEYFRAME_INTERVAL", 4))
+# Largest forward-backward tracking error (pixels) of any point before FaceMesh runs again
+KEYFRAME_MAX_ERROR = float(os.environ.get("KEYFRAME_MAX_ERROR", 0.5))
+# Frames further apart than this (seconds) are not tracked; motion between them is too large
+KEYFRAME_MAX_GAP = 0.25
+TRACK_PADDING = 0.5  # Padding of the tracked region around the points, as a fraction of its size
+LK_PARAMS = {
+    "winSize": (15, 15),
+    "maxLevel": 2,
+    "criteria": (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+}
+
+# Landmarks read by the analyzers: eye contours (blink), eye corners and iris
+# centers (direction) and iris boundaries (distance)
+TRACKED_INDICES = np.unique(np.concatenate([EYE_INDICES.ravel(), PUPIL_INDICES.ravel(), IRIS_INDICES.ravel()]))
+
+
+class KeyframeStats:
+    """Keyframe and tracked frame counters shared by the landmark trackers of all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.keyframes = 0
+        self.lost = 0  # Keyframes forced by a tracking error
+
+    def count(self, keyframe, lost):
+        with self._lock:
+            self.frames += 1
+            self.keyframes += keyframe
+            self.lost += lost
+
+    def stats(self):
+        return {
+            "interval": KEYFRAME_INTERVAL,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "lost": self.lost,
+            "keyframe_ratio": self.keyframes / self.frames if self.frames else 0.0,
+        }
+
+
+def track_box(points, img_w, img_h):
+    """Padded integer (x0, y0, x1, y1) box around (N, 2) points, clipped to the frame."""
+    low, high = points.min(axis=0), points.max(axis=0)
+    pad = (high - low).max() * TRACK_PADDING
+    return (
+        max(int(low[0] - pad), 0), max(int(low[1] - pad), 0),
+        min(int(high[0] + pad) + 1, img_w), min(int(high[1] + pad) + 1, img_h),
+    )
+
+
+class LandmarkTracker:
+    """
+    Keyframe landmark tracking for one session.
+
+    FaceMesh runs on keyframes: every KEYFRAME_INTERVAL-th frame, after a
+    gap or when there was no face. On the frames in between, only the
+    TRACKED_INDICES points are moved, by pyramidal Lucas-Kanade optical flow
+    on a grayscale crop around the eyes; the other landmarks follow the
+    median displacement so crops around the face stay centered. A point
+    that cannot be tracked there and back to within KEYFRAME_MAX_ERROR
+    pixels (eyelids in a fast blink, occlusion) makes the frame a keyframe.
+    """
+
+    __slots__ = ("stats", "landmarks", "_crop", "_box", "_timestamp", "_since_keyframe")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.landmarks = None  # Landmarks of the previous frame
+        self._crop = None  # Grayscale crop of the previous frame at _box
+        self._box = None
+        self._timestamp = None
+        self._since_keyframe = 0
+
+    def _can_track(self, analysis):
+        return (
+            self.landmarks is not None
+            and self._since_keyframe + 1 < KEYFRAME_INTERVAL
+            and abs(analysis.timestamp - self._timestamp) <= KEYFRAME_MAX_GAP
+        )
+
+    def _track(self, crop):
+        """Landmarks moved by the optical flow from the previous crop to crop, or None if a point was lost."""
+        offset = np.array(self._box[:2], dtype=np.float32)
+        previous = self.landmarks[TRACKED_INDICES, :2]
+        start = (previous - offset).reshape(-1, 1, 2)
+        moved, found, _ = cv2.calcOpticalFlowPyrLK(self._crop, crop, start, None, **LK_PARAMS)
+        back, found_back, _ = cv2.calcOpticalFlowPyrLK(crop, self._crop, moved, None, **LK_PARAMS)
+        error = np.linalg.norm((back - start).reshape(-1, 2), axis=1)
+        if not (found.all() and found_back.all()) or error.max() > KEYFRAME_MAX_ERROR:
+            return None
+
+        points = moved.reshape(-1, 2) + offset
+        landmarks = self.landmarks.copy()
+        landmarks[:, :2] += np.median(points - previous, axis=0)
+        landmarks[TRACKED_INDICES, :2] = points
+        return landmarks
+
+    def process(self, analysis, detect):
+        """Landmark array for a FrameAnalysis, tracked from the previous frame or from detect(analysis) on keyframes."""
+        landmarks = crop = None
+        tracking = self._can_track(analysis)
+        if tracking:
+            crop = analysis.gray_crop(self._box)
+            if crop.shape == self._crop.shape:  # Else the frame size changed
+                landmarks = self._track(crop)
+        keyframe = landmarks is None
+        self.stats.count(keyframe, tracking and keyframe)
+        if keyframe:
+            landmarks = detect(analysis)
+            self._since_keyframe = 0
+        else:
+            self._since_keyframe += 1
+
+        self.landmarks = landmarks
+        self._timestamp = analysis.timestamp
+        if landmarks is None or KEYFRAME_INTERVAL <= 1:
+            return landmarks
+        # The next frame is tracked from this one; the region is re-centered on
+        # keyframes and when the points come near its edge
+        points = landmarks[TRACKED_INDICES, :2]
+        margin = LK_PARAMS["winSize"][0]
+        box = self._box
+        if keyframe or not (
+            (points >= np.array(box[:2]) + margin).all() and (points < np.array(box[2:]) - margin).all()
+        ):
+            box = track_box(points, analysis.img_w, analysis.img_h)
+            crop = None
+        if box[0] >= box[2] or box[1] >= box[3]:
+            self.landmarks = None  # The eyes are off-frame
+            return landmarks
+        self._box = box
+        self._crop = crop if crop is not None else analysis.gray_crop(box)
+        return landmarks
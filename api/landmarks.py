@@ -0,0 +1,73 @@
+import numpy as np
+
+# Landmarks per face with refine_landmarks=True (468 mesh points plus 10 iris points)
+NUM_LANDMARKS = 478
+
+# Eye contours for the eye aspect ratio: p1..p6 of the left and right eye
+EYE_INDICES = np.array([
+    [362, 385, 387, 373, 380, 374],  # Left eye
+    [33, 160, 158, 133, 153, 144],  # Right eye
+])
+
+# Eye corner nearer the image's left edge, the other corner and the iris center of
+# each eye, for the pupil ratios: both ratios grow as the irises move right in the
+# image. The left eye's first corner is its inner one, the right eye's its outer one.
+PUPIL_INDICES = np.array([
+    [362, 263, 473],  # Left eye
+    [33, 133, 468],  # Right eye
+])
+
+# Iris boundary points of each eye as (horizontal pair, vertical pair)
+IRIS_INDICES = np.array([
+    [[469, 471], [470, 472]],  # Left eye
+    [[474, 476], [475, 477]],  # Right eye
+])
+
+
+def landmark_array(face_landmarks, img_w, img_h, offset=(0, 0)):
+    """
+    Convert a FaceMesh landmark list to a (478, 3) float32 array of pixel
+    coordinates. z is scaled by the image width, like MediaPipe's x.
+    offset is added to x and y, to place landmarks of a crop in the frame.
+    """
+    points = np.fromiter(
+        (value for landmark in face_landmarks.landmark for value in (landmark.x, landmark.y, landmark.z)),
+        dtype=np.float32,
+        count=NUM_LANDMARKS * 3,
+    ).reshape(NUM_LANDMARKS, 3)
+    points *= np.array([img_w, img_h, img_w], dtype=np.float32)
+    points[:, :2] += np.array(offset, dtype=np.float32)
+    return points
+
+
+def eye_aspect_ratios(points):
+    """
+    Eye aspect ratio of the left and right eye, EAR = (|p2-p6| + |p3-p5|) / (2|p1-p4|).
+    points is (..., 478, 3); returns (..., 2). An eye with zero width has EAR 0.
+    """
+    eyes = points[..., EYE_INDICES, :2]  # (..., 2, 6, 2)
+    vertical = np.linalg.norm(eyes[..., [1, 2], :] - eyes[..., [5, 4], :], axis=-1).sum(axis=-1)
+    horizontal = np.linalg.norm(eyes[..., 0, :] - eyes[..., 3, :], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(horizontal > 0, vertical / (2.0 * horizontal), 0.0)
+
+
+def pupil_ratios(points):
+    """
+    Position of each iris center between its eye corners, as (x, y) ratios.
+    points is (..., 478, 3); returns (..., 2, 2) with the left eye first.
+    """
+    eyes = points[..., PUPIL_INDICES, :2]  # (..., 2, 3, 2)
+    span = eyes[..., 1, :] - eyes[..., 0, :]
+    span = np.where(span == 0, 1, span)  # Prevent division by zero
+    return (eyes[..., 2, :] - eyes[..., 0, :]) / span
+
+
+def iris_diameters(points):
+    """
+    Pixel diameter of the left and right iris; (..., 478, 3) -> (..., 2).
+    Head yaw shortens the horizontal diameter and pitch the vertical one,
+    so the larger of the two is taken.
+    """
+    pairs = points[..., IRIS_INDICES, :2]  # (..., 2, 2, 2, 2)
+    return np.linalg.norm(pairs[..., 0, :] - pairs[..., 1, :], axis=-1).max(axis=-1)
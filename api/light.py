@@ -0,0 +1,77 @@
+import math
+import os
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+# JPEG frames only checked for light are decoded to grayscale at 1/LIGHT_DECODE_SCALE size,
+# which libjpeg does in the DCT, without decoding the full-size image
+LIGHT_DECODE_SCALE = int(os.environ.get("LIGHT_DECODE_SCALE", 4))
+LIGHT_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}[LIGHT_DECODE_SCALE]
+# Luma pixels sampled per frame (a strided grid), plenty for a 256-bin histogram
+LIGHT_SAMPLE_PIXELS = 20000
+
+# The environment turns dark when the mean luma drops below DARK_LEVEL or more
+# than DARK_SHADOWS of the frame is in shadow, and light again once the mean is
+# at least LIGHT_LEVEL and the shadows are below LIGHT_SHADOWS
+DARK_LEVEL = 70
+LIGHT_LEVEL = 80
+SHADOW_LEVEL = 40  # Luma of the pixels counted as shadow
+DARK_SHADOWS = 0.5
+LIGHT_SHADOWS = 0.4
+MIDDLE_GRAY = 118  # sRGB value of 18% gray, the exposure reference
+
+_LEVELS = np.arange(256)
+_STOPS = np.log2(np.maximum(_LEVELS, 1) / MIDDLE_GRAY)  # Exposure in stops of each luma level
+
+
+class LightReading(NamedTuple):
+    """Luma statistics of a frame."""
+    brightness: float  # Mean luma
+    median: float
+    p5: float
+    p95: float
+    exposure: float  # Mean log2(luma / middle gray): 0 is well exposed, -1 one stop under
+    shadows: float  # Share of pixels below SHADOW_LEVEL
+
+
+def sample_step(height, width, max_pixels=LIGHT_SAMPLE_PIXELS):
+    """Stride in both directions that leaves at most max_pixels of a height x width image."""
+    return max(1, math.ceil(math.sqrt(height * width / max_pixels)))
+
+
+def measure_light(luma):
+    """Histogram statistics of a (sampled) 8-bit luma image."""
+    histogram = np.bincount(luma.ravel(), minlength=256)
+    count = histogram.sum()
+    cumulative = np.cumsum(histogram)
+    p5, median, p95 = np.searchsorted(cumulative, np.array([0.05, 0.5, 0.95]) * count)
+    return LightReading(
+        brightness=float(histogram @ _LEVELS / count),
+        median=float(median),
+        p5=float(p5),
+        p95=float(p95),
+        exposure=float(histogram @ _STOPS / count),
+        shadows=float(cumulative[SHADOW_LEVEL - 1] / count),
+    )
+
+
+def classify_light(reading, previous=None):
+    """
+    "light" or "dark" from a reading, with hysteresis around the previous state.
+    Camera auto-exposure lifts the mean of a dark room toward mid-gray, but
+    in a room lit mostly by the screen the background stays in deep shadow,
+    so a large shadow share counts as dark even at a normal mean. The gap
+    between the dark and light thresholds keeps auto-exposure hunting from
+    flipping the state back and forth.
+    """
+    if previous == "dark":
+        recovered = reading.brightness >= LIGHT_LEVEL and reading.shadows < LIGHT_SHADOWS
+        return "light" if recovered else "dark"
+    return "dark" if reading.brightness < DARK_LEVEL or reading.shadows > DARK_SHADOWS else "light"
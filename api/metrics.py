@@ -0,0 +1,124 @@
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from 0.1 ms to 1 s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075,
+    0.01, 0.015, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Per-frame log lines are written for one in this many frames
+LOG_SAMPLE_RATE = max(1, int(os.environ.get("LOG_SAMPLE_RATE", 100)))
+
+
+class Histogram:
+    """
+    Latency histogram with one label value per series, in the Prometheus model.
+
+    Observations go to a per-thread shard, so the hot path takes no lock;
+    shards are summed when the histogram is rendered. A shard is
+    [count per bucket..., +Inf count, sum].
+    """
+
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []  # (label value, shard) of every thread
+        self._shards_lock = threading.Lock()  # Only taken when a thread sees a new label value
+
+    def _shard(self, value):
+        shards = getattr(self._local, "shards", None)
+        if shards is None:
+            shards = self._local.shards = {}
+        shard = shards.get(value)
+        if shard is None:
+            shard = shards[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            with self._shards_lock:
+                self._shards.append((value, shard))
+        return shard
+
+    def observe(self, value, seconds):
+        shard = self._shard(value)
+        shard[bisect.bisect_left(self.buckets, seconds)] += 1
+        shard[-1] += seconds
+
+    def snapshot(self):
+        """label value -> (cumulative bucket counts, count, sum)."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for value, shard in shards:
+            total = totals.setdefault(value, [0] * len(shard))
+            for i, x in enumerate(shard):
+                total[i] += x
+        return {
+            value: (list(itertools.accumulate(total[:-1])), sum(total[:-1]), total[-1])
+            for value, total in totals.items()
+        }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value, (cumulative, count, total) in sorted(self.snapshot().items()):
+            label = f'{self.label}="{value}"'
+            for bound, n in zip(self.buckets, cumulative):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+# Latency of each frame-processing stage and of notification sends
+stage_seconds = Histogram(
+    "eyecare_stage_seconds",
+    "Time spent in each frame-processing stage",
+    "stage",
+)
+
+
+@contextmanager
+def timed(stage):
+    """Record the time spent in the block under a stage of stage_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(stage, time.perf_counter() - start)
+
+
+def render_values(name, help_text, kind, values, label=None):
+    """Prometheus lines for a gauge or counter: one value, or a dict of label value -> value."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    if label is None:
+        lines.append(f"{name} {float(values)}")
+    else:
+        lines.extend(f'{name}{{{label}="{key}"}} {float(value)}' for key, value in values.items())
+    return lines
+
+
+class SampledLogger:
+    """Passes one in every `every` messages to a logger, for per-frame log lines."""
+
+    def __init__(self, logger, every=LOG_SAMPLE_RATE):
+        self.logger = logger
+        self.every = every
+        self._count = itertools.count()
+
+    def log(self, level, msg, *args):
+        # Check the level first so disabled messages cost no formatting
+        if self.logger.isEnabledFor(level) and next(self._count) % self.every == 0:
+            self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Models of each kind built and run once at startup, in the background
+MODEL_WARMUP = int(os.environ.get("MODEL_WARMUP", 1))
+# Idle models of each kind kept for new sessions after their session ends
+MODEL_POOL_SIZE = int(os.environ.get("MODEL_POOL_SIZE", 4))
+# Frame size of the warmup and reset runs
+WARMUP_FRAME_SIZE = (256, 256)
+
+
+def mediapipe_solutions():
+    """mediapipe.solutions, imported on first use: the import alone takes about a second."""
+    import mediapipe as mp
+    return mp.solutions
+
+
+class ModelPool:
+    """
+    Idle MediaPipe models of one kind, so a new session does not pay for
+    building its model and for the graph's first run on the request path.
+
+    warm() builds models ahead of time and runs each on a blank frame.
+    Sessions acquire() a model (building one if the pool is empty) and
+    release() it when they end; a released model is run on a blank frame
+    first, so it carries no face track over to the next session.
+    """
+
+    def __init__(self, factory, max_idle=MODEL_POOL_SIZE):
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+
+    def _blank_run(self, model):
+        model.process(np.zeros((*WARMUP_FRAME_SIZE, 3), np.uint8))
+
+    def _build(self):
+        model = self.factory()
+        self._blank_run(model)
+        with self._lock:
+            self.built += 1
+        return model
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return self._build()
+
+    def release(self, model):
+        with self._lock:
+            keep = len(self._idle) < self.max_idle
+        if keep:
+            self._blank_run(model)
+            with self._lock:
+                self._idle.append(model)
+        else:
+            model.close()
+
+    def warm(self, count):
+        """Build models until `count` are idle."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= min(count, self.max_idle):
+                    return
+            model = self._build()
+            with self._lock:
+                self._idle.append(model)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for model in idle:
+            model.close()
+
+    def stats(self):
+        return {"idle": len(self._idle), "built": self.built, "reused": self.reused}
+
+
+def warm_up(pools, count=MODEL_WARMUP):
+    """Warm each pool to `count` idle models. Returns the seconds it took."""
+    start = time.perf_counter()
+    for pool in pools:
+        pool.warm(count)
+    elapsed = time.perf_counter() - start
+    logger.info("Models warmed up in %.2f s", elapsed)
+    return elapsed
@@ -0,0 +1,135 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from api.landmarks import EYE_INDICES, PUPIL_INDICES
+
+# Skip FaceMesh on frames that did not change since the last processed frame
+MOTION_GATING = os.environ.get("MOTION_GATING", "1") != "0"
+# Mean absolute difference (gray levels) of the downsampled frame that counts as motion
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", 2.0))
+# Mean absolute difference of the eye patches that counts as a possible blink
+EYE_MOTION_THRESHOLD = float(os.environ.get("EYE_MOTION_THRESHOLD", 3.0))
+# Consecutive frames that may be skipped before FaceMesh runs again anyway
+MOTION_MAX_SKIP = int(os.environ.get("MOTION_MAX_SKIP", 5))
+
+THUMBNAIL_WIDTH = 64  # Width of the downsampled frame used for the global difference
+EYE_PATCH_SIZE = (16, 8)  # Eye patches are resampled to this (width, height) before comparing
+EYE_PATCH_PADDING = 0.2  # Padding around each eye's landmarks, as a fraction of the eye width
+
+# Eye contour and iris landmarks of the left and right eye
+EYE_REGION_INDICES = np.concatenate([EYE_INDICES, PUPIL_INDICES], axis=1)
+
+
+class MotionStats:
+    """Frame and skip counters shared by the motion gates of all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.skipped = 0
+        self.eye_motion = 0  # Frames processed only because the eye patches changed
+
+    def count(self, skipped, eye_motion):
+        with self._lock:
+            self.frames += 1
+            self.skipped += skipped
+            self.eye_motion += eye_motion
+
+    def stats(self):
+        return {
+            "enabled": MOTION_GATING,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "eye_motion": self.eye_motion,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+        }
+
+
+def eye_boxes(landmarks, img_w, img_h):
+    """Padded (x0, y0, x1, y1) pixel boxes around both eyes of a landmark array, or None if an eye is off-frame."""
+    boxes = []
+    for eye in landmarks[EYE_REGION_INDICES, :2]:
+        (x0, y0), (x1, y1) = eye.min(axis=0), eye.max(axis=0)
+        pad = (x1 - x0) * EYE_PATCH_PADDING
+        box = (
+            max(int(x0 - pad), 0), max(int(y0 - pad), 0),
+            min(int(x1 + pad) + 1, img_w), min(int(y1 + pad) + 1, img_h),
+        )
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return None
+        boxes.append(box)
+    return boxes
+
+
+class MotionGate:
+    """
+    Decides per frame whether a session's FaceMesh pass can be skipped.
+
+    Each frame is compared with the last frame FaceMesh ran on: a
+    downsampled copy of the grayscale frame for global motion, and small
+    patches around both eyes, so a blink forces inference even when the
+    rest of the frame is still. Skipped frames reuse the last landmarks.
+    """
+
+    __slots__ = ("stats", "landmarks", "_thumbnail", "_boxes", "_eye_patches", "_skipped")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.landmarks = None  # Landmarks of the last processed frame
+        self._thumbnail = None
+        self._boxes = None
+        self._eye_patches = None
+        self._skipped = 0
+
+    def _thumbnail_of(self, gray):
+        height = max(1, round(gray.shape[0] * THUMBNAIL_WIDTH / gray.shape[1]))
+        return cv2.resize(gray, (THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+    def _patches_of(self, gray, boxes):
+        return [
+            cv2.resize(gray[y0:y1, x0:x1], EYE_PATCH_SIZE, interpolation=cv2.INTER_AREA)
+            for x0, y0, x1, y1 in boxes
+        ]
+
+    @staticmethod
+    def _difference(a, b):
+        return float(cv2.absdiff(a, b).mean())
+
+    def process(self, analysis):
+        """Landmark array for a FrameAnalysis, from FaceMesh or reused from the last processed frame."""
+        if not MOTION_GATING:
+            return analysis.landmarks
+
+        gray = analysis.gray
+        thumbnail = self._thumbnail_of(gray)
+        skip = eye_motion = False
+        if self._thumbnail is not None and self._thumbnail.shape == thumbnail.shape and self._skipped < MOTION_MAX_SKIP:
+            skip = self._difference(thumbnail, self._thumbnail) < MOTION_THRESHOLD
+            if skip and self._boxes is not None:
+                patches = self._patches_of(gray, self._boxes)
+                eye_motion = any(
+                    self._difference(patch, previous) >= EYE_MOTION_THRESHOLD
+                    for patch, previous in zip(patches, self._eye_patches)
+                )
+                skip = not eye_motion
+        self.stats.count(skip, eye_motion)
+
+        if skip:
+            self._skipped += 1
+            return self.landmarks
+
+        landmarks = analysis.landmarks
+        self.landmarks = landmarks
+        self._thumbnail = thumbnail
+        self._skipped = 0
+        self._boxes = self._eye_patches = None
+        if landmarks is not None:
+            self._boxes = eye_boxes(landmarks, analysis.img_w, analysis.img_h)
+            if self._boxes is None:
+                self._thumbnail = None  # The eyes cannot be watched; don't skip the next frame
+            else:
+                self._eye_patches = self._patches_of(gray, self._boxes)
+        return landmarks
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from api.metrics import stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# Notification kinds: (title, body, cooldown in seconds per user)
+NOTIFICATIONS = {
+    "lookaway": (
+        "Look Away Reminder",
+        "Please take a break and look away from the screen for 20 seconds!",
+        10,
+    ),
+    "distance": (
+        "Distance Warning",
+        "You're too close to the screen! Please lean back for better posture.",
+        30,
+    ),
+    "blink": (
+        "Blink Reminder",
+        "Remember to blink! Your eyes need moisture to stay healthy.",
+        10,
+    ),
+    "ambient": (
+        "Lighting Warning",
+        "The environment is too dark! Please move to a brighter area or adjust your screen brightness.",
+        30,
+    ),
+}
+
+# FCM accepts at most 500 messages per send_each call
+FCM_BATCH_SIZE = 500
+
+
+def firebase_credentials_path():
+    return os.environ.get("FIREBASE_CREDENTIALS", "firebase-credentials.json")
+
+
+class FirebaseMessagingBackend:
+    """
+    Sends notifications through Firebase Cloud Messaging.
+    firebase_admin is imported and initialized on the first send, off the startup path.
+    """
+
+    def __init__(self, credentials_path=None):
+        self.credentials_path = credentials_path or firebase_credentials_path()
+        self._messaging = None
+        self._init_lock = threading.Lock()
+
+    def _init(self):
+        with self._init_lock:
+            if self._messaging is None:
+                import firebase_admin
+                from firebase_admin import credentials, messaging
+
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(credentials.Certificate(self.credentials_path))
+                self._messaging = messaging
+        return self._messaging
+
+    def send_each(self, notifications):
+        """
+        Send (token, title, body) notifications in one batch.
+        Returns one error string (or None on success) per notification.
+        """
+        messaging = self._messaging or self._init()
+        messages = [
+            messaging.Message(
+                notification=messaging.Notification(title=title, body=body),
+                token=token,
+            )
+            for token, title, body in notifications
+        ]
+        response = messaging.send_each(messages)
+        return [None if r.success else str(r.exception) for r in response.responses]
+
+
+class FakeMessagingBackend:
+    """In-memory backend for local runs and tests; records every notification it is given."""
+
+    def __init__(self, failing_tokens=()):
+        self.failing_tokens = set(failing_tokens)
+        self.batches = []
+
+    @property
+    def sent(self):
+        return [n for batch in self.batches for n in batch if n[0] not in self.failing_tokens]
+
+    def send_each(self, notifications):
+        self.batches.append(list(notifications))
+        return ["fake failure" if token in self.failing_tokens else None for token, _, _ in notifications]
+
+
+def create_messaging_backend():
+    """
+    Pick the messaging backend from NOTIFICATION_BACKEND ("firebase", "fake"
+    or "none"). Returns None, which disables notifications, for "none" or
+    when the Firebase credentials file is missing.
+    """
+    backend = os.environ.get("NOTIFICATION_BACKEND", "firebase")
+    if backend == "fake":
+        return FakeMessagingBackend()
+    if backend == "none":
+        return None
+    if not os.path.exists(firebase_credentials_path()):
+        logger.warning("No Firebase credentials at %s; notifications are disabled", firebase_credentials_path())
+        return None
+    return FirebaseMessagingBackend()
+
+
+class NotificationDispatcher:
+    """
+    Queues alerts raised on the frame-processing path and sends them from the
+    notification task, off the request path.
+
+    Alerts are keyed by (user id, kind). Repeats of a queued alert are
+    coalesced, cooldowns apply per user and kind, alerts that resolve to the
+    same FCM token are deduplicated, and the survivors are sent in
+    send_each batches. Without a backend, alerts are ignored.
+    """
+
+    def __init__(self, backend, tokens_for, flush_interval=1.0):
+        self.backend = backend
+        self.tokens_for = tokens_for  # user id -> list of FCM tokens
+        self.flush_interval = flush_interval
+        self._loop = None
+        self._queue = None
+        self._queued = set()  # (user_id, kind) waiting to be sent
+        self._queued_lock = threading.Lock()
+        self._last_sent = {}  # (user_id, kind) -> time of last send
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    def _in_cooldown(self, key, now):
+        cooldown = NOTIFICATIONS[key[1]][2]
+        return now - self._last_sent.get(key, 0) < cooldown
+
+    def notify(self, user_id, kind):
+        """Queue an alert for a user. Safe to call from worker threads."""
+        if self._loop is None or self.backend is None:
+            return  # The notification task has not started, or notifications are disabled
+        key = (user_id, kind)
+        if self._in_cooldown(key, time.time()):
+            return
+        with self._queued_lock:
+            if key in self._queued:
+                self.coalesced += 1
+                return
+            self._queued.add(key)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, key)
+
+    def start(self):
+        """Bind the dispatcher to the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    async def dispatch(self):
+        """Wait for alerts, collect them for flush_interval seconds and send one batch round."""
+        keys = [await self._queue.get()]
+        await asyncio.sleep(self.flush_interval)
+        while not self._queue.empty():
+            keys.append(self._queue.get_nowait())
+        with self._queued_lock:
+            self._queued.difference_update(keys)
+
+        now = time.time()
+        notifications = {}  # (token, kind) -> notification, deduplicated per token
+        for key in keys:
+            if self._in_cooldown(key, now):
+                continue
+            user_id, kind = key
+            title, body, _ = NOTIFICATIONS[kind]
+            for token in self.tokens_for(user_id):
+                notifications[(token, kind)] = (token, title, body)
+            self._last_sent[key] = now
+
+        batch = list(notifications.values())
+        for start in range(0, len(batch), FCM_BATCH_SIZE):
+            chunk = batch[start:start + FCM_BATCH_SIZE]
+            t0 = time.perf_counter()
+            errors = await self._loop.run_in_executor(None, self.backend.send_each, chunk)
+            stage_seconds.observe("notification_send", time.perf_counter() - t0)
+            for (token, title, _), error in zip(chunk, errors):
+                if error is None:
+                    self.sent += 1
+                    logger.info("%s notification sent successfully to token: %s...", title, token[:10])
+                else:
+                    self.failed += 1
+                    logger.warning("Failed to send %s notification to token %s...: %s", title, token[:10], error)
+
+    def forget(self, user_id):
+        """Drop cooldown state of a user whose session was evicted."""
+        for key in [key for key in self._last_sent if key[0] == user_id]:
+            del self._last_sent[key]
+
+    def stats(self):
+        return {
+            "enabled": self.backend is not None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,143 @@
+import glob
+import math
+import os
+
+import numpy as np
+
+from api.events import DISTANCE_VALUES
+from api.eventlog import EVENT_LOG_DIR, EventLog, session_log_dir
+
+ROLLUP_INTERVAL = 60  # Seconds per rollup bucket
+# Frames further apart than this (seconds) leave the gap between them untracked
+ROLLUP_MAX_GAP = float(os.environ.get("ROLLUP_MAX_GAP", 5))
+
+# Rollup record layout; the last field is the bucket start time, as in EventLog records
+ROLLUP_FIELDS = (
+    "blinks",
+    "tracked",  # Seconds with frames coming in
+    "look_away",  # Seconds looking away
+    "dark",  # Seconds in a dark environment
+    "close",  # Seconds too close to the screen
+    "distance_weighted",  # Sum of distance (cm) * seconds
+    "distance_time",  # Seconds with a known distance
+    "minute",
+)
+_COLUMNS = {name: i for i, name in enumerate(ROLLUP_FIELDS)}
+
+
+class MinuteRollup:
+    """
+    Per-minute totals of one session, built as frames arrive.
+
+    The session's current states (looking away, dark, distance) are set
+    when they change, and advance() credits the time since the previous
+    frame to them, split at minute boundaries. Each minute is appended to
+    the log once a frame of a later minute arrives, so a summary over any
+    range only sums whole minutes instead of replaying events.
+    """
+
+    __slots__ = ("log", "looking_away", "dark", "distance", "timestamp", "bucket")
+
+    def __init__(self, log=None):
+        self.log = log
+        self.looking_away = False
+        self.dark = False
+        self.distance = None  # Distance state
+        self.timestamp = None  # Capture time of the last frame
+        self.bucket = None  # Totals of the current minute, in ROLLUP_FIELDS order
+
+    def _new_bucket(self, minute):
+        self.bucket = np.zeros(len(ROLLUP_FIELDS))
+        self.bucket[-1] = minute
+
+    def _credit(self, seconds):
+        bucket = self.bucket
+        bucket[_COLUMNS["tracked"]] += seconds
+        if self.looking_away:
+            bucket[_COLUMNS["look_away"]] += seconds
+        if self.dark:
+            bucket[_COLUMNS["dark"]] += seconds
+        if self.distance is not None:
+            bucket[_COLUMNS["close"]] += seconds * (self.distance == "close")
+            bucket[_COLUMNS["distance_weighted"]] += seconds * DISTANCE_VALUES[self.distance]
+            bucket[_COLUMNS["distance_time"]] += seconds
+
+    def advance(self, timestamp):
+        """Credit the time up to a frame captured at timestamp; late frames are ignored."""
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return
+        previous, self.timestamp = self.timestamp, timestamp
+        if previous is None or timestamp - previous > ROLLUP_MAX_GAP:
+            previous = timestamp
+        if self.bucket is None:
+            self._new_bucket(math.floor(previous / ROLLUP_INTERVAL) * ROLLUP_INTERVAL)
+
+        # Fill and close every minute boundary between the two frames
+        while timestamp >= self.bucket[-1] + ROLLUP_INTERVAL:
+            boundary = self.bucket[-1] + ROLLUP_INTERVAL
+            self._credit(max(0.0, boundary - previous))
+            previous = max(previous, boundary)
+            self.flush()
+            self._new_bucket(math.floor(previous / ROLLUP_INTERVAL) * ROLLUP_INTERVAL)
+        self._credit(timestamp - previous)
+
+    def blink(self):
+        """Count a blink in the current minute (call after advance())."""
+        if self.bucket is not None:
+            self.bucket[_COLUMNS["blinks"]] += 1
+
+    def flush(self):
+        """Append the current minute to the log if it has data."""
+        if self.log is not None and self.bucket is not None and self.bucket[:-1].any():
+            self.log.append(self.bucket)
+
+    def close(self):
+        """Write out the minute in progress and close the log."""
+        self.flush()
+        self.bucket = None
+        if self.log is not None:
+            self.log.close()
+
+
+def rollup_log(session_id, root=None):
+    """Rollup log of a session, or None if logging is disabled."""
+    root = EVENT_LOG_DIR if root is None else root
+    if not root:
+        return None
+    return EventLog(os.path.join(session_log_dir(session_id, root), "rollup.log"), ROLLUP_FIELDS)
+
+
+def all_rollup_logs(root=None):
+    """Rollup logs of every session under the log directory (none if logging is disabled)."""
+    root = EVENT_LOG_DIR if root is None else root
+    if not root:
+        return []
+    return [EventLog(path, ROLLUP_FIELDS) for path in sorted(glob.glob(os.path.join(root, "*", "rollup.log")))]
+
+
+def rollup_rows(logs, start=None, end=None):
+    """Rollup rows of the minutes overlapping [start, end] from several logs, as one array."""
+    first = None if start is None else math.floor(start / ROLLUP_INTERVAL) * ROLLUP_INTERVAL
+    rows = [log.array(first, end) for log in logs]
+    return np.concatenate(rows) if rows else np.empty((0, len(ROLLUP_FIELDS)))
+
+
+def summarize_rollups(rows, start=None, end=None):
+    """Totals and dashboard ratios of rollup rows (one per session and minute)."""
+    totals = dict(zip(ROLLUP_FIELDS, rows[:, :-1].sum(axis=0).tolist())) if len(rows) else dict.fromkeys(ROLLUP_FIELDS, 0.0)
+    tracked = totals["tracked"]
+    return {
+        "start": start,
+        "end": end,
+        "minutes": len(np.unique(rows[:, -1])),
+        "trackedTime": tracked,
+        "totalBlinks": int(totals["blinks"]),
+        "blinkRate": totals["blinks"] / (tracked / 60) if tracked > 0 else 0,
+        "totalLookAwayTime": totals["look_away"],
+        "lookAwayRatio": totals["look_away"] / tracked if tracked > 0 else 0,
+        "totalDarkTime": totals["dark"],
+        "ambientLightRatio": 1 - totals["dark"] / tracked if tracked > 0 else 0,
+        "totalCloseTime": totals["close"],
+        "screenDistance": 1 - totals["close"] / totals["distance_time"] if totals["distance_time"] > 0 else 0,
+        "avgDistance": totals["distance_weighted"] / totals["distance_time"] if totals["distance_time"] > 0 else 0,
+    }
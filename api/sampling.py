@@ -0,0 +1,78 @@
+import os
+
+from api.light import DARK_LEVEL, LIGHT_LEVEL, DARK_SHADOWS, LIGHT_SHADOWS
+
+# (fastest, slowest, default) sampling interval in ms of each analyzer's
+# next_sample_ms hint. The default is the hint for a measurement clear of
+# its thresholds and the client's fallback: 50 ms catches every blink with
+# the smoothed EAR, direction and light need about a frame a second, and
+# distance is smoothed and reported as intervals, so 2 s is enough.
+SAMPLE_INTERVALS = {
+    "blink": (20, 100, 50),
+    "direction": (500, 4000, 1000),
+    "light": (1000, 10000, 1000),
+    "distance": (1000, 10000, 2000),
+}
+# Seconds a state has to hold before a clear measurement is sampled at the slowest interval
+STABLE_TIME = 120.0
+# Inference load (frames queued or running per inference worker) above
+# which every hint is stretched in proportion, up to the analyzer's slowest interval;
+# at the default, hints stretch once frames wait for a worker
+SAMPLING_LOAD_TARGET = float(os.environ.get("SAMPLING_LOAD_TARGET", 1.0))
+HINT_STEP_MS = 10  # Hints are rounded to this, so the stream only reports real changes
+
+# How far from a decision threshold a measurement counts as clear of it
+EAR_CLOSING_TIME = 0.3  # Seconds; EAR falling to the close threshold within this is a blink starting
+DIRECTION_MARGIN = 0.05  # Pupil ratio
+LIGHT_MARGIN = 20.0  # Gray levels of mean luma
+SHADOW_MARGIN = 0.2  # Share of shadow pixels
+DISTANCE_MARGIN_CM = 10.0
+
+
+def interval_ms(analyzer, margin, stable_time=0.0, load=0.0):
+    """
+    Sampling interval hint of an analyzer. margin is how clear the latest
+    measurement is of the threshold that would change the analyzer's state,
+    from 0 (at it: fastest interval) to 1 (clear of it: default interval);
+    a clear measurement whose state has held for stable_time seconds slows
+    on toward the slowest interval over STABLE_TIME.
+    """
+    fastest, slowest, default = SAMPLE_INTERVALS[analyzer]
+    margin = min(max(margin, 0.0), 1.0)
+    if margin < 1:
+        interval = fastest + (default - fastest) * margin
+    else:
+        interval = default + (slowest - default) * min(max(stable_time, 0.0) / STABLE_TIME, 1.0)
+    if load > SAMPLING_LOAD_TARGET:
+        interval = min(interval * load / SAMPLING_LOAD_TARGET, slowest)
+    return int(round(interval / HINT_STEP_MS) * HINT_STEP_MS)
+
+
+def boundary_margin(value, boundaries, scale):
+    """Distance of value from the nearest of the boundaries, in units of scale."""
+    return min(abs(value - boundary) for boundary in boundaries) / scale
+
+
+def blink_margin(ear, derivative, close_threshold, open_threshold, closed):
+    """
+    Margin of a smoothed EAR (and its rate of change per second) before the
+    eyes count as closed: 0 while closed or when the current trend reaches
+    the close threshold within EAR_CLOSING_TIME, 1 above the open threshold.
+    """
+    if closed:
+        return 0.0
+    headroom = ear - close_threshold
+    if derivative < 0 and headroom < -derivative * EAR_CLOSING_TIME:
+        return 0.0
+    return headroom / (open_threshold - close_threshold)
+
+
+def light_margin(reading, state):
+    """
+    Margin of a LightReading before classify_light changes state: a light
+    scene turns dark on either a low mean or many shadows, a dark one
+    turns light only when both clear their thresholds.
+    """
+    if state == "dark":
+        return max((LIGHT_LEVEL - reading.brightness) / LIGHT_MARGIN, (reading.shadows - LIGHT_SHADOWS) / SHADOW_MARGIN)
+    return min((reading.brightness - DARK_LEVEL) / LIGHT_MARGIN, (DARK_SHADOWS - reading.shadows) / SHADOW_MARGIN)
@@ -0,0 +1,82 @@
+"""
+Response schemas of the frame endpoints, for the OpenAPI docs and typed
+clients. Endpoints return encoded responses directly (see api/encoding.py),
+so these are not validated per frame. Every response may instead carry
+"status": "dropped" (the frame was replaced by a newer one; the fields
+then hold the session's last known values) or
+"status": "error" with an "error" message.
+
+next_sample_ms is the server's hint for when the analyzer wants its next
+frame, in milliseconds (see api/sampling.py).
+"""
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+Direction = Literal["left", "right", "center", "unknown"]
+LightState = Literal["light", "dark"]
+DistanceState = Literal["close", "med", "far"]
+
+
+class FrameStatus(BaseModel):
+    status: Optional[Literal["dropped", "error"]] = None
+    error: Optional[str] = None
+
+
+class DirectionChange(BaseModel):
+    looking_away: Literal[0, 1]
+    timestamp: float
+
+
+class LightChange(BaseModel):
+    ambient_light: LightState
+    timestamp: float
+
+
+class DistanceChange(BaseModel):
+    distance: DistanceState
+    start_time: float
+    end_time: float
+
+
+class FrameAnalysisResponse(FrameStatus):
+    """Result of /api/py/analyze-frame; only the fields of the requested analyzers are set."""
+    brightness: Optional[float] = None
+    exposure: Optional[float] = None
+    amb_light: Optional[LightState] = None
+    face_detected: Optional[bool] = None
+    direction: Optional[Direction] = None
+    is_blinking: Optional[bool] = None
+    ear: Optional[float] = None
+    distance_cm: Optional[float] = None
+    next_sample_ms: Optional[Dict[str, int]] = None  # Per requested analyzer
+
+
+class DirectionResponse(FrameStatus):
+    direction: Optional[Direction] = None
+    is_blinking: Optional[bool] = None
+    direction_changes: List[DirectionChange] = []
+    cursor: Optional[int] = None
+    next_sample_ms: Optional[int] = None
+
+
+class BlinkResponse(FrameStatus):
+    is_blinking: Optional[bool] = None
+    blink_timestamps: List[float] = []
+    cursor: Optional[int] = None
+    next_sample_ms: Optional[int] = None
+
+
+class AmbientLightResponse(FrameStatus):
+    amb_light: Optional[LightState] = None
+    timestamp: Optional[float] = None
+    state_changes: List[LightChange] = []
+    cursor: Optional[int] = None
+    next_sample_ms: Optional[int] = None
+
+
+class DistanceResponse(FrameStatus):
+    distance_cm: Optional[float] = None
+    distance_changes: List[DistanceChange] = []
+    cursor: Optional[int] = None
+    next_sample_ms: Optional[int] = None
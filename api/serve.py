@@ -0,0 +1,79 @@
+"""
+Run the API on several worker processes with session affinity.
+
+    python -m api.serve --workers 4 --port 3001
+
+All workers accept connections on the shared --port. Each one also listens
+on a private port (--port + 1 + worker index) at which the others forward
+requests of the sessions it owns (see api/affinity.py), so every session's
+frames reach the same warm FaceMesh whichever worker accepted them.
+Session ownership and other shared state live in the STATE_BACKEND store,
+which defaults to a SQLite file here when there is more than one worker.
+For several hosts, point STATE_BACKEND=redis at a shared server and set
+--advertise-host to an address the other hosts can reach.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+
+def bind(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sockets, address, log_level):
+    # Read by api.index at import, which uvicorn does in this process
+    os.environ["WORKER_ADDRESS"] = address
+    import uvicorn
+
+    config = uvicorn.Config("api.index:app", log_level=log_level)
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--advertise-host", help="Host other workers reach this one at (default: --host)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        os.environ.setdefault("STATE_BACKEND", "sqlite")
+    advertise = args.advertise_host or ("127.0.0.1" if args.host in ("0.0.0.0", "::") else args.host)
+
+    public = bind(args.host, args.port)
+    # Spawned like uvicorn's own workers: MediaPipe and the event loop are not fork-safe
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(args.workers):
+        port = args.port + 1 + i
+        private = bind(args.host, port)
+        worker = context.Process(
+            target=run_worker, args=([public, private], f"{advertise}:{port}", args.log_level), name=f"worker-{i}"
+        )
+        worker.start()
+        private.close()  # The worker has its own copy
+        workers.append(worker)
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for worker in workers:
+        worker.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
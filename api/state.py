@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class MemoryStateStore:
+    """
+    State shared by the requests of one process: plain keys with optional
+    expiry and string maps (hashes). The SQLite and Redis stores offer the
+    same methods for state shared between workers and hosts.
+    """
+
+    def __init__(self):
+        self._values = {}  # key -> (value, expires at or None)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        item = self._values.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._values[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._live(key, time.time())
+            return item[0] if item else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def claim(self, key, value, ttl):
+        """
+        Set key to value unless another value holds it; refreshes the expiry
+        if value already holds it. Returns the value holding the key.
+        """
+        with self._lock:
+            now = time.time()
+            item = self._live(key, now)
+            if item is None or item[0] == value:
+                self._values[key] = (value, now + ttl)
+                return value
+            return item[0]
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def hset(self, name, field, value):
+        with self._lock:
+            self._hashes.setdefault(name, {})[field] = value
+
+    def hget(self, name, field):
+        with self._lock:
+            return self._hashes.get(name, {}).get(field)
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._hashes.get(name, {}))
+
+    def hdel(self, name, field):
+        with self._lock:
+            self._hashes.get(name, {}).pop(field, None)
+
+
+class SQLiteStateStore:
+    """
+    State shared by the worker processes of one host through a SQLite file
+    in WAL mode, so readers never wait for the writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # One connection per thread
+        db = self._connection()
+        db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS hashes (name TEXT, field TEXT, value TEXT, PRIMARY KEY (name, field))")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, time.time() + ttl if ttl else None)
+        )
+
+    def claim(self, key, value, ttl):
+        db = self._connection()
+        now = time.time()
+        # One statement: take the key if it is free, expired or already ours
+        db.execute(
+            "INSERT INTO kv VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "expires = excluded.expires WHERE kv.value = excluded.value OR kv.expires <= ?",
+            (key, value, now + ttl, now),
+        )
+        return self.get(key)
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def hset(self, name, field, value):
+        self._connection().execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)", (name, field, value))
+
+    def hget(self, name, field):
+        row = self._connection().execute(
+            "SELECT value FROM hashes WHERE name = ? AND field = ?", (name, field)
+        ).fetchone()
+        return row[0] if row else None
+
+    def hgetall(self, name):
+        return dict(self._connection().execute("SELECT field, value FROM hashes WHERE name = ?", (name,)))
+
+    def hdel(self, name, field):
+        self._connection().execute("DELETE FROM hashes WHERE name = ? AND field = ?", (name, field))
+
+
+class RedisStateStore:
+    """
+    State shared between hosts through Redis (or a server speaking its
+    protocol). `client` is a redis.Redis with decode_responses=True, or a
+    FakeRedis for local runs and tests.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def claim(self, key, value, ttl):
+        px = int(ttl * 1000)
+        if self.client.set(key, value, nx=True, px=px):
+            return value
+        owner = self.client.get(key)
+        if owner == value:
+            self.client.pexpire(key, px)
+        elif owner is None:  # Expired between the two calls
+            return self.claim(key, value, ttl)
+        return owner
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def hset(self, name, field, value):
+        self.client.hset(name, field, value)
+
+    def hget(self, name, field):
+        return self.client.hget(name, field)
+
+    def hgetall(self, name):
+        return self.client.hgetall(name)
+
+    def hdel(self, name, field):
+        self.client.hdel(name, field)
+
+
+class FakeRedis:
+    """In-process stand-in for the Redis commands RedisStateStore uses, with string replies."""
+
+    def __init__(self):
+        self._store = MemoryStateStore()
+
+    def get(self, key):
+        return self._store.get(key)
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and self._store.get(key) is not None:
+            return None
+        self._store.set(key, value, px / 1000 if px else None)
+        return True
+
+    def pexpire(self, key, px):
+        value = self._store.get(key)
+        if value is not None:
+            self._store.set(key, value, px / 1000)
+
+    def delete(self, key):
+        self._store.delete(key)
+
+    def hset(self, name, field, value):
+        self._store.hset(name, field, value)
+
+    def hget(self, name, field):
+        return self._store.hget(name, field)
+
+    def hgetall(self, name):
+        return self._store.hgetall(name)
+
+    def hdel(self, name, field):
+        self._store.hdel(name, field)
+
+
+def create_state_store():
+    """
+    Pick the state backend from STATE_BACKEND: "memory" (one process),
+    "sqlite" (workers of one host, file at STATE_SQLITE_PATH), "redis"
+    (REDIS_URL, needs the redis package) or "fake" (RedisStateStore on
+    FakeRedis).
+    """
+    backend = os.environ.get("STATE_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(
+            os.environ.get("STATE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "eyecare-state.db"))
+        )
+    if backend == "redis":
+        import redis
+
+        return RedisStateStore(redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True))
+    if backend == "fake":
+        return RedisStateStore(FakeRedis())
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
@@ -0,0 +1,124 @@
+import math
+import os
+
+# Samples further apart than this (seconds) restart a filter instead of being smoothed together
+FILTER_RESET_GAP = 1.0
+
+# Fixed EAR thresholds, used until the session has an open-eye baseline
+EAR_THRESHOLD = 0.25
+EAR_OPEN_THRESHOLD = 0.28
+# Eyes close below CLOSE_RATIO and reopen above OPEN_RATIO of the open-eye baseline
+EAR_CLOSE_RATIO = float(os.environ.get("EAR_CLOSE_RATIO", 0.7))
+EAR_OPEN_RATIO = float(os.environ.get("EAR_OPEN_RATIO", 0.8))
+EAR_BASELINE_TIME_CONSTANT = 10.0  # Seconds of open-eye EAR the baseline averages over
+EAR_BASELINE_MIN_SAMPLES = 3  # Open-eye samples needed before the baseline is used
+EAR_BASELINE_RANGE = (0.15, 0.6)  # Plausible open-eye EAR; keeps a squint from dragging the baseline down
+MIN_BLINK_INTERVAL = 0.25  # Seconds between the starts of two separate blinks
+
+
+class OneEuroFilter:
+    """
+    One-euro filter (Casiez et al., 2012) for a scalar signal sampled at
+    irregular times: an exponential moving average whose cutoff frequency
+    rises with the signal's speed, so slow jitter is smoothed while fast
+    movements pass with little lag. With beta=0 it is a plain time-aware EMA.
+
+    Samples are taken with their capture timestamps; a sample that is not
+    newer than the previous one (a late or duplicate frame) leaves the
+    filter unchanged.
+    """
+
+    __slots__ = ("min_cutoff", "beta", "d_cutoff", "value", "derivative", "timestamp")
+
+    def __init__(self, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.derivative = 0.0
+        self.timestamp = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, value, timestamp):
+        """Add a sample and return the filtered value."""
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return self.value
+        if self.timestamp is None or timestamp - self.timestamp > FILTER_RESET_GAP:
+            self.value, self.derivative, self.timestamp = value, 0.0, timestamp
+            return value
+
+        dt = timestamp - self.timestamp
+        speed = (value - self.value) / dt
+        self.derivative += self._alpha(self.d_cutoff, dt) * (speed - self.derivative)
+        cutoff = self.min_cutoff + self.beta * abs(self.derivative)
+        self.value += self._alpha(cutoff, dt) * (value - self.value)
+        self.timestamp = timestamp
+        return self.value
+
+
+class BlinkDetector:
+    """
+    Blink state machine over EAR samples with capture timestamps.
+
+    The eyes count as closed when EAR drops below EAR_CLOSE_RATIO of the
+    session's open-eye baseline and as open again only above
+    EAR_OPEN_RATIO of it, so noise around a single threshold cannot
+    produce phantom blinks. The baseline is a time-aware moving average of
+    EAR while the eyes are open, so it adapts to the user's eye shape,
+    camera angle and distance.
+    """
+
+    __slots__ = ("baseline", "baseline_samples", "baseline_time", "closed", "last_blink", "timestamp")
+
+    def __init__(self):
+        self.baseline = None
+        self.baseline_samples = 0
+        self.baseline_time = None
+        self.closed = False
+        self.last_blink = None  # Capture time of the last counted blink
+        self.timestamp = None  # Capture time of the last sample
+
+    def thresholds(self):
+        """(close, open) EAR thresholds."""
+        if self.baseline_samples < EAR_BASELINE_MIN_SAMPLES:
+            return EAR_THRESHOLD, EAR_OPEN_THRESHOLD
+        return self.baseline * EAR_CLOSE_RATIO, self.baseline * EAR_OPEN_RATIO
+
+    def _update_baseline(self, ear, timestamp):
+        ear = min(max(ear, EAR_BASELINE_RANGE[0]), EAR_BASELINE_RANGE[1])
+        if self.baseline is None:
+            self.baseline = ear
+        else:
+            dt = timestamp - self.baseline_time
+            self.baseline += (1 - math.exp(-dt / EAR_BASELINE_TIME_CONSTANT)) * (ear - self.baseline)
+        self.baseline_time = timestamp
+        self.baseline_samples += 1
+
+    def update(self, ear, timestamp):
+        """
+        Add an EAR sample. Returns True if it starts a new blink.
+        Samples older than the previous one are ignored.
+        """
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return False
+        self.timestamp = timestamp
+
+        close_threshold, open_threshold = self.thresholds()
+        if not self.closed:
+            if ear < close_threshold:
+                self.closed = True
+                if self.last_blink is None or timestamp - self.last_blink >= MIN_BLINK_INTERVAL:
+                    self.last_blink = timestamp
+                    return True
+            elif ear > open_threshold:
+                self._update_baseline(ear, timestamp)
+        elif ear > open_threshold:
+            self.closed = False
+        return False
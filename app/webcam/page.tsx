@@ -1,6 +1,6 @@
 'use client';
 
-import { useEffect, useRef, useState } from 'react';
+import { MutableRefObject, useEffect, useRef, useState } from 'react';
 import Link from 'next/link';
 
 export default function WebcamPage() {
@@ -107,19 +107,19 @@ export default function WebcamPage() {
       await saveSession();
 
       if (directionIntervalRef.current) {
-        clearInterval(directionIntervalRef.current);
+        clearTimeout(directionIntervalRef.current);
         directionIntervalRef.current = null;
       }
       if (blinkIntervalRef.current) {
-        clearInterval(blinkIntervalRef.current);
+        clearTimeout(blinkIntervalRef.current);
         blinkIntervalRef.current = null;
       }
       if (ambientLightIntervalRef.current) {
-        clearInterval(ambientLightIntervalRef.current);
+        clearTimeout(ambientLightIntervalRef.current);
         ambientLightIntervalRef.current = null;
       }
       if (distanceIntervalRef.current) {
-        clearInterval(distanceIntervalRef.current);
+        clearTimeout(distanceIntervalRef.current);
         distanceIntervalRef.current = null;
       }
 
@@ -146,7 +146,11 @@ export default function WebcamPage() {
     return null;
   };
 
-  const sendFrameToAPI = async (frame: string, endpoint: string) => {
+  // The capture time lets the server smooth and debounce on when frames were taken, not when they arrive.
+  // Resolves to the server's hint for when the endpoint wants its next frame (ms), if it sent one.
+  const sendFrameToAPI = async (
+    frame: string, endpoint: string, timestamp: number = Date.now() / 1000
+  ): Promise<number | undefined> => {
     try {
       console.log(`Sending frame to ${endpoint}`);
       const response = await fetch(endpoint, {
@@ -154,7 +158,7 @@ export default function WebcamPage() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ frame }),
+        body: JSON.stringify({ frame, timestamp }),
       });
       
       const data = await response.json();
@@ -172,59 +176,56 @@ export default function WebcamPage() {
       } else if (endpoint === '/api/py/check-distance') {
         setDistance(data.distance_cm || "unknown");
       }
+      return typeof data.next_sample_ms === 'number' ? data.next_sample_ms : undefined;
     } catch (error) {
       console.error('Error sending frame to API:', error);
+      return undefined;
     }
   };
 
   useEffect(() => {
+    // Cleared on cleanup, so responses still in flight do not schedule another frame
+    let active = true;
     if (isStreaming) {
       console.log("Starting frame capture intervals");
       
-      directionIntervalRef.current = setInterval(() => {
-        const frame = captureFrame();
-        if (frame) {
-          sendFrameToAPI(frame, '/api/py/detect-eye-direction');
-        }
-      }, 1000);
-
-      blinkIntervalRef.current = setInterval(() => {
-        const frame = captureFrame();
-        if (frame) {
-          sendFrameToAPI(frame, '/api/py/detect-blink');
-        }
-      }, 10);
+      // Each endpoint samples at the interval the server hints in its last response (faster near a
+      // state change, slower while the state holds or the server is busy), or at its default
+      const sample = (
+        timerRef: MutableRefObject<NodeJS.Timeout | null>, endpoint: string, defaultMs: number,
+        delayMs: number = defaultMs
+      ) => {
+        timerRef.current = setTimeout(async () => {
+          const frame = captureFrame();
+          const nextMs = frame ? await sendFrameToAPI(frame, endpoint) : undefined;
+          if (active) {
+            sample(timerRef, endpoint, defaultMs, nextMs ?? defaultMs);
+          }
+        }, delayMs);
+      };
 
-      ambientLightIntervalRef.current = setInterval(() => {
-        const frame = captureFrame();
-        if (frame) {
-          sendFrameToAPI(frame, '/api/py/detect-ambient-light');
-        }
-      }, 1000);
-
-      distanceIntervalRef.current = setInterval(() => {
-        const frame = captureFrame();
-        if (frame) {
-          sendFrameToAPI(frame, '/api/py/check-distance');
-        }
-      }, 500);
+      sample(directionIntervalRef, '/api/py/detect-eye-direction', 1000);
+      sample(blinkIntervalRef, '/api/py/detect-blink', 50);
+      sample(ambientLightIntervalRef, '/api/py/detect-ambient-light', 1000);
+      sample(distanceIntervalRef, '/api/py/check-distance', 2000);
     }
 
     return () => {
+      active = false;
       if (directionIntervalRef.current) {
-        clearInterval(directionIntervalRef.current);
+        clearTimeout(directionIntervalRef.current);
         directionIntervalRef.current = null;
       }
       if (blinkIntervalRef.current) {
-        clearInterval(blinkIntervalRef.current);
+        clearTimeout(blinkIntervalRef.current);
         blinkIntervalRef.current = null;
       }
       if (ambientLightIntervalRef.current) {
-        clearInterval(ambientLightIntervalRef.current);
+        clearTimeout(ambientLightIntervalRef.current);
         ambientLightIntervalRef.current = null;
       }
       if (distanceIntervalRef.current) {
-        clearInterval(distanceIntervalRef.current);
+        clearTimeout(distanceIntervalRef.current);
         distanceIntervalRef.current = null;
       }
     };
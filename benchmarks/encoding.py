@@ -0,0 +1,120 @@
+"""
+Encode time and payload size of frame responses.
+
+    python -m benchmarks.encoding [--repeat 20000]
+
+Encodes typical responses of the frame endpoints with:
+  fastapi      the previous path, jsonable_encoder and JSONResponse (json module)
+  validated    a response_model round trip (pydantic validation and dump), for reference
+  json         api.encoding without orjson (compact json module output)
+  orjson       api.encoding's JSON response
+  msgpack      the MessagePack response (Accept: application/msgpack)
+and prints the time per response in microseconds and the body size in bytes.
+"""
+import argparse
+import json
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import api.encoding as encoding
+from api.schemas import BlinkResponse, DirectionResponse, DistanceResponse, FrameAnalysisResponse
+
+NOW = 1760000000.0
+
+# Response data as the endpoints build it, with the schema that documents it
+RESPONSES = {
+    "blink (no new events)": (BlinkResponse, {"is_blinking": False, "blink_timestamps": [], "cursor": 42}),
+    "blink (3 new blinks)": (
+        BlinkResponse, {"is_blinking": True, "blink_timestamps": [NOW + 0.31, NOW + 2.95, NOW + 6.12], "cursor": 45},
+    ),
+    "direction (2 changes)": (
+        DirectionResponse,
+        {
+            "direction": "left", "is_blinking": False, "cursor": 8,
+            "direction_changes": [{"looking_away": 1, "timestamp": NOW}, {"looking_away": 0, "timestamp": NOW + 4.2}],
+        },
+    ),
+    "distance (1 change)": (
+        DistanceResponse,
+        {
+            "distance_cm": 63.2718, "cursor": 3,
+            "distance_changes": [{"distance": "close", "start_time": NOW, "end_time": NOW + 12.5}],
+        },
+    ),
+    "analyze-frame": (
+        FrameAnalysisResponse,
+        {
+            "brightness": 117.381, "exposure": -0.1172, "amb_light": "light", "face_detected": True,
+            "direction": "center", "is_blinking": False, "ear": 0.29381, "distance_cm": 63.2718,
+        },
+    ),
+}
+
+
+def fastapi_encode(model, data):
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def validated_encode(model, data):
+    return JSONResponse(model.model_validate(data).model_dump(mode="json")).body
+
+
+def json_encode(model, data):
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def orjson_encode(model, data):
+    return encoding.FastJSONResponse(data).body
+
+
+def msgpack_encode(model, data):
+    return encoding.msgpack.packb(data)
+
+
+ENCODERS = {
+    "fastapi": fastapi_encode,
+    "validated": validated_encode,
+    "json": json_encode,
+    "orjson": orjson_encode,
+    "msgpack": msgpack_encode,
+}
+
+
+def timed(fn, model, data, repeat):
+    """Best of three runs, in microseconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(model, data)
+        best = min(best, time.perf_counter() - start)
+    return best / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000, help="Encodes per measurement")
+    args = parser.parse_args()
+
+    encoders = dict(ENCODERS)
+    if encoding.orjson is None:
+        print("orjson is not installed; the orjson row uses the json module fallback")
+    if encoding.msgpack is None:
+        print("msgpack is not installed; skipping MessagePack")
+        del encoders["msgpack"]
+
+    print(f"{'response':24}" + "".join(f"{name:>18}" for name in encoders))
+    for label, (model, data) in RESPONSES.items():
+        cells = []
+        for fn in encoders.values():
+            size = len(fn(model, data))
+            cells.append(f"{timed(fn, model, data, args.repeat):8.2f} us {size:4d} B")
+        print(f"{label:24}" + "".join(f"{cell:>18}" for cell in cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
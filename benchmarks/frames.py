@@ -0,0 +1,54 @@
+"""
+Recorded frame sequences for the benchmark and accuracy scripts.
+
+A recording is a directory of JPEG frames named so that they sort in capture
+order (e.g. frame_00001.jpg), as saved from the webcam page's canvas.
+"""
+import csv
+import glob
+import os
+
+# Benchmarks never send real push notifications
+os.environ.setdefault("NOTIFICATION_BACKEND", "fake")
+
+
+def frame_paths(directory):
+    paths = sorted(
+        path for pattern in ("*.jpg", "*.jpeg")
+        for path in glob.glob(os.path.join(directory, pattern))
+    )
+    if not paths:
+        raise SystemExit(f"No JPEG frames found in {directory}")
+    return paths
+
+
+def read_frames(directory):
+    """Yield (name, encoded JPEG bytes) for each frame of a recording."""
+    for path in frame_paths(directory):
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read()
+
+
+def read_labels(directory):
+    """
+    Ground-truth labels of a recording from labels.csv, or None if it has none.
+
+    labels.csv has a `frame` column with the frame file name and optional
+    `blink` (1 while the eyes are closed) and `direction` ("left", "right"
+    or "center") columns; empty cells are unlabeled.
+    """
+    path = os.path.join(directory, "labels.csv")
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="") as f:
+        return {row["frame"]: row for row in csv.DictReader(f)}
+
+
+def blink_onsets(blinking):
+    """Indexes where a sequence of per-frame blinking flags turns on."""
+    onsets, previous = [], False
+    for i, current in enumerate(blinking):
+        if current and not previous:
+            onsets.append(i)
+        previous = current
+    return onsets
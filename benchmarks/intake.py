@@ -0,0 +1,75 @@
+"""
+Allocations and time of frame intake for each request body layout.
+
+    python -m benchmarks.intake path/to/frames
+
+For every frame, each layout goes from the request body bytes to the
+FrameAnalysis input the way the endpoints do it: JSON with a base64 data
+URL, a raw image/jpeg body, and raw gray and RGB pixels. Reports the
+body size, the bytes allocated while decoding (tracemalloc peak) and the
+decode time per frame.
+"""
+import argparse
+import base64
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.frames import read_frames
+import api.index as index
+
+
+def bodies(jpeg):
+    """Request bodies of one frame per layout, with the RawFrame fields each endpoint would build."""
+    frame = index.cv2.imdecode(np.frombuffer(jpeg, np.uint8), index.cv2.IMREAD_COLOR)
+    height, width = frame.shape[:2]
+    data_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+    return {
+        "json": (json.dumps({"frame": data_url, "userId": "benchmark"}).encode(), None),
+        "jpeg": (jpeg, ("jpeg", None, None)),
+        "gray": (index.cv2.cvtColor(frame, index.cv2.COLOR_BGR2GRAY).tobytes(), ("gray", width, height)),
+        "rgb": (index.cv2.cvtColor(frame, index.cv2.COLOR_BGR2RGB).tobytes(), ("rgb", width, height)),
+    }
+
+
+def intake(body, layout):
+    """Body bytes to FrameAnalysis keyword arguments, as run_analysis decodes them."""
+    if layout is None:
+        return index.decode_input(json.loads(body)["frame"])
+    return index.decode_input(index.RawFrame(body, *layout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    args = parser.parse_args()
+
+    frames = [bodies(jpeg) for _, jpeg in read_frames(args.frames)]
+    print(f"frames: {len(frames)}")
+    print(f"{'layout':<8}{'body KB':>10}{'alloc KB':>10}{'decode ms':>11}")
+    for name in frames[0]:
+        sizes, allocated, times = [], [], []
+        for frame in frames:
+            body, layout = frame[name]
+            tracemalloc.start()
+            decoded = intake(body, layout)
+            allocated.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            del decoded
+
+            start = time.perf_counter()
+            intake(body, layout)
+            times.append(time.perf_counter() - start)
+            sizes.append(len(body))
+        print(
+            f"{name:<8}{np.mean(sizes) / 1024:>10.1f}{np.mean(allocated) / 1024:>10.1f}"
+            f"{np.mean(times) * 1000:>11.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
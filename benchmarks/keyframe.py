@@ -0,0 +1,109 @@
+"""
+Cost and accuracy of keyframe landmark tracking: replays a recording through
+the landmark analyzers once with FaceMesh on every frame and once with
+FaceMesh on keyframes and optical flow in between, and compares the two.
+
+    python -m benchmarks.keyframe path/to/frames [--interval 4] [--fps 100]
+
+Full inference is the reference. Reports the time per frame (decode
+excluded) and the share of frames FaceMesh ran on, the error of the tracked
+landmarks relative to the eye width, the EAR, pupil ratio and distance
+differences, and blink recall with an onset tolerance of --match-frames.
+Motion gating is off in both runs. Try tracking settings with the
+KEYFRAME_MAX_ERROR environment variable.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.frames import read_frames, blink_onsets
+from api.landmarks import EYE_INDICES, eye_aspect_ratios, pupil_ratios
+import api.index as index
+import api.keyframe as keyframe
+import api.motion as motion
+
+ANALYZERS = ("direction", "blink", "distance")
+
+
+def replay(frames, interval, fps):
+    """Run every frame through a fresh session; returns per-frame results and landmarks, the stats and total time."""
+    keyframe.KEYFRAME_INTERVAL = interval
+    stats = keyframe.KeyframeStats()
+    tracker = index.SessionTracker(f"keyframe-{interval}")
+    tracker.landmark_tracker = keyframe.LandmarkTracker(stats)
+    results, landmarks = [], []
+    elapsed = 0.0
+    try:
+        for i, frame in enumerate(frames):
+            start = time.perf_counter()
+            analysis = index.FrameAnalysis(
+                frame, face_mesh=tracker.face_mesh, roi=tracker.roi, face_detection=tracker.face_detection,
+                timestamp=i / fps, keyframes=tracker.landmark_tracker,
+            )
+            results.append(index.analyze_frame(tracker, analysis, ANALYZERS))
+            elapsed += time.perf_counter() - start
+            landmarks.append(analysis.landmarks)
+    finally:
+        tracker.close()
+    return results, landmarks, stats.stats(), elapsed
+
+
+def mean_max(values, scale=1):
+    return f"mean {np.mean(values) * scale:.4f}, max {np.max(values) * scale:.4f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    parser.add_argument("--interval", type=int, default=4, help="Frames per keyframe")
+    parser.add_argument("--fps", type=float, default=30, help="Capture rate of the recording")
+    parser.add_argument("--match-frames", type=int, default=2, help="Onset tolerance in frames")
+    args = parser.parse_args()
+
+    motion.MOTION_GATING = False
+    frames = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) for _, jpeg in read_frames(args.frames)]
+    full, full_landmarks, _, full_time = replay(frames, 1, args.fps)
+    tracked, tracked_landmarks, stats, tracked_time = replay(frames, args.interval, args.fps)
+
+    pairs = [(a, b) for a, b in zip(full_landmarks, tracked_landmarks) if a is not None and b is not None]
+    reference = np.stack([a for a, _ in pairs])
+    estimate = np.stack([b for _, b in pairs])
+    eye_width = np.linalg.norm(
+        reference[:, EYE_INDICES[:, 0], :2] - reference[:, EYE_INDICES[:, 3], :2], axis=-1
+    ).mean(axis=1)
+    # Error of the points the analyzers read, relative to the eye width of the frame
+    point_error = np.linalg.norm(
+        estimate[:, keyframe.TRACKED_INDICES, :2] - reference[:, keyframe.TRACKED_INDICES, :2], axis=-1
+    ).mean(axis=1) / eye_width
+    ear_error = np.abs(eye_aspect_ratios(estimate).mean(axis=1) - eye_aspect_ratios(reference).mean(axis=1))
+    pupil_error = np.abs(pupil_ratios(estimate)[..., 0].mean(axis=1) - pupil_ratios(reference)[..., 0].mean(axis=1))
+    distance_error = [
+        abs(a["distance_cm"] - b["distance_cm"]) / a["distance_cm"] for a, b in zip(full, tracked)
+        if a["distance_cm"] and b["distance_cm"]
+    ]
+    expected = blink_onsets([result["is_blinking"] for result in full])
+    found = blink_onsets([result["is_blinking"] for result in tracked])
+    matched = sum(any(abs(a - b) <= args.match_frames for b in found) for a in expected)
+    directions = np.mean([a["direction"] == b["direction"] for a, b in zip(full, tracked)])
+
+    print(f"frames:                {len(frames)} (face in {len(pairs)} of both runs)")
+    print(f"keyframes:             {stats['keyframes']} ({stats['keyframe_ratio']:.1%}), {stats['lost']} after lost tracking")
+    print(f"full FaceMesh time:    {full_time * 1000 / len(frames):.2f} ms/frame")
+    print(f"keyframe time:         {tracked_time * 1000 / len(frames):.2f} ms/frame ({full_time / tracked_time:.1f}x faster)")
+    print(f"landmark error:        {mean_max(point_error, 100)} % of eye width")
+    print(f"EAR difference:        {mean_max(ear_error)}")
+    print(f"pupil ratio diff:      {mean_max(pupil_error)}")
+    if distance_error:
+        print(f"distance difference:   {mean_max(distance_error, 100)} %")
+    print(f"direction agreement:   {directions:.1%}")
+    print(f"blinks:                {len(expected)} full, {len(found)} keyframe")
+    if expected:
+        print(f"blink recall:          {matched / len(expected):.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Cost and agreement of the ambient light estimate.
+
+    python -m benchmarks.light path/to/frames [--darken 0.4]
+
+For every recorded JPEG frame, compares the full path (color decode,
+full-frame gray conversion and mean) with the light-only path of
+/api/py/detect-ambient-light (reduced grayscale decode and a sampled luma
+histogram). Prints the time per frame of both, how far the reduced
+brightness is from the full one, and whether both call the frame light
+or dark. --darken also runs a darkened copy of each frame (gain < 1) so
+the dark side of the threshold is covered.
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.frames import read_frames
+from api.light import LightReading, measure_light, classify_light
+import api.index as index
+
+
+def full_path(jpeg):
+    """Brightness the way the endpoint measured it before the reduced path."""
+    frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    return float(np.mean(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+
+
+def reduced_path(jpeg):
+    analysis = index.FrameAnalysis(**index.decode_input(index.RawFrame(jpeg), light_only=True))
+    return measure_light(analysis.luma_sample())
+
+
+def timed_runs(fn, frames, repeat=3):
+    """Per-frame results of fn and its best-of-repeat time per frame in ms."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [fn(jpeg) for jpeg in frames]
+        best = min(best, time.perf_counter() - start)
+    return results, best / len(frames) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    parser.add_argument("--darken", type=float, help="Also run frames scaled by this gain")
+    args = parser.parse_args()
+
+    frames = [jpeg for _, jpeg in read_frames(args.frames)]
+    if args.darken:
+        for jpeg in list(frames):
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            dark = cv2.convertScaleAbs(frame, alpha=args.darken)
+            frames.append(cv2.imencode(".jpg", dark, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+
+    full, full_ms = timed_runs(full_path, frames)
+    reduced, reduced_ms = timed_runs(reduced_path, frames)
+
+    errors = [abs(r.brightness - f) for r, f in zip(reduced, full)]
+    # The old rule was a fixed threshold on the mean; the new one also counts shadows
+    full_states = ["light" if f >= 70 else "dark" for f in full]
+    reduced_states = [classify_light(r) for r in reduced]
+    agreement = np.mean([a == b for a, b in zip(full_states, reduced_states)])
+
+    print(f"frames:                {len(frames)}")
+    print(f"full decode + mean:    {full_ms:.2f} ms/frame")
+    print(f"reduced + histogram:   {reduced_ms:.2f} ms/frame ({full_ms / reduced_ms:.1f}x faster)")
+    print(f"brightness error:      mean {np.mean(errors):.2f}, max {np.max(errors):.2f} gray levels")
+    print(f"light/dark agreement:  {agreement:.1%} ({reduced_states.count('dark')} dark)")
+    fields = ", ".join(f"{name} {np.mean([getattr(r, name) for r in reduced]):.2f}" for name in LightReading._fields)
+    print(f"mean reading:          {fields}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Skip ratio and blink-detection recall of motion gating: replays a recording
+through the analyzers with and without the motion gate and compares the
+blinks found.
+
+    python -m benchmarks.motion_gating path/to/frames [--match-frames 2]
+
+Blinks found without gating are the reference; a gated blink matches one
+that starts within --match-frames frames of it. Try different thresholds
+with the MOTION_THRESHOLD, EYE_MOTION_THRESHOLD and MOTION_MAX_SKIP
+environment variables.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.frames import read_frames, blink_onsets
+import api.index as index
+import api.motion as motion
+
+
+def replay(frames, gating, fps):
+    """Run every frame through a fresh session; returns per-frame results, the gate stats and total time."""
+    motion.MOTION_GATING = gating
+    stats = motion.MotionStats()
+    tracker = index.SessionTracker(f"motion-{gating}")
+    tracker.motion_gate = motion.MotionGate(stats)
+    results = []
+    elapsed = 0.0
+    try:
+        for i, (_, jpeg) in enumerate(frames):
+            frame = index.cv2.imdecode(np.frombuffer(jpeg, np.uint8), index.cv2.IMREAD_COLOR)
+            start = time.perf_counter()
+            analysis = index.FrameAnalysis(
+                frame, face_mesh=tracker.face_mesh, roi=tracker.roi, face_detection=tracker.face_detection,
+                timestamp=i / fps,
+            )
+            results.append(index.analyze_frame(tracker, analysis, ("blink",)))
+            elapsed += time.perf_counter() - start
+    finally:
+        tracker.close()
+    return results, stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    parser.add_argument("--fps", type=float, default=30, help="Capture rate of the recording")
+    parser.add_argument("--match-frames", type=int, default=2, help="Onset tolerance in frames")
+    args = parser.parse_args()
+
+    frames = list(read_frames(args.frames))
+    full, _, full_time = replay(frames, gating=False, fps=args.fps)
+    gated, stats, gated_time = replay(frames, gating=True, fps=args.fps)
+
+    reference = blink_onsets([result["is_blinking"] for result in full])
+    found = blink_onsets([result["is_blinking"] for result in gated])
+    matched = sum(any(abs(a - b) <= args.match_frames for b in found) for a in reference)
+    ear_errors = [
+        abs(a["ear"] - b["ear"]) for a, b in zip(full, gated)
+        if a["ear"] is not None and b["ear"] is not None
+    ]
+    stats = stats.stats()
+
+    print(f"frames:                {len(frames)}")
+    print(f"skipped:               {stats['skipped']} ({stats['skip_ratio']:.1%})")
+    print(f"forced by eye motion:  {stats['eye_motion']}")
+    print(f"ungated time:          {full_time * 1000 / len(frames):.2f} ms/frame")
+    print(f"gated time:            {gated_time * 1000 / len(frames):.2f} ms/frame")
+    print(f"blinks (ungated):      {len(reference)}")
+    print(f"blinks (gated):        {len(found)}")
+    if reference:
+        print(f"blink recall:          {matched / len(reference):.1%}")
+    if ear_errors:
+        print(f"EAR difference:        mean {np.mean(ear_errors):.4f}, max {np.max(ear_errors):.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
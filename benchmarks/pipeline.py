@@ -0,0 +1,197 @@
+"""
+Latency, throughput and accuracy of the frame pipeline on recorded frames.
+
+    python -m benchmarks.pipeline path/to/frames
+    python -m benchmarks.pipeline --synthetic face.jpg [--frames 300] [--size 1280x720]
+
+Each frame goes through the same steps as the per-frame endpoints
+(/api/py/detect-eye-direction, detect-blink, check-distance and
+detect-ambient-light): data URL decode, color conversion, FaceMesh on
+keyframes with landmark tracking in between, the analyzers and encoding
+of the response as the server does it (api.encoding: JSON, or MessagePack
+with --msgpack). The script reports p50/p99
+latency per stage, frames/s per core and peak RSS.
+
+If the recording has a labels.csv (see benchmarks.frames.read_labels),
+the blink count and gaze direction are checked against it, and the
+script exits non-zero when they are off by more than the limits.
+--synthetic builds an unlabeled recording by moving a face image (a
+cropped portrait works best) around a frame, which is enough for timing.
+"""
+import argparse
+import base64
+import os
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.frames import read_frames, read_labels, blink_onsets
+import api.encoding as encoding
+import api.index as index
+
+STAGES = ("decode", "color", "detection", "facemesh", "analyzers", "encode")
+
+
+class TimedModel:
+    """Wraps a MediaPipe solution and adds the time of each process() call to a stage."""
+
+    def __init__(self, model, timings, stage):
+        self.model = model
+        self.timings = timings
+        self.stage = stage
+
+    def process(self, image):
+        start = time.perf_counter()
+        try:
+            return self.model.process(image)
+        finally:
+            self.timings[self.stage] += time.perf_counter() - start
+
+
+def synthetic_frames(face_path, count, width, height):
+    """Yield (name, JPEG bytes) frames of a face image drifting over a plain background."""
+    face = cv2.imread(face_path)
+    if face is None:
+        raise SystemExit(f"Cannot read {face_path}")
+    scale = min(2.0, height * 0.75 / face.shape[0])
+    face = cv2.resize(face, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    fh, fw = face.shape[:2]
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        frame = np.full((height, width, 3), 90, np.uint8)
+        x = int((width - fw) / 2 + np.sin(i / 40) * (width - fw) / 4)
+        y = int((height - fh) / 2 + np.cos(i / 55) * (height - fh) / 8)
+        frame[y:y + fh, x:x + fw] = face
+        noise = rng.normal(0, 2, frame.shape)
+        frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        yield f"synthetic_{i:05d}.jpg", cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def encode_json(data):
+    return encoding.FastJSONResponse(data).body
+
+
+def encode_msgpack(data):
+    return encoding.msgpack.packb(data)
+
+
+def replay(frames, fps, encode=encode_json):
+    """Run every frame through one session; returns per-frame results and per-frame stage times (ms)."""
+    tracker = index.SessionTracker("benchmark")
+    results = []
+    stage_times = {stage: [] for stage in STAGES}
+    try:
+        face_mesh = TimedModel(tracker.face_mesh, {}, "facemesh")
+        face_detection = TimedModel(tracker.face_detection, {}, "detection")
+        for i, (_, jpeg) in enumerate(frames):
+            frame_data = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+            timings = dict.fromkeys(STAGES, 0.0)
+            face_mesh.timings = face_detection.timings = timings
+
+            start = time.perf_counter()
+            frame = index.decode_frame(frame_data)
+            timings["decode"] = time.perf_counter() - start
+
+            with tracker.lock:
+                analysis = index.FrameAnalysis(
+                    frame, face_mesh=face_mesh, roi=tracker.roi, face_detection=face_detection,
+                    timestamp=i / fps, keyframes=tracker.landmark_tracker,
+                )
+                start = time.perf_counter()
+                analysis.gray
+                timings["color"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                result = index.analyze_frame(tracker, analysis, index.ANALYZERS)
+                # Model time is measured separately; the rest is cropping, gating and analyzer math
+                timings["analyzers"] = time.perf_counter() - start - timings["facemesh"] - timings["detection"]
+
+            start = time.perf_counter()
+            encode(result)
+            timings["encode"] = time.perf_counter() - start
+
+            results.append(result)
+            for stage, seconds in timings.items():
+                stage_times[stage].append(seconds * 1000)
+    finally:
+        tracker.close()
+    return results, stage_times
+
+
+def check_labels(names, results, labels, args):
+    """Compare results with ground-truth labels; returns True if within the limits."""
+    blink_truth, blink_found = [], []
+    direction_total = direction_correct = 0
+    for name, result in zip(names, results):
+        row = labels.get(name)
+        if row is None:
+            continue
+        if row.get("blink"):
+            blink_truth.append(row["blink"] == "1")
+            blink_found.append(result["is_blinking"])
+        if row.get("direction"):
+            direction_total += 1
+            direction_correct += result["direction"] == row["direction"]
+
+    ok = True
+    if blink_truth:
+        expected, found = len(blink_onsets(blink_truth)), len(blink_onsets(blink_found))
+        print(f"blinks:                {found} (labeled {expected})")
+        ok &= abs(found - expected) <= args.max_blink_error
+    if direction_total:
+        accuracy = direction_correct / direction_total
+        print(f"direction accuracy:    {accuracy:.1%} over {direction_total} frames")
+        ok &= accuracy >= args.min_direction_accuracy
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", nargs="?", help="Directory of recorded JPEG frames")
+    parser.add_argument("--fps", type=float, default=30, help="Capture rate of the recording")
+    parser.add_argument("--synthetic", metavar="FACE", help="Generate frames from a face image instead")
+    parser.add_argument("--frames", dest="count", type=int, default=300, help="Synthetic frame count")
+    parser.add_argument("--size", default="1280x720", help="Synthetic frame size")
+    parser.add_argument("--max-blink-error", type=int, default=0, help="Allowed blink count difference")
+    parser.add_argument("--min-direction-accuracy", type=float, default=0.9, help="Required share of correct directions")
+    parser.add_argument("--msgpack", action="store_true", help="Encode responses as MessagePack instead of JSON")
+    args = parser.parse_args()
+    if bool(args.frames) == bool(args.synthetic):
+        parser.error("give either a frames directory or --synthetic")
+
+    if args.synthetic:
+        width, height = (int(v) for v in args.size.split("x"))
+        frames = list(synthetic_frames(args.synthetic, args.count, width, height))
+        labels = None
+    else:
+        frames = list(read_frames(args.frames))
+        labels = read_labels(args.frames)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    if args.msgpack and encoding.msgpack is None:
+        parser.error("--msgpack needs the msgpack package")
+    results, stage_times = replay(frames, args.fps, encode_msgpack if args.msgpack else encode_json)
+    cpu_time, wall_time = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    totals = np.sum([stage_times[stage] for stage in STAGES], axis=0)
+    print(f"frames:                {len(frames)} ({sum(r['face_detected'] for r in results)} with a face)")
+    print(f"{'stage':<12}{'mean':>9}{'p50':>9}{'p99':>9}  (ms)")
+    for stage, times in [*stage_times.items(), ("total", totals)]:
+        print(f"{stage:<12}{np.mean(times):>9.2f}{np.percentile(times, 50):>9.2f}{np.percentile(times, 99):>9.2f}")
+    print(f"frames/s:              {len(frames) / wall_time:.1f} ({os.cpu_count()} cores)")
+    print(f"frames/s per core:     {len(frames) / cpu_time:.1f}")
+    # ru_maxrss is in kilobytes on Linux
+    print(f"peak RSS:              {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    if labels is None:
+        return 0
+    ok = check_labels([name for name, _ in frames], results, labels, args)
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Regression check for ROI cropping: replays a recording through the analyzers
+with and without ROI preprocessing and compares the results.
+
+    python -m benchmarks.roi_accuracy path/to/frames [--max-landmark-error 2.0]
+
+Exits non-zero when the mean landmark error (in frame pixels) on the
+landmarks the analyzers use, or the mean EAR difference, exceeds its limit.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.frames import read_frames
+import api.index as index
+import api.motion as motion
+
+# Landmarks read by detect_blink, detect_eye_direction and check_distance
+ANALYZER_LANDMARKS = [
+    362, 385, 387, 373, 380, 374,  # Left eye (EAR)
+    33, 160, 158, 133, 153, 144,  # Right eye (EAR)
+    263, 468, 473,  # Remaining eye corner and iris centers
+    10, 4,  # Forehead and nose tip
+]
+
+
+def replay(frames, roi_enabled, fps):
+    """Run every frame through a fresh session; returns per-frame results, landmarks and total time."""
+    index.ROI_ENABLED = roi_enabled
+    motion.MOTION_GATING = False  # Compare FaceMesh output on every frame
+    tracker = index.SessionTracker(f"roi-{roi_enabled}")
+    results, landmarks = [], []
+    elapsed = 0.0
+    try:
+        for i, (_, jpeg) in enumerate(frames):
+            frame = index.cv2.imdecode(np.frombuffer(jpeg, np.uint8), index.cv2.IMREAD_COLOR)
+            start = time.perf_counter()
+            analysis = index.FrameAnalysis(
+                frame, face_mesh=tracker.face_mesh, roi=tracker.roi, face_detection=tracker.face_detection,
+                timestamp=i / fps,
+            )
+            result = index.analyze_frame(tracker, analysis, ("direction", "blink", "distance"))
+            elapsed += time.perf_counter() - start
+            results.append(result)
+            points = analysis.landmarks
+            landmarks.append(None if points is None else points[ANALYZER_LANDMARKS, :2])
+    finally:
+        tracker.close()
+    return results, landmarks, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    parser.add_argument("--fps", type=float, default=30, help="Capture rate of the recording")
+    parser.add_argument("--max-landmark-error", type=float, default=2.0, help="Mean landmark error limit in pixels")
+    parser.add_argument("--max-ear-error", type=float, default=0.02, help="Mean EAR difference limit")
+    args = parser.parse_args()
+
+    frames = list(read_frames(args.frames))
+    full, full_landmarks, full_time = replay(frames, roi_enabled=False, fps=args.fps)
+    roi, roi_landmarks, roi_time = replay(frames, roi_enabled=True, fps=args.fps)
+
+    landmark_errors, ear_errors = [], []
+    direction_agree = detected_both = detection_mismatch = 0
+    for a, b, la, lb in zip(full, roi, full_landmarks, roi_landmarks):
+        if la is None or lb is None:
+            detection_mismatch += (la is None) != (lb is None)
+            continue
+        detected_both += 1
+        landmark_errors.append(np.linalg.norm(la - lb, axis=1).mean())
+        ear_errors.append(abs(a["ear"] - b["ear"]))
+        direction_agree += a["direction"] == b["direction"]
+
+    print(f"frames:                {len(frames)}")
+    print(f"face in both modes:    {detected_both} (detection mismatches: {detection_mismatch})")
+    print(f"full frame time:       {full_time * 1000 / len(frames):.2f} ms/frame")
+    print(f"roi time:              {roi_time * 1000 / len(frames):.2f} ms/frame")
+    if not detected_both:
+        print("No face detected; nothing to compare")
+        return 1
+
+    mean_landmark_error = float(np.mean(landmark_errors))
+    mean_ear_error = float(np.mean(ear_errors))
+    print(f"landmark error (px):   mean {mean_landmark_error:.3f}, max {np.max(landmark_errors):.3f}")
+    print(f"EAR difference:        mean {mean_ear_error:.4f}, max {np.max(ear_errors):.4f}")
+    print(f"direction agreement:   {direction_agree / detected_both:.1%}")
+
+    failed = mean_landmark_error > args.max_landmark_error or mean_ear_error > args.max_ear_error
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Throughput and latency of the inference scheduler with many sessions.
+
+    python -m benchmarks.scheduler path/to/frames [--sessions 1,2,4,8,16] [--rate 10] [--duration 5]
+
+Each simulated session sends the recorded frames as raw JPEG bodies at a
+fixed rate through InferenceExecutor.submit and run_analysis, like the
+per-frame endpoints do, with its own SessionTracker. For every session
+count the script prints completed frames/s, p50/p99 latency from send to
+result, and the share of frames dropped, so the curve shows where the
+server saturates.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.frames import read_frames
+from api.inference import InferenceExecutor, FrameDropped
+import api.index as index
+
+async def client(executor, tracker, frames, rate, duration, latencies, outcomes):
+    """Send frames for one session at a fixed rate, recording latency and outcome."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    i = 0
+    while loop.time() - start < duration:
+        _, jpeg = frames[i % len(frames)]
+        sent = time.perf_counter()
+        try:
+            await executor.submit(
+                tracker.session_id, index.run_analysis, tracker, index.RawFrame(jpeg), index.ANALYZERS, sent,
+            )
+            latencies.append((time.perf_counter() - sent) * 1000)
+            outcomes["completed"] += 1
+        except FrameDropped:
+            outcomes["dropped"] += 1
+        i += 1
+        # Keep the send rate fixed: a slow frame does not delay the next one's schedule
+        await asyncio.sleep(max(0.0, start + i / rate - loop.time()))
+
+
+async def run(frames, sessions, rate, duration):
+    executor = InferenceExecutor()
+    trackers = [index.SessionTracker(f"benchmark-{n}") for n in range(sessions)]
+    latencies, outcomes = [], {"completed": 0, "dropped": 0}
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client(executor, tracker, frames, rate, duration, latencies, outcomes) for tracker in trackers
+        ])
+        elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown()
+        for tracker in trackers:
+            tracker.close()
+    return {
+        "fps": outcomes["completed"] / elapsed,
+        "p50": np.percentile(latencies, 50) if latencies else float("nan"),
+        "p99": np.percentile(latencies, 99) if latencies else float("nan"),
+        "dropped": outcomes["dropped"] / max(1, outcomes["completed"] + outcomes["dropped"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory of recorded JPEG frames")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Comma-separated session counts")
+    parser.add_argument("--rate", type=float, default=10, help="Frames/s sent by each session")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per run")
+    args = parser.parse_args()
+
+    frames = list(read_frames(args.frames))
+    print(f"frames: {len(frames)}, {args.rate:g} frames/s per session, {args.duration:g} s per run")
+    print(f"{'sessions':>9}{'sent/s':>8}{'done/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'dropped':>9}")
+    for sessions in (int(n) for n in args.sessions.split(",")):
+        result = asyncio.run(run(frames, sessions, args.rate, args.duration))
+        print(
+            f"{sessions:>9}{sessions * args.rate:>8.0f}{result['fps']:>8.1f}"
+            f"{result['p50']:>9.1f}{result['p99']:>9.1f}{result['dropped']:>9.1%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Cold-start time of the API: import, startup and the first frame.
+
+    python -m benchmarks.startup face.jpg [--repeat 3]
+
+Every run starts a fresh interpreter, like a scale-to-zero instance,
+imports api.index, runs the app's startup and posts one JPEG frame to
+/api/py/analyze-frame. The "lazy" runs post the frame right after
+startup, so it pays for importing MediaPipe and building the models;
+the "warmed" runs call /api/py/warmup first, as a deploy hook or
+scheduled ping would. Prints the median of each phase in milliseconds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+MODES = ("lazy", "warmed")
+PHASES = ("import", "startup", "warmup", "first_frame", "second_frame")
+
+
+async def child(mode, face_path):
+    """Measure one cold start in this (fresh) interpreter; prints the phase times as JSON."""
+    times = {}
+    start = time.perf_counter()
+    import httpx
+    import api.index as index
+    times["import"] = time.perf_counter() - start
+
+    with open(face_path, "rb") as f:
+        jpeg = f.read()
+    start = time.perf_counter()
+    async with index.app.router.lifespan_context(index.app):
+        times["startup"] = time.perf_counter() - start
+        transport = httpx.ASGITransport(app=index.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            start = time.perf_counter()
+            if mode == "warmed":
+                (await client.post("/api/py/warmup")).raise_for_status()
+            times["warmup"] = time.perf_counter() - start
+            for phase in ("first_frame", "second_frame"):
+                start = time.perf_counter()
+                response = await client.post(
+                    "/api/py/analyze-frame", content=jpeg, headers={"content-type": "image/jpeg"},
+                )
+                times[phase] = time.perf_counter() - start
+                if "error" in response.json():
+                    raise SystemExit(response.text)
+    print(json.dumps(times))
+
+
+def run(mode, face_path):
+    with tempfile.TemporaryDirectory() as log_dir:
+        # No background warmup: each mode decides when the models are built
+        env = {**os.environ, "MODEL_WARMUP": "0", "EVENT_LOG_DIR": log_dir}
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", mode, face_path],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("face", help="JPEG image with a face, posted as the first frames")
+    parser.add_argument("--repeat", type=int, default=3, help="Cold starts per mode")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.child, args.face))
+        return 0
+
+    print(f"{'mode':<8}" + "".join(f"{phase:>14}" for phase in PHASES) + "  (ms, median)")
+    for mode in MODES:
+        runs = [run(mode, args.face) for _ in range(args.repeat)]
+        medians = {phase: np.median([r[phase] for r in runs]) * 1000 for phase in PHASES}
+        print(f"{mode:<8}" + "".join(f"{medians[phase]:>14.0f}" for phase in PHASES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+# Tests must not write event logs or send notifications
+os.environ.setdefault("EVENT_LOG_DIR", "")
+os.environ.setdefault("NOTIFICATION_BACKEND", "none")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client of the app. Its lifespan shuts the inference pool down, so all tests share one."""
+    from fastapi.testclient import TestClient
+
+    import api.index as index
+
+    with TestClient(index.app) as client:
+        yield client
@@ -0,0 +1,53 @@
+"""Frame timestamps of the batch reprocessing CLI."""
+import cv2
+import numpy as np
+import pytest
+
+import api.index as index
+from api.batch import analyze_chunks, measure_chunk
+
+FPS = 10.0
+DARK_FROM = 20  # First dark frame
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    """40 frames: bright, then dark from DARK_FROM on."""
+    path = str(tmp_path_factory.mktemp("video") / "light.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (64, 48))
+    for i in range(40):
+        writer.write(np.full((48, 64, 3), 200 if i < DARK_FROM else 5, np.uint8))
+    writer.release()
+    return path
+
+
+def light_changes(chunks):
+    tracker = index.SessionTracker("batch-test")
+    try:
+        frames, end = analyze_chunks(tracker, chunks, FPS, 100.0)
+        return frames, end, [(change["ambient_light"], change["timestamp"]) for change in tracker.light_events.records()]
+    finally:
+        tracker.close()
+
+
+def test_chunks_report_frame_indices(video):
+    measurements = measure_chunk((video, 25, 35, FPS))
+    assert [m[0] for m in measurements] == list(range(25, 35))
+
+
+def test_short_chunk_does_not_shift_later_frames(video):
+    first, second = measure_chunk((video, 0, 20, FPS)), measure_chunk((video, 20, None, FPS))
+    frames, end, full = light_changes([first, second])
+    assert (frames, end) == (40, 40)
+    assert full[-1] == ("dark", pytest.approx(100.0 + DARK_FROM / FPS))
+
+    # The first chunk stops reading 5 frames early
+    frames, end, short = light_changes([first[:-5], second])
+    assert (frames, end) == (35, 40)
+    assert short == full
+
+
+def test_overlapping_chunks_are_measured_once(video):
+    # A seek that lands 3 frames early repeats the end of the previous chunk
+    frames, end, _ = light_changes([measure_chunk((video, 0, 20, FPS)), measure_chunk((video, 17, None, FPS))])
+    assert (frames, end) == (40, 40)
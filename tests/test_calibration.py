@@ -0,0 +1,27 @@
+"""Request validation of /api/py/calibrate-distance."""
+import pytest
+
+
+@pytest.mark.parametrize("body", [
+    {"distance_cm": "arm's length"},
+    {"samples": "many"},
+    {"samples": [5]},
+    {"distance_cm": None},
+    {"distance_cm": 5},
+    {"samples": 0},
+    ["not", "an", "object"],
+])
+def test_invalid_calibration_requests_get_400(client, body):
+    assert client.post("/api/py/calibrate-distance", json=body).status_code == 400
+
+
+def test_malformed_json_gets_400(client):
+    response = client.post("/api/py/calibrate-distance", content=b"{", headers={"content-type": "application/json"})
+    assert response.status_code == 400
+
+
+def test_calibration_starts_and_reports_progress(client):
+    response = client.post("/api/py/calibrate-distance", json={"userId": "calibration-test", "distance_cm": 60, "samples": 3})
+    assert response.json() == {"status": "calibrating", "distance_cm": 60.0, "samples": 0, "needed": 3}
+    assert client.get("/api/py/calibrate-distance", params={"userId": "calibration-test"}).json()["status"] == "calibrating"
+    assert client.get("/api/py/calibrate-distance", params={"userId": "uncalibrated-test"}).json()["status"] == "uncalibrated"
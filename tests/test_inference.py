@@ -0,0 +1,115 @@
+"""Scheduling of the inference executor: drop-oldest slots, per-session ordering and shedding."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.inference import InferenceExecutor, FrameDropped
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def outcome(executor, session_id, fn, *args, kind=None):
+    try:
+        return await executor.submit(session_id, fn, *args, kind=kind)
+    except FrameDropped:
+        return "dropped"
+
+
+def test_frequent_frames_do_not_starve_other_kinds():
+    async def main():
+        executor = InferenceExecutor(workers=1)
+        try:
+            def work(name):
+                time.sleep(0.08)
+                return name
+
+            tasks = []
+            for i in range(30):  # Blink every 50 ms, distance every 500 ms
+                tasks.append(asyncio.create_task(outcome(executor, "s", work, "blink", kind=("blink",))))
+                if i % 10 == 0:
+                    tasks.append(asyncio.create_task(outcome(executor, "s", work, "distance", kind=("distance",))))
+                await asyncio.sleep(0.05)
+            return await asyncio.gather(*tasks)
+        finally:
+            executor.shutdown()
+
+    results = run(main())
+    assert results.count("distance") == 3
+    assert "dropped" in results  # Stale blink frames were replaced
+
+
+def test_frames_of_one_session_never_overlap():
+    async def main():
+        executor = InferenceExecutor(workers=4)
+        active, overlaps = set(), []
+        lock = threading.Lock()
+
+        def work(session_id):
+            with lock:
+                overlaps.append(session_id in active)
+                active.add(session_id)
+            time.sleep(0.01)
+            with lock:
+                active.discard(session_id)
+
+        try:
+            await asyncio.gather(*[
+                outcome(executor, f"s{n % 2}", work, f"s{n % 2}", kind=n) for n in range(12)
+            ])
+        finally:
+            executor.shutdown()
+        return overlaps
+
+    assert not any(run(main()))
+
+
+def test_each_frame_resolves_when_it_finishes():
+    async def main():
+        executor = InferenceExecutor(workers=2)
+        try:
+            start = time.perf_counter()
+
+            async def timed(session_id, seconds):
+                await executor.submit(session_id, time.sleep, seconds)
+                return time.perf_counter() - start
+
+            return await asyncio.gather(timed("fast", 0.01), timed("slow", 0.3))
+        finally:
+            executor.shutdown()
+
+    fast, slow = run(main())
+    assert fast < 0.15 < slow
+
+
+def test_expired_frames_are_dropped():
+    async def main():
+        executor = InferenceExecutor(workers=1, max_wait=0.05)
+        try:
+            return await asyncio.gather(
+                outcome(executor, "a", time.sleep, 0.2), outcome(executor, "b", time.sleep, 0),
+            ), executor.stats()
+        finally:
+            executor.shutdown()
+
+    results, stats = run(main())
+    assert results[1] == "dropped" and stats["dropped_expired"] == 1
+
+
+def test_failures_reach_the_caller():
+    def fail():
+        raise ValueError("bad frame")
+
+    async def main():
+        executor = InferenceExecutor(workers=1)
+        try:
+            with pytest.raises(ValueError):
+                await executor.submit("s", fail)
+            return executor.stats()
+        finally:
+            executor.shutdown()
+
+    assert run(main())["failed"] == 1
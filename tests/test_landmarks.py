@@ -0,0 +1,53 @@
+"""Eye landmark layouts: pupil ratios and eye boxes must treat both eyes alike."""
+import numpy as np
+import pytest
+
+import api.index as index
+from api.landmarks import NUM_LANDMARKS, EYE_INDICES, PUPIL_INDICES, pupil_ratios
+from api.motion import eye_boxes
+
+# (first corner, second corner, iris center) of each eye as laid out by MediaPipe in an
+# unmirrored frame: the subject's right eye is on the image's left
+LEFT_EYE = (362, 263, 473)
+RIGHT_EYE = (33, 133, 468)
+EYE_SPANS = {LEFT_EYE: (340.0, 400.0), RIGHT_EYE: (200.0, 260.0)}
+
+
+def face(iris_position):
+    """Landmarks with the iris centers at iris_position (0 to 1) between each eye's corners."""
+    points = np.zeros((NUM_LANDMARKS, 3), np.float32)
+    for (first, second, iris), (x0, x1) in EYE_SPANS.items():
+        points[first, :2] = (x0, 200)
+        points[second, :2] = (x1, 200)
+        points[iris, :2] = (x0 + (x1 - x0) * iris_position, 200)
+    # EAR contour points around each eye, between its corners
+    for row, (x0, x1) in zip(EYE_INDICES, (EYE_SPANS[LEFT_EYE], EYE_SPANS[RIGHT_EYE])):
+        for i, index_ in enumerate(row):
+            if not points[index_].any():
+                points[index_, :2] = (x0 + (x1 - x0) * (i % 3 + 1) / 4, 195 + 10 * (i // 3))
+    return points
+
+
+def test_pupil_rows_follow_eye_rows():
+    assert tuple(PUPIL_INDICES[0]) == LEFT_EYE and tuple(PUPIL_INDICES[1]) == RIGHT_EYE
+    assert 362 in EYE_INDICES[0] and 33 in EYE_INDICES[1]
+
+
+@pytest.mark.parametrize("position", [0.2, 0.5, 0.8])
+def test_both_eyes_give_the_same_ratio(position):
+    ratios = pupil_ratios(face(position))
+    np.testing.assert_allclose(ratios[:, 0], [position, position], atol=1e-5)
+
+
+@pytest.mark.parametrize("position, direction", [(0.3, "right"), (0.5, "center"), (0.7, "left")])
+def test_direction_thresholds(position, direction):
+    tracker = index.SessionTracker("test-direction")
+    try:
+        assert index.detect_eye_direction(tracker, face(position), 0.0) == direction
+    finally:
+        tracker.close()
+
+
+def test_eye_boxes_cover_one_eye_each():
+    left, right = eye_boxes(face(0.5), 640, 480)
+    assert left[0] > 300 and right[2] < 300
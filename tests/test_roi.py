@@ -0,0 +1,87 @@
+"""ROI cropping must hand the analyzers the same landmarks as a full-frame FaceMesh pass."""
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import api.index as index
+from api.landmarks import NUM_LANDMARKS
+
+# Marker centers (x, y) in frame pixels, with distinct x so they sort the same in any crop
+MARKERS = np.array([[250.0, 200.0], [300.0, 260.0], [350.0, 210.0]])
+
+
+class MarkerFaceMesh:
+    """Stands in for FaceMesh: landmark i sits on marker i % 3, found by its centroid in the image given."""
+
+    def process(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY).astype(np.float64)
+        count, labels = cv2.connectedComponents((gray > 64).astype(np.uint8))
+        centers = []
+        for label in range(1, count):
+            ys, xs = np.nonzero(labels == label)
+            weights = gray[ys, xs]
+            centers.append((np.average(xs, weights=weights), np.average(ys, weights=weights)))
+        if len(centers) != len(MARKERS):
+            return SimpleNamespace(multi_face_landmarks=None)
+        centers.sort()
+        h, w = gray.shape
+        points = [
+            SimpleNamespace(x=x / w, y=y / h, z=0.0)
+            for x, y in (centers[i % len(centers)] for i in range(NUM_LANDMARKS))
+        ]
+        return SimpleNamespace(multi_face_landmarks=[SimpleNamespace(landmark=points)])
+
+
+def marker_frame(offset=(0, 0), size=(640, 480)):
+    frame = np.zeros((size[1], size[0], 3), np.uint8)
+    for x, y in MARKERS + offset:
+        cv2.circle(frame, (int(x), int(y)), 6, (255, 255, 255), -1, lineType=cv2.LINE_AA)
+    return frame
+
+
+def expected_landmarks(offset=(0, 0)):
+    return (MARKERS + offset)[np.arange(NUM_LANDMARKS) % len(MARKERS)]
+
+
+def landmarks_of(frame, roi_enabled, roi, monkeypatch):
+    monkeypatch.setattr(index, "ROI_ENABLED", roi_enabled)
+    analysis = index.FrameAnalysis(frame, face_mesh=MarkerFaceMesh(), roi=roi, timestamp=0.0)
+    return analysis.landmarks, analysis.roi
+
+
+def test_roi_landmarks_match_full_frame(monkeypatch):
+    frame = marker_frame()
+    full, _ = landmarks_of(frame, False, None, monkeypatch)
+    assert full is not None
+    np.testing.assert_allclose(full[:, :2], expected_landmarks(), atol=0.5)
+
+    # A crop around the markers, smaller than the frame and resampled to ROI_TARGET_SIZE
+    cropped, _ = landmarks_of(frame, True, (300.0, 230.0, 180.0), monkeypatch)
+    assert cropped is not None
+    assert np.abs(cropped[:, :2] - full[:, :2]).max() < 1.0
+
+
+@pytest.mark.parametrize("roi", [
+    (300.0, 230.0, 400.0),  # Crop larger than the face: downscaled
+    (320.0, 240.0, 700.0),  # Crop past the frame edges: padded
+])
+def test_roi_mapping_to_frame_pixels(roi, monkeypatch):
+    landmarks, _ = landmarks_of(marker_frame(), True, roi, monkeypatch)
+    assert landmarks is not None
+    np.testing.assert_allclose(landmarks[:, :2], expected_landmarks(), atol=1.5)
+
+
+def test_roi_follows_face_near_frame_edge(monkeypatch):
+    offset = (-230, -180)  # Markers near the top left corner
+    frame = marker_frame(offset)
+    landmarks, next_roi = landmarks_of(frame, True, (70.0, 50.0, 200.0), monkeypatch)
+    assert landmarks is not None
+    np.testing.assert_allclose(landmarks[:, :2], expected_landmarks(offset), atol=1.0)
+
+    # The next frame's crop is centered on the landmarks and padded by ROI_MARGIN
+    cx, cy, size = next_roi
+    low, high = landmarks[:, :2].min(axis=0), landmarks[:, :2].max(axis=0)
+    assert (cx, cy) == pytest.approx(tuple((low + high) / 2))
+    assert size == pytest.approx(float((high - low).max()) * (1 + 2 * index.ROI_MARGIN))
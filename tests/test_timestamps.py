@@ -0,0 +1,64 @@
+"""Client capture times must not be able to corrupt a session's state."""
+import base64
+import time
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import api.index as index
+
+
+def jpeg_data_url(level=128):
+    image = np.full((120, 160, 3), level, np.uint8)
+    return "data:image/jpeg;base64," + base64.b64encode(cv2.imencode(".jpg", image)[1]).decode()
+
+
+@pytest.mark.parametrize("timestamp", ["nan", "NaN", "inf", "-inf", float("inf"), "soon", [1]])
+def test_invalid_timestamps_are_rejected(timestamp):
+    with pytest.raises(HTTPException) as error:
+        index.frame_timestamp({"timestamp": timestamp})
+    assert error.value.status_code == 400
+
+
+def test_timestamps_far_from_the_clock_use_the_arrival_time():
+    now = time.time()
+    assert index.frame_timestamp({"timestamp": now - 1}) == pytest.approx(now - 1)
+    assert index.frame_timestamp({"timestamp": now + 10 * 365 * 86400}) is None
+    assert index.frame_timestamp({"timestamp": 0}) is None
+    assert index.frame_timestamp({}) is None
+
+
+@pytest.mark.parametrize("timestamp", ["nan", "inf"])
+def test_non_finite_frame_is_rejected_without_touching_the_session(client, timestamp):
+    user_id = f"{timestamp}-test"
+    response = client.post(
+        "/api/py/detect-ambient-light", json={"frame": jpeg_data_url(), "userId": user_id, "timestamp": timestamp}
+    )
+    assert response.status_code == 400
+    tracker = index.sessions.get(user_id)
+    assert tracker.amb_light_data["timestamp"] is None
+
+    response = client.post("/api/py/detect-ambient-light", json={"frame": jpeg_data_url(), "userId": user_id})
+    assert response.status_code == 200 and response.json()["amb_light"] == "light"
+
+
+def test_far_future_frame_does_not_stall_later_frames(client):
+    future = time.time() + 10 * 365 * 86400
+    first = client.post(
+        "/api/py/detect-ambient-light", json={"frame": jpeg_data_url(), "userId": "future-test", "timestamp": future}
+    ).json()
+    assert abs(first["timestamp"] - time.time()) < 60
+
+    # Later frames with real capture times still change the state
+    now = time.time()
+    changes = []
+    for i in range(3):
+        response = client.post(
+            "/api/py/detect-ambient-light",
+            json={"frame": jpeg_data_url(5), "userId": "future-test", "timestamp": now + 0.1 * i},
+        ).json()
+        changes += [change["ambient_light"] for change in response["state_changes"]]
+    assert response["amb_light"] == "dark"
+    assert changes == ["dark"]